@@ -0,0 +1,17 @@
+"""
+ASGI config for tms project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Tile views are async when settings.TMS_ASYNC_VIEWS is True (Django >= 3.1).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tms.settings')
+
+application = get_asgi_application()
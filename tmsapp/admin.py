@@ -4,6 +4,46 @@
 from django.contrib   import admin
 from .models          import *
 from django.contrib import messages
+from .utils.progress  import format_progress, format_stages
+
+
+
+# Tiling progress
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingProgressAdmin(object):
+
+    """ Progress of the last tiling job of a layer : tiles, tiles/s & ETA in the list, seconds by stage in the form """
+
+    readonly_fields = ( 'tiling_progress', 'tiling_zooms', 'tiling_stages' )
+    actions         = [ 'resume_tiling' ]
+
+    def resume_tiling(self, request, queryset):
+
+        # tiling goes on from the units written by the stopped tiling
+        for layer in queryset:
+            TilingJob.submit( self.tiling_kind, layer.pk, resume=True )
+
+    def tiling_progress(self, obj):
+        return format_progress( obj.get_progress() )
+
+    def tiling_zooms(self, obj):
+
+        report = obj.get_progress()
+
+        if report is None:
+            return '-'
+
+        return ', '.join( '%s : %d / %d' % (zoom, value[ 'tiles' ], value[ 'total' ])
+                          for zoom, value in report[ 'zooms' ].items() )
+
+    def tiling_stages(self, obj):
+        return format_stages( obj.get_progress() )
+
+    tiling_progress.short_description = 'Tiling'
+    tiling_zooms.short_description    = 'Tiles by zoom'
+    tiling_stages.short_description   = 'Seconds by stage'
+    resume_tiling.short_description   = 'Resume tiling of selected layers'
 
 
 
@@ -11,7 +51,11 @@ from django.contrib import messages
 #-----------------------------------------------------------------------------------------------------------------------
 
 @admin.register(RasterLayer)
-class RasterLayerAdmin(admin.ModelAdmin):
+class RasterLayerAdmin(TilingProgressAdmin, admin.ModelAdmin):
+
+    tiling_kind     = 'raster'
+
+    readonly_fields = TilingProgressAdmin.readonly_fields + ( 'band_stats', )
 
     list_display = (
         'rasterlayer_name',
@@ -19,9 +63,26 @@ class RasterLayerAdmin(admin.ModelAdmin):
         'rasterlayer_minz',
         'rasterlayer_maxz',
         'rasterlayer_crea',
-        'rasterlayer_available'
+        'rasterlayer_storage',
+        'rasterlayer_packed',
+        'rasterlayer_available',
+        'tiling_progress'
     )
 
+    def band_stats(self, obj):
+
+        stats = obj.get_stats()
+
+        if stats is None:
+            return '-'
+
+        return ' | '.join( '%d : no data' % (i + 1) if band is None else
+                           '%d : min %g, max %g, mean %.6g, std %.6g' % (i + 1, band[ 'min' ], band[ 'max' ],
+                                                                         band[ 'mean' ], band[ 'std' ])
+                           for i, band in enumerate( stats[ 'bands' ] ) )
+
+    band_stats.short_description = 'Band statistics'
+
     def save_model(self, request, obj, form, change):
 
         try:
@@ -42,7 +103,9 @@ class RasterLayerAdmin(admin.ModelAdmin):
 #-----------------------------------------------------------------------------------------------------------------------
 
 @admin.register(ImageLayer)
-class ImageLayerAdmin(admin.ModelAdmin):
+class ImageLayerAdmin(TilingProgressAdmin, admin.ModelAdmin):
+
+    tiling_kind  = 'image'
 
     list_display = (
         'imagelayer_name',
@@ -50,7 +113,10 @@ class ImageLayerAdmin(admin.ModelAdmin):
         'imagelayer_minz',
         'imagelayer_maxz',
         'imagelayer_crea',
-        'imagelayer_available'
+        'imagelayer_storage',
+        'imagelayer_packed',
+        'imagelayer_available',
+        'tiling_progress'
     )
 
 
@@ -66,4 +132,36 @@ class VectorLayerAdmin(admin.ModelAdmin):
         'vectorlayer_crs',
         'vectorlayer_crea',
         'vectorlayer_available'
-    )
\ No newline at end of file
+    )
+
+
+
+# Tiling Job Admin
+#-----------------------------------------------------------------------------------------------------------------------
+
+@admin.register(TilingJob)
+class TilingJobAdmin(admin.ModelAdmin):
+
+    list_display = (
+        'tilingjob_id',
+        'tilingjob_kind',
+        'tilingjob_layer',
+        'tilingjob_state',
+        'tilingjob_attempts',
+        'tilingjob_worker',
+        'tilingjob_heartbeat',
+        'tilingjob_crea',
+        'tilingjob_end'
+    )
+
+    list_filter = ( 'tilingjob_state', 'tilingjob_kind' )
+    actions     = [ 'cancel_jobs' ]
+
+    def cancel_jobs(self, request, queryset):
+
+        # queued jobs at once, running jobs by their worker
+        for job in queryset.filter( tilingjob_state__in=[ 'queued', 'running' ] ):
+            TilingJob.cancel( job.tilingjob_kind, job.tilingjob_layer )
+
+    cancel_jobs.short_description = 'Cancel selected jobs'
+
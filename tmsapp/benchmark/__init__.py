@@ -0,0 +1,2 @@
+from .synthetic import make_synthetic_raster
+from .runner    import KINDS, WRITERS, run_benchmark, save_result, load_results
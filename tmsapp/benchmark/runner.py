@@ -0,0 +1,335 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.test.utils     import override_settings
+from   tmsapp.constant       import *
+from   tmsapp.models         import ImageLayer, RasterLayer
+from   tmsapp.utils          import make_imagetiles, make_rastertiles, reprojected_raster, get_workers, get_metatile
+from   tmsapp.utils          import __bands_to_png__, __make_imagetile_from_bands__
+from   tmsapp.utils.storage  import FileSystemStorage, SQLiteStorage
+from   tmsapp.utils.sink     import TileSink
+from   tmsapp.utils.progress import TilingProgress
+from   .synthetic            import make_synthetic_raster
+from   rasterio.windows      import Window
+import multiprocessing       as     mp
+import rasterio              as     rio
+import numpy                 as     np
+import subprocess
+import tempfile
+import platform
+import resource
+import datetime
+import shutil
+import json
+import time
+import sys
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# kinds of layer
+KINDS   = ( 'image', 'raster' )
+
+# tile writers : nothing, SQLite (MBTiles backend), files, PostGIS (a temporary layer of the database)
+WRITERS = ( 'none', 'sqlite', 'filesystem', 'postgis' )
+
+# version of the result format
+_FORMAT = 1
+
+# counters are shared with the forked tiling processes
+_CONTEXT = mp.get_context( 'fork' )
+
+
+
+# Utils
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get native zoom of a raster in WEB_MERCATOR_SRID
+def __native_zoom__(path : str) -> int:
+
+    """ First zoom with pixels at least as small as the raster pixels """
+
+    with rio.open(path, 'r') as src_dataset:
+        res = min( abs( src_dataset.res[0] ), abs( src_dataset.res[1] ) )
+
+    return max( 0, int( np.ceil( np.log2( WEB_MERCATOR_WORLD_SIZE / ( WEB_MERCATOR_TILE_SIZE * res ) ) ) ) )
+
+# get peak resident memory
+def __peak_rss__() -> dict():
+
+    """ Peak RSS in Mb of the current process & of its finished children (tiling processes) """
+
+    # ru_maxrss is in Kb, in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+
+    return {
+        'self_mb'     : resource.getrusage( resource.RUSAGE_SELF     ).ru_maxrss * scale / 1024 / 1024,
+        'children_mb' : resource.getrusage( resource.RUSAGE_CHILDREN ).ru_maxrss * scale / 1024 / 1024
+    }
+
+# get git revision of the tree
+def __revision__() -> str:
+
+    try:
+        cwd    = os.path.dirname( os.path.abspath( __file__ ) )
+        output = subprocess.check_output( [ 'git', 'rev-parse', 'HEAD' ], cwd=cwd, stderr=subprocess.DEVNULL )
+
+        return output.decode().strip()
+
+    except Exception:
+        return None
+
+# get host description
+def __host__() -> dict():
+
+    return {
+        'platform'  : platform.platform(),
+        'python'    : platform.python_version(),
+        'cpu_count' : os.cpu_count(),
+        'rasterio'  : rio.__version__,
+        'gdal'      : rio.__gdal_version__
+    }
+
+
+
+# Writers
+#-----------------------------------------------------------------------------------------------------------------------
+
+# count writes of all tiling processes
+class __Counters__(object):
+
+    def __init__(self):
+
+        self.tiles   = _CONTEXT.Value( 'q', 0 )
+        self.bytes   = _CONTEXT.Value( 'q', 0 )
+        self.seconds = _CONTEXT.Value( 'd', 0. )
+
+    def timed(self, write_fun):
+
+        """ Wrap write_fun(tiles), counting tiles, png bytes & time """
+
+        def write(tiles : list()) -> None:
+
+            start = time.perf_counter()
+            write_fun( tiles )
+            seconds = time.perf_counter() - start
+
+            with self.tiles.get_lock():
+                self.tiles.value   += len( tiles )
+                self.bytes.value   += sum( len( tile[-1].getvalue() ) for tile in tiles )
+                self.seconds.value += seconds
+
+        return write
+
+    def reset(self) -> dict():
+
+        """ Get counters & reset them """
+
+        with self.tiles.get_lock():
+
+            values = { 'tiles' : self.tiles.value, 'bytes' : self.bytes.value, 'seconds' : self.seconds.value }
+
+            self.tiles.value, self.bytes.value, self.seconds.value = 0, 0, 0.
+
+        return values
+
+# make write function of a writer
+def __make_writer__(kind : str, writer : str, minz : int, maxz : int, metatile : int) -> (object, object):
+
+    """ Get write_fun(tiles) & cleanup_fun() of a writer, tiles are the ones pushed by make_imagetiles/rastertiles """
+
+    if writer == 'none':
+        return ( lambda tiles: None ), ( lambda: None )
+
+    # png only, the layer id is 0 under a temporary storage root
+    if writer in ( 'sqlite', 'filesystem' ):
+
+        storage = SQLiteStorage( kind ) if writer == 'sqlite' else FileSystemStorage( kind )
+        write   = lambda tiles: storage.put_many(0, [ (*tile[ :3 ], tile[-1].getvalue()) for tile in tiles ])
+
+        return write, ( lambda: storage.delete_layer( 0 ) )
+
+    # the write path of the ingest, in a temporary layer (inserted without save, so without tiling job)
+    model  = ImageLayer if kind == 'image' else RasterLayer
+    prefix = 'imagelayer_' if kind == 'image' else 'rasterlayer_'
+    layer  = model( **{ prefix + 'name' : '__benchmark__', prefix + 'minz' : minz, prefix + 'maxz' : maxz,
+                        prefix + 'storage' : 'postgis', prefix + 'metatile' : metatile } )
+
+    model.objects.bulk_create([ layer ])
+
+    write = layer.__create_imagetiles_batch__ if kind == 'image' else layer.__create_tiles__
+
+    return write, ( lambda: model.objects.filter( pk=layer.pk ).delete() )
+
+
+
+# Stages
+#-----------------------------------------------------------------------------------------------------------------------
+
+def __encode__(kind : str, path : str, samples : int) -> dict():
+
+    """ Encode samples tiles read at the center of path with the encoder of kind. Return report """
+
+    tile_size = WEB_MERCATOR_TILE_SIZE
+
+    with rio.open(path, 'r') as src_dataset:
+
+        window = Window((src_dataset.width - tile_size) // 2, (src_dataset.height - tile_size) // 2, tile_size, tile_size)
+        bands  = src_dataset.read( [ i + 1 for i in range( min( 3, src_dataset.count ) ) ], window=window,
+                                   boundless=True, fill_value=0 )
+        nodata = 0 if src_dataset.nodata is None else src_dataset.nodata
+
+    # missing bands stay empty, like in tiling
+    bands = np.concatenate( [ bands, np.zeros( (3 - len( bands ), tile_size, tile_size), dtype=bands.dtype ) ] )
+    size  = 0
+    start = time.perf_counter()
+
+    for _ in range( samples ):
+
+        if kind == 'image':
+            size += len( __make_imagetile_from_bands__(bands.astype( np.uint8 ), 0, 0, 0)[3].getvalue() )
+        else:
+            size += len( __bands_to_png__(bands, nodata).getvalue() )
+
+    seconds = max( time.perf_counter() - start, 1e-9 )
+
+    return { 'tiles' : samples, 'bytes' : size, 'seconds' : seconds, 'tiles_per_second' : samples / seconds }
+
+def __tile__(kind : str, path : str, minz : int, maxz : int, writer : str, workers : int, metatile : int) -> list():
+
+    """ Tile path zoom by zoom (all zooms from source), writing tiles with writer. Return report by zoom """
+
+    counters        = __Counters__()
+    write, cleanup  = __make_writer__(kind, writer, minz, maxz, metatile)
+    make_fun        = make_imagetiles if kind == 'image' else make_rastertiles
+    zooms           = []
+
+    try:
+
+        for zoom in range(minz, maxz + 1):
+
+            sink     = TileSink( counters.timed( write ) )
+            progress = TilingProgress()
+            start    = time.perf_counter()
+
+            try:
+                tiles = make_fun(path, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, zoom, zoom, sink,
+                                 workers=workers, metatile=metatile, progress=progress)
+
+            finally:
+                sink.close()
+
+            seconds = max( time.perf_counter() - start, 1e-9 )
+            written = counters.reset()
+
+            zooms.append({
+                'zoom'             : zoom,
+                'tiles'            : tiles,
+                'seconds'          : seconds,
+                'tiles_per_second' : tiles / seconds,
+                'bytes'            : written[ 'bytes' ],
+                'write_seconds'    : written[ 'seconds' ],
+                'stages'           : progress.report()[ 'stages' ]
+            })
+
+    finally:
+        cleanup()
+
+    return zooms
+
+
+
+# Benchmark
+#-----------------------------------------------------------------------------------------------------------------------
+
+def run_benchmark(kind : str = 'image', width : int = 4096, height : int = 4096, count : int = 3, dtype : str = 'uint8',
+                  crs : int = 2154, nodata : float = None, minz : int = None, maxz : int = None, writer : str = 'sqlite',
+                  workers : int = None, metatile : int = None, encode_samples : int = 100, workdir : str = None,
+                  keep : bool = False, seed : int = 0) -> dict():
+
+    """
+    Run the ingest stages on a synthetic raster : generation, reprojection to WEB_MERCATOR_SRID, encoding of sample
+    tiles, then tiling of each zoom between minz & maxz (default : the native zoom & the 4 zooms below) with writes.
+    Return a report (stage wall times, tiles/s by zoom, peak RSS), serializable as JSON.
+    """
+
+    assert kind in KINDS and writer in WRITERS
+
+    workers  = get_workers( workers )
+    metatile = get_metatile( metatile )
+    workdir  = tempfile.mkdtemp(prefix='tms-benchmark-', dir=workdir)
+    src      = os.path.join(workdir, 'source.tif')
+    dst      = os.path.join(workdir, 'reprojected.tif')
+    stages   = dict()
+
+    try:
+
+        # generation (not an ingest stage, reported for information)
+        start = time.perf_counter()
+        make_synthetic_raster(src, width, height, count, dtype, crs, nodata=nodata, seed=seed)
+        stages[ 'generate' ] = time.perf_counter() - start
+
+        # reprojection
+        start = time.perf_counter()
+        reprojected_raster(src, dst, dst_crs=WEB_MERCATOR_SRID)
+        stages[ 'reproject' ] = time.perf_counter() - start
+
+        # zooms
+        if maxz is None:
+            maxz = __native_zoom__( dst )
+
+        if minz is None:
+            minz = max( 0, maxz - 4 )
+
+        # encoding alone
+        encode = __encode__(kind, dst, encode_samples)
+        stages[ 'encode' ] = encode[ 'seconds' ]
+
+        # tiling (read, warp, encode & write)
+        with override_settings( TMS_TILE_STORAGE_ROOT=os.path.join(workdir, 'tiles') ):
+            start = time.perf_counter()
+            zooms = __tile__(kind, dst, minz, maxz, writer, workers, metatile)
+            stages[ 'tiling' ] = time.perf_counter() - start
+
+    finally:
+
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    tiles = sum( zoom[ 'tiles' ] for zoom in zooms )
+
+    return {
+        'format'           : _FORMAT,
+        'date'             : datetime.datetime.now( datetime.timezone.utc ).isoformat(),
+        'revision'         : __revision__(),
+        'host'             : __host__(),
+        'config'           : {
+            'kind' : kind, 'width' : width, 'height' : height, 'count' : count, 'dtype' : dtype, 'crs' : crs,
+            'nodata' : nodata, 'minz' : minz, 'maxz' : maxz, 'writer' : writer, 'workers' : workers,
+            'metatile' : metatile, 'seed' : seed
+        },
+        'stages'           : stages,
+        'encode'           : encode,
+        'zooms'            : zooms,
+        'tiles'            : tiles,
+        'tiles_per_second' : tiles / max( stages[ 'tiling' ], 1e-9 ),
+        'peak_rss'         : __peak_rss__(),
+        'workdir'          : workdir if keep else None
+    }
+
+def save_result(result : dict(), path : str) -> None:
+
+    """ Append a result to path, one JSON object by line, so runs can be compared over time """
+
+    with open(path, 'a') as file:
+        file.write( json.dumps( result, sort_keys=True ) + '\n' )
+
+def load_results(path : str) -> list():
+
+    """ Read results saved in path """
+
+    with open(path, 'r') as file:
+        return [ json.loads( line ) for line in file if line.strip() ]
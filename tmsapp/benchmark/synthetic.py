@@ -0,0 +1,122 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   rasterio.crs     import CRS
+from   rasterio.warp    import transform as transform_points
+from   rasterio.windows import Window
+from   rasterio         import Affine as A
+import rasterio         as     rio
+import numpy            as     np
+
+
+
+# Utils
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get value range of a dtype
+def __value_range__(dtype : str) -> (float, float):
+
+    """ Range of synthetic values : full range for 8 bits, 12 bits for 16 bits integers, [0, 1000] for floats """
+
+    dtype = np.dtype( dtype )
+
+    if dtype == np.uint8:
+        return 0., 255.
+
+    if dtype.kind in 'iu':
+        return 0., float( min( np.iinfo( dtype ).max, 4095 ) )
+
+    return 0., 1000.
+
+# get default pixel size
+def __default_resolution__(crs : CRS) -> float:
+
+    """ One meter, in crs units """
+
+    return 1. / 111320. if crs.is_geographic else 1.
+
+# make synthetic bands of a window
+def __make_bands__(window : Window, width : int, height : int, count : int, dtype : str, nodata : float,
+                   rng : np.random.Generator) -> np.ndarray:
+
+    """ Gradients & waves (smooth, compressible) plus noise, nodata on the bottom left corner """
+
+    row0, col0 = int( window.row_off ), int( window.col_off )
+    rows, cols = np.mgrid[ row0 : row0 + window.height, col0 : col0 + window.width ]
+
+    # position in raster, in [0, 1]
+    u          = cols / max( 1, width  - 1 )
+    v          = rows / max( 1, height - 1 )
+    low, high  = __value_range__( dtype )
+
+    bands      = np.empty( (count, window.height, window.width), dtype=dtype )
+
+    for i in range( count ):
+
+        phase = i * np.pi / max( 1, count )
+        value = 0.4 * u + 0.3 * v + 0.2 * ( 1 + np.sin( 12 * np.pi * u + phase ) * np.cos( 9 * np.pi * v ) ) / 2
+        value = value + 0.1 * rng.random( value.shape )
+
+        bands[ i ] = ( low + np.clip( value, 0, 1 ) * ( high - low ) ).astype( dtype )
+
+    # a nodata corner, so tiles get a partial alpha
+    if nodata is not None:
+        bands[ :, u + ( 1 - v ) < 0.25 ] = nodata
+
+    return bands
+
+
+
+# Synthetic raster
+#-----------------------------------------------------------------------------------------------------------------------
+
+def make_synthetic_raster(path : str, width : int = 4096, height : int = 4096, count : int = 3, dtype : str = 'uint8',
+                          crs : int = 3857, center : tuple() = (2.35, 48.85), resolution : float = None,
+                          nodata : float = None, tiled : bool = False, compress : str = None, seed : int = 0) -> dict():
+
+    """
+    Write a synthetic GeoTIFF of width x height pixels & count bands of dtype, in crs (EPSG code), centered on center
+    (lon, lat), with pixels of resolution crs units (default one meter). Rows are written by blocks, so memory does
+    not grow with the raster size. Return the profile of the raster.
+    """
+
+    crs        = CRS.from_epsg( crs )
+    resolution = resolution or __default_resolution__( crs )
+
+    # get top left corner
+    xs, ys     = transform_points(CRS.from_epsg( 4326 ), crs, [ center[0] ], [ center[1] ])
+    left       = xs[0] - width  * resolution / 2
+    top        = ys[0] + height * resolution / 2
+
+    profile = {
+        'driver'    : 'GTiff',
+        'width'     : width,
+        'height'    : height,
+        'count'     : count,
+        'dtype'     : dtype,
+        'crs'       : crs,
+        'transform' : A.translation(left, top) * A.scale(resolution, -resolution),
+        'nodata'    : nodata,
+        'BIGTIFF'   : 'IF_SAFER'
+    }
+
+    if tiled:
+        profile.update( tiled=True, blockxsize=512, blockysize=512 )
+
+    if compress is not None:
+        profile.update( compress=compress )
+
+    # same raster for same seed
+    rng = np.random.default_rng( seed )
+
+    with rio.open(path, 'w', **profile) as dst_dataset:
+
+        # blocks of 512 rows (about 512 * width * count values)
+        for row in range(0, height, 512):
+
+            window = Window(0, row, width, min( 512, height - row ))
+            bands  = __make_bands__(window, width, height, count, dtype, nodata, rng)
+
+            dst_dataset.write(bands, window=window)
+
+    return profile
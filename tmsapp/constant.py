@@ -16,3 +16,238 @@ WEB_MERCATOR_TILE_SIZE = 512
 
 # WORLD TILE SIZE
 WEB_MERCATOR_WORLD_SIZE = 2 * pi * 6378137
+
+
+
+# Tile cache (can be overridden with settings.TMS_TILE_CACHE)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# BYTE BUDGET FOR CACHED TILES
+TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# MAX NUMBER OF CACHED TILE MISSES
+TILE_CACHE_MAX_MISSES = 100000
+
+# TIME TO LIVE OF CACHED TILES IN SECONDS (None : no expiration)
+TILE_CACHE_TTL = None
+
+# TIME TO LIVE OF CACHED TILE MISSES IN SECONDS
+TILE_CACHE_MISS_TTL = 60
+
+# EVICTION POLICY ('lru' or 'lfu')
+TILE_CACHE_POLICY = 'lru'
+
+# TIME TO LIVE OF CACHED LAYER NAMES & VERSIONS IN SECONDS
+LAYER_INDEX_TTL = 30
+
+# LOCK OF CONCURRENT TILE MISSES BETWEEN PROCESSES (None : process only, 'file' : host, 'advisory' : database)
+SINGLE_FLIGHT_LOCK = None
+
+# LOCK FILE OF 'file' LOCK
+SINGLE_FLIGHT_LOCK_FILE = '/tmp/tms-single-flight.lock'
+
+
+
+# HTTP cache
+#-----------------------------------------------------------------------------------------------------------------------
+
+# DEFAULT CACHE-CONTROL MAX AGE OF TILES IN SECONDS
+TILE_MAX_AGE = 3600
+
+# CACHE-CONTROL MAX AGE OF BLANK TILES IN SECONDS (A TILE MAY BE RENDERED OR WRITTEN LATER)
+TILE_BLANK_MAX_AGE = 60
+
+
+
+# Tiling (can be overridden with settings.TMS_TILING_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# NUMBER OF TILING PROCESSES (None : number of cpu)
+TILING_WORKERS = None
+
+# NUMBER OF TILES BY SIDE OF A WORK UNIT
+TILING_QUADRANT_SIZE = 8
+
+# NUMBER OF TILES BY SIDE OF A METATILE, WARPED IN ONE CALL (default of layers, 1 : tile by tile)
+TILING_METATILE = 4
+
+# PYRAMID MODE ('overview' : lower zooms from children tiles, 'warp' : all zooms from source)
+TILING_PYRAMID = 'overview'
+
+# RESAMPLING KERNEL OF OVERVIEW ('average', 'nearest' or 'mode')
+TILING_RESAMPLING = 'average'
+
+# MARGIN OF SOURCE PIXELS READ AROUND A WORK UNIT (for resampling)
+TILING_READ_MARGIN = 8
+
+# GDAL BLOCK CACHE OF A TILING PROCESS IN MB
+TILING_GDAL_CACHE = 256
+
+# NUMBER OF TILES WRITTEN BY BATCH
+TILING_BATCH_SIZE = 500
+
+# MAX NUMBER OF TILES WAITING FOR WRITING BY PROCESS (back-pressure on renderers)
+TILING_MAX_PENDING = 2000
+
+# WRITE METHOD ('bulk' : bulk_create, 'copy' : PostgreSQL COPY for tables without spatial column)
+TILING_WRITE_METHOD = 'bulk'
+
+# NUMBER OF RETRIES OF A FAILED WORK UNIT
+TILING_UNIT_RETRIES = 2
+
+
+
+# Mapbox Vector Tile
+#-----------------------------------------------------------------------------------------------------------------------
+
+# TILE EXTENT IN MVT COORDINATES
+MVT_EXTENT = 4096
+
+# CLIPPING BUFFER IN MVT COORDINATES
+MVT_BUFFER = 256
+
+# CONTENT TYPE
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# RESPONSE OF MISSING TILES ('blank' : shared transparent png, 'empty' : 204 No Content)
+TILE_MISS_RESPONSE = 'blank'
+
+
+
+# MBTiles export & import
+#-----------------------------------------------------------------------------------------------------------------------
+
+# NUMBER OF TILES READ & WRITTEN BY BATCH
+MBTILES_BATCH_SIZE = 1000
+
+
+
+# Tile storage (can be overridden with settings.TMS_TILE_STORAGE & settings.TMS_TILE_STORAGE_ROOT)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# STORAGE BACKEND OF NEW LAYERS ('postgis', 'filesystem' or 'mbtiles')
+TILE_STORAGE = 'postgis'
+
+# DIRECTORY OF FILESYSTEM & MBTILES BACKENDS IN MEDIA_ROOT
+TILE_STORAGE_DIR = 'tiles'
+
+# DIRECTORY OF SOURCES EXTRACTED FROM ZIP LAYERS IN MEDIA_ROOT (REPROJECTED AT TILING, READ BY LAZY RENDERING)
+TILE_SOURCE_DIR = 'sources'
+
+
+
+# Async serving (can be overridden with settings.TMS_ASYNC_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# SERVE TILES WITH ASYNC VIEWS (ASGI, Django >= 3.1)
+ASYNC_VIEWS = False
+
+# NUMBER OF THREADS LOADING TILES FOR ASYNC VIEWS (bound of concurrent database accesses by process)
+ASYNC_THREADS = 32
+
+
+
+# Reprojection (can be overridden with settings.TMS_REPROJECT_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# NUMBER OF GDAL WARPING THREADS (None : number of cpu)
+REPROJECT_THREADS = None
+
+# MEMORY BUDGET OF A REPROJECTION IN MB (output strip & warper)
+REPROJECT_MEMORY = 256
+
+# COMPRESSION OF REPROJECTED GEOTIFF
+REPROJECT_COMPRESS = 'deflate'
+
+# BLOCK SIZE OF REPROJECTED GEOTIFF (one tile)
+REPROJECT_BLOCK_SIZE = 512
+
+
+
+# Tiling progress
+#-----------------------------------------------------------------------------------------------------------------------
+
+# MIN SECONDS BETWEEN TWO SAVES OF THE PROGRESS OF A TILING ON THE LAYER ROW
+TILING_PROGRESS_INTERVAL = 2
+
+
+
+# Tiling jobs (can be overridden with settings.TMS_TILING_JOB_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# NUMBER OF JOBS RUN AT ONCE BY A WORKER
+TILING_JOB_CONCURRENCY = 1
+
+# SECONDS BETWEEN TWO HEARTBEATS OF A RUNNING JOB (cancellation is checked at the same time)
+TILING_JOB_HEARTBEAT = 10
+
+# SECONDS WITHOUT HEARTBEAT BEFORE A RUNNING JOB IS CONSIDERED LOST (its worker died) & QUEUED AGAIN
+TILING_JOB_TIMEOUT = 120
+
+# NUMBER OF ATTEMPTS OF A JOB
+TILING_JOB_ATTEMPTS = 3
+
+# SECONDS BETWEEN TWO POLLS OF THE JOB TABLE BY AN IDLE WORKER
+TILING_JOB_POLL = 2
+
+
+
+# Tile formats (can be overridden with settings.TMS_TILE_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# QUALITY (1-100) OF WEBP & JPG TILES OF NEW LAYERS (100 : lossless webp)
+TILE_QUALITY = 80
+
+# RGB COLOR OF TRANSPARENT PIXELS OF JPG TILES
+TILE_JPEG_BACKGROUND = ( 255, 255, 255 )
+
+# WEBP ENCODER EFFORT (0 fast - 6 small)
+TILE_WEBP_METHOD = 4
+
+# NUMBER OF TILES BY BATCH WHEN FORMATS ARE ENCODED AT TILING
+TILE_VARIANT_BATCH_SIZE = 64
+
+
+
+# Raster rendering (can be overridden with settings.TMS_RASTER_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# RESCALING OF BANDS TO 8 BITS OF NEW LAYERS : 'auto', 'none', 'minmax', 'percent' OR 'equalize'
+RASTER_STRETCH = 'auto'
+
+# NUMBER OF BINS OF BAND HISTOGRAMS
+RASTER_STATS_BINS = 256
+
+# PERCENTILES OF 'percent' STRETCH (percent, 100 - percent)
+RASTER_STATS_PERCENT = 2
+
+# MAX PIXELS BY SIDE OF THE DECIMATED READ OF A SOURCE FOR STATISTICS
+RASTER_STATS_SIZE = 2048
+
+# COLORMAPS OF SINGLE BAND LAYERS, AS EVENLY SPACED RGB STOPS
+RASTER_COLORMAPS = {
+    'gray'     : [ (0, 0, 0), (255, 255, 255) ],
+    'viridis'  : [ (68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37) ],
+    'magma'    : [ (0, 0, 4), (81, 18, 124), (183, 55, 121), (252, 137, 97), (252, 253, 191) ],
+    'terrain'  : [ (51, 51, 153), (0, 153, 255), (0, 204, 102), (255, 255, 153), (128, 92, 84), (255, 255, 255) ],
+    'spectral' : [ (158, 1, 66), (244, 109, 67), (254, 224, 139), (230, 245, 152), (102, 194, 165), (94, 79, 162) ],
+    'blues'    : [ (247, 251, 255), (107, 174, 214), (8, 48, 107) ]
+}
+
+
+
+# Identify & statistics (can be overridden with settings.TMS_IDENTIFY_*)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# SRID OF COORDINATES OF REQUESTS, WHEN NOT GIVEN
+IDENTIFY_SRID = 4326
+
+# MAX NUMBER OF TILES READ BY A STATISTICS REQUEST (THE ZOOM IS LOWERED UNTIL THE BBOX FITS)
+IDENTIFY_MAX_TILES = 16
+
+# NUMBER OF BINS OF HISTOGRAMS, WHEN NOT GIVEN, & MAX NUMBER OF BINS
+IDENTIFY_BINS     = 64
+IDENTIFY_MAX_BINS = 1024
+
+# MAX SIZE OF THE CACHE OF DECODED RASTER TILES
+IDENTIFY_CACHE_MAX_BYTES = 128 * 1024 * 1024
@@ -0,0 +1,83 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.core.management.base import BaseCommand
+from   tmsapp.benchmark            import KINDS, WRITERS, run_benchmark, save_result
+import json
+
+
+
+# Command
+#-----------------------------------------------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+
+    help = 'Benchmark the tiling pipeline on a synthetic GeoTIFF (reprojection, encoding, tiling & writes by zoom)'
+
+    def add_arguments(self, parser) -> None:
+
+        parser.add_argument('--kind',     choices=KINDS, default='image', help='Kind of layer')
+        parser.add_argument('--width',    type=int, default=4096, help='Width of the synthetic raster (pixels)')
+        parser.add_argument('--height',   type=int, default=4096, help='Height of the synthetic raster (pixels)')
+        parser.add_argument('--bands',    type=int, default=3, help='Number of bands')
+        parser.add_argument('--dtype',    default='uint8', help='Data type of bands (uint8, uint16, float32, ...)')
+        parser.add_argument('--crs',      type=int, default=2154, help='EPSG code of the synthetic raster')
+        parser.add_argument('--nodata',   type=float, help='Nodata value (a nodata corner is drawn)')
+        parser.add_argument('--minz',     type=int, help='Min zoom (default : max zoom - 4)')
+        parser.add_argument('--maxz',     type=int, help='Max zoom (default : native zoom of the raster)')
+        parser.add_argument('--writer',   choices=WRITERS, default='sqlite', help='Where tiles are written')
+        parser.add_argument('--workers',  type=int, help='Number of tiling processes')
+        parser.add_argument('--metatile', type=int, help='Metatile size')
+        parser.add_argument('--samples',  type=int, default=100, help='Number of tiles of the encoding stage')
+        parser.add_argument('--seed',     type=int, default=0, help='Seed of the synthetic raster')
+        parser.add_argument('--workdir',  help='Parent directory of the temporary files')
+        parser.add_argument('--keep',     action='store_true', help='Keep the temporary files')
+        parser.add_argument('--output',   help='Append the result to this file (one JSON object by line)')
+        parser.add_argument('--json',     action='store_true', help='Print the result as JSON')
+
+    def handle(self, *args, **options) -> None:
+
+        result = run_benchmark(
+            kind           = options[ 'kind' ],
+            width          = options[ 'width' ],
+            height         = options[ 'height' ],
+            count          = options[ 'bands' ],
+            dtype          = options[ 'dtype' ],
+            crs            = options[ 'crs' ],
+            nodata         = options[ 'nodata' ],
+            minz           = options[ 'minz' ],
+            maxz           = options[ 'maxz' ],
+            writer         = options[ 'writer' ],
+            workers        = options[ 'workers' ],
+            metatile       = options[ 'metatile' ],
+            encode_samples = options[ 'samples' ],
+            workdir        = options[ 'workdir' ],
+            keep           = options[ 'keep' ],
+            seed           = options[ 'seed' ]
+        )
+
+        if options[ 'output' ] is not None:
+            save_result(result, options[ 'output' ])
+
+        if options[ 'json' ]:
+            self.stdout.write( json.dumps( result, indent=2, sort_keys=True ) )
+            return
+
+        # report
+        for stage, seconds in result[ 'stages' ].items():
+            self.stdout.write( '%-10s : %8.2f s' % (stage, seconds) )
+
+        self.stdout.write( 'encode     : %8.0f tiles/s' % result[ 'encode' ][ 'tiles_per_second' ] )
+
+        for zoom in result[ 'zooms' ]:
+
+            params = (zoom[ 'zoom' ], zoom[ 'tiles' ], zoom[ 'seconds' ], zoom[ 'tiles_per_second' ],
+                      zoom[ 'write_seconds' ], zoom[ 'bytes' ] / 1024 / 1024)
+
+            self.stdout.write( 'zoom %2d    : %8d tiles in %8.2f s, %8.0f tiles/s (write %.2f s, %.1f Mb)' % params )
+            self.stdout.write( '             %s' % ', '.join( '%s %.2f s' % item for item in zoom[ 'stages' ].items() ) )
+
+        params = (result[ 'tiles' ], result[ 'tiles_per_second' ], result[ 'peak_rss' ][ 'self_mb' ],
+                  result[ 'peak_rss' ][ 'children_mb' ])
+
+        self.stdout.write( 'total      : %8d tiles, %.0f tiles/s, peak RSS %.0f Mb (tiling processes %.0f Mb)' % params )
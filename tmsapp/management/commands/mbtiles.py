@@ -0,0 +1,61 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.core.management.base import BaseCommand, CommandError
+from   tmsapp.models               import ImageLayer, RasterLayer
+from   tmsapp.constant             import MBTILES_BATCH_SIZE
+from   tmsapp.utils.storage        import STORAGES
+
+
+
+# Command
+#-----------------------------------------------------------------------------------------------------------------------
+
+# layer model by kind
+_MODELS = { 'image' : ( ImageLayer, 'imagelayer_name' ), 'raster' : ( RasterLayer, 'rasterlayer_name' ) }
+
+class Command(BaseCommand):
+
+    help = 'Export a layer to a MBTiles file, or import a MBTiles file as a new layer'
+
+    def add_arguments(self, parser) -> None:
+
+        parser.add_argument('action', choices=[ 'export', 'import' ])
+        parser.add_argument('kind',   choices=list( _MODELS ), help='Kind of layer')
+        parser.add_argument('path',   help='MBTiles file')
+        parser.add_argument('--name', help='Name of the layer to export (required) or of the imported layer')
+        parser.add_argument('--batch-size', type=int, default=MBTILES_BATCH_SIZE, help='Number of tiles by batch')
+        parser.add_argument('--storage', choices=STORAGES, help='Storage backend of the imported layer')
+
+    def handle(self, *args, **options) -> None:
+
+        model, field = _MODELS[ options[ 'kind' ] ]
+
+        if options[ 'action' ] == 'export':
+
+            if options[ 'name' ] is None:
+                raise CommandError( '--name is required for export' )
+
+            layer = model.objects.filter( **{ field : options[ 'name' ] } ).first()
+
+            if layer is None:
+                raise CommandError( 'Layer "%s" does not exist' % options[ 'name' ] )
+
+            stats = layer.export_mbtiles(options[ 'path' ], options[ 'batch_size' ])
+
+        else:
+
+            params = (options[ 'path' ], options[ 'name' ], options[ 'batch_size' ], options[ 'storage' ])
+
+            try:
+                layer, stats = model.import_mbtiles( *params )
+
+            # tiles are not images
+            except ValueError as error:
+                raise CommandError( str( error ) )
+
+        # throughput report
+        params = (options[ 'action' ], stats[ 'tiles' ], stats[ 'bytes' ] / 1024 / 1024, stats[ 'seconds' ],
+                  stats[ 'tiles_per_second' ], stats[ 'bytes_per_second' ] / 1024 / 1024, layer)
+
+        self.stdout.write( '%s : %d tiles (%.1f Mb) in %.1f s, %.0f tiles/s (%.1f Mb/s), layer "%s"' % params )
@@ -0,0 +1,41 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.core.management.base import BaseCommand, CommandError
+from   tmsapp.models               import ImageLayer, RasterLayer
+
+
+
+# Command
+#-----------------------------------------------------------------------------------------------------------------------
+
+# layer model by kind
+_MODELS = { 'image' : ( ImageLayer, 'imagelayer_name' ), 'raster' : ( RasterLayer, 'rasterlayer_name' ) }
+
+class Command(BaseCommand):
+
+    help = 'Pack tiles of a layer in a read-only archive, then serve the layer from it'
+
+    def add_arguments(self, parser) -> None:
+
+        parser.add_argument('kind', choices=list( _MODELS ), help='Kind of layer')
+        parser.add_argument('name', help='Name of the layer')
+
+    def handle(self, *args, **options) -> None:
+
+        model, field = _MODELS[ options[ 'kind' ] ]
+
+        layer = model.objects.filter( **{ field : options[ 'name' ] } ).first()
+
+        if layer is None:
+            raise CommandError( 'Layer "%s" does not exist' % options[ 'name' ] )
+
+        stats = layer.pack_archive()
+
+        # report
+        params = (stats[ 'tiles' ], stats[ 'payloads' ], stats[ 'bytes' ] / 1024 / 1024,
+                  stats[ 'packed_bytes' ] / 1024 / 1024, stats[ 'seconds' ], stats[ 'tiles_per_second' ], layer)
+
+        message = 'pack : %d tiles (%d payloads, %.1f Mb -> %.1f Mb) in %.1f s, %.0f tiles/s, layer "%s"'
+
+        self.stdout.write( message % params )
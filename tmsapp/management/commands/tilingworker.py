@@ -0,0 +1,28 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.core.management.base import BaseCommand
+from   tmsapp.worker               import TilingWorker
+
+
+
+# Command
+#-----------------------------------------------------------------------------------------------------------------------
+
+class Command(BaseCommand):
+
+    help = 'Run tiling jobs of saved layers, out of the processes serving tiles'
+
+    def add_arguments(self, parser) -> None:
+
+        parser.add_argument('--concurrency', type=int, help='Number of jobs run at once')
+        parser.add_argument('--name', help='Name of the worker in the job table (default : host:pid)')
+        parser.add_argument('--once', action='store_true', help='Exit when no job is left')
+
+    def handle(self, *args, **options) -> None:
+
+        worker = TilingWorker(options[ 'concurrency' ], options[ 'name' ])
+
+        self.stdout.write( 'tiling worker "%s", %d job(s) at once' % (worker.name, worker.concurrency) )
+
+        worker.run( options[ 'once' ] )
@@ -1,3 +1,5 @@
-from .raster import RasterLayer, RasterTile, NotValidRasterException
-from .image  import ImageLayer, ImageTile
-from .vector import VectorLayer, VectorGeometry
\ No newline at end of file
+from .job     import TilingJob, TilingUnit, UnitCheckpoint, JOB_KINDS, JOB_STATES
+from .encoded import EncodedTile, EncodedTileStorage
+from .raster  import RasterLayer, RasterTile, NotValidRasterException
+from .image   import ImageLayer, ImageTile
+from .vector  import VectorLayer, VectorGeometry
\ No newline at end of file
@@ -0,0 +1,135 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from    django.contrib.gis.db   import models
+from    django.db               import transaction
+from    tmsapp.utils.storage    import TileStorage, FileSystemStorage, SQLiteStorage, ArchiveStorage
+from    tmsapp.utils.encoding   import TILE_FORMATS
+from    .job                    import JOB_KINDS
+
+
+
+# Encoded tile
+#-----------------------------------------------------------------------------------------------------------------------
+
+class EncodedTile(models.Model):
+
+    """ A tile of a layer encoded at tiling in another format than png (PostGIS backend) """
+
+    class Meta:
+        verbose_name_plural = 'Encoded Tiles'
+        unique_together     = ( ( 'encodedtile_kind', 'encodedtile_layer', 'encodedtile_format', 'encodedtile_zoom',
+                                  'encodedtile_x', 'encodedtile_y' ), )
+
+    encodedtile_id     = models.AutoField(primary_key=True)
+    encodedtile_kind   = models.CharField(max_length=20, choices=[ (x, x) for x in JOB_KINDS ], verbose_name='Kind')
+    encodedtile_layer  = models.IntegerField(verbose_name='Layer id')
+    encodedtile_format = models.CharField(max_length=10, choices=[ (x, x) for x in TILE_FORMATS ],
+                                          verbose_name='Format')
+    encodedtile_zoom   = models.IntegerField(verbose_name='Zoom')
+    encodedtile_x      = models.IntegerField(verbose_name='X')
+    encodedtile_y      = models.IntegerField(verbose_name='Y')
+
+    image              = models.BinaryField()
+
+    def __str__(self):
+        params = (self.encodedtile_kind, self.encodedtile_layer, self.encodedtile_format, self.encodedtile_zoom,
+                  self.encodedtile_x, self.encodedtile_y)
+        return '%s %d %s [Z=%d X=%d Y=%d]' % params
+
+    def __repr__(self):
+        return self.__str__()
+
+
+
+# Encoded tile storage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class EncodedTileStorage(TileStorage):
+
+    """ PostGIS backend of a format encoded at tiling : tiles are EncodedTile rows, a tile put twice is replaced """
+
+    def __init__(self, kind : str, frmt : str):
+
+        self.kind = kind
+        self.frmt = frmt
+
+    def __params__(self, layer_id : int) -> dict():
+        return { 'encodedtile_kind' : self.kind, 'encodedtile_layer' : layer_id, 'encodedtile_format' : self.frmt }
+
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        queryset = EncodedTile.objects.filter(encodedtile_zoom=zoom, encodedtile_x=x, encodedtile_y=y,
+                                              **self.__params__( layer_id ))
+
+        for image in queryset.values_list( 'image', flat=True )[ :1 ]:
+            return bytes( image )
+
+        return None
+
+    def put_many(self, layer_id : int, tiles : list()) -> None:
+
+        tiles    = list( tiles )
+        queryset = EncodedTile.objects.filter( **self.__params__( layer_id ) )
+
+        # replace tiles encoded by a previous (stopped) tiling
+        with transaction.atomic():
+
+            for zoom in set( tile[0] for tile in tiles ):
+
+                xy   = set( (x, y) for z, x, y, _ in tiles if z == zoom )
+                rows = queryset.filter(encodedtile_zoom=zoom, encodedtile_x__in=set( x for x, _ in xy ),
+                                       encodedtile_y__in=set( y for _, y in xy ))
+
+                # x & y sets cover other tiles (of previous batches), only the tiles of batch are deleted
+                ids  = [ pk for pk, x, y in rows.values_list('encodedtile_id', 'encodedtile_x', 'encodedtile_y')
+                         if (x, y) in xy ]
+
+                EncodedTile.objects.filter(pk__in=ids).delete()
+
+            EncodedTile.objects.bulk_create([ EncodedTile(encodedtile_zoom=zoom, encodedtile_x=x, encodedtile_y=y,
+                                                          image=payload, **self.__params__( layer_id ))
+                                              for zoom, x, y, payload in tiles ])
+
+    def delete_layer(self, layer_id : int) -> None:
+
+        EncodedTile.objects.filter( **self.__params__( layer_id ) ).delete()
+
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        queryset = EncodedTile.objects.filter( **self.__params__( layer_id ) )
+        existing = set()
+
+        # one query by zoom
+        for zoom in set( tile[0] for tile in tiles ):
+            xy        = [ (x, y) for z, x, y in tiles if z == zoom ]
+            rows      = queryset.filter(encodedtile_zoom=zoom, encodedtile_x__in=set( x for x, _ in xy ),
+                                        encodedtile_y__in=set( y for _, y in xy ))
+            existing |= set( (zoom, x, y) for x, y in rows.values_list('encodedtile_x', 'encodedtile_y') )
+
+        return [ tuple( tile ) in existing for tile in tiles ]
+
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        queryset = EncodedTile.objects.filter( encodedtile_zoom=zoom, **self.__params__( layer_id ) )
+
+        return queryset.values_list('encodedtile_x', 'encodedtile_y').iterator()
+
+    def iter_tiles(self, layer_id : int) -> object:
+
+        params   = ( 'encodedtile_zoom', 'encodedtile_x', 'encodedtile_y', 'image' )
+        queryset = EncodedTile.objects.filter( **self.__params__( layer_id ) ).values_list( *params )
+
+        for zoom, x, y, image in queryset.iterator():
+            yield zoom, x, y, bytes( image )
+
+# storage backends of formats encoded at tiling, by format & backend of layer (png stay in the layer storage)
+def make_encoded_storages(kind : str) -> dict():
+
+    """ Get storages of a kind of layer by format (other than png), then by backend """
+
+    return { frmt : { 'postgis'    : EncodedTileStorage( kind, frmt ),
+                      'filesystem' : FileSystemStorage( '%s-%s' % (kind, frmt), ext=frmt, merge=False ),
+                      'mbtiles'    : SQLiteStorage( '%s-%s' % (kind, frmt), merge=False ),
+                      'archive'    : ArchiveStorage( '%s-%s' % (kind, frmt) ) }
+             for frmt in TILE_FORMATS if frmt != 'png' }
@@ -2,11 +2,30 @@
 #-----------------------------------------------------------------------------------------------------------------------
 
 from    django.contrib.gis.db   import models
+from    django.db               import transaction, IntegrityError
 from    tmsapp.utils            import *
-from    tmsapp.constant         import WEB_MERCATOR_SRID
+from    tmsapp.utils            import __merge_png__
+from    tmsapp.constant         import WEB_MERCATOR_SRID, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, TILE_MAX_AGE
+from    tmsapp.utils.cache      import IMAGE_TILE_CACHE, IMAGE_LAYER_INDEX
+from    tmsapp.utils.sink       import TileSink, bulk_write
+from    tmsapp.utils.coverage   import TileCoverage, IMAGE_COVERAGE_INDEX
+from    tmsapp.utils.lazy       import IMAGE_LAZY_WRITER
+from    tmsapp.utils.flight     import IMAGE_TILE_FLIGHT
+from    tmsapp.utils.progress   import TilingProgress, end_report
+from    .job                    import TilingJob, TilingUnit, UnitCheckpoint
+from    .encoded                import make_encoded_storages
+from    tmsapp.utils.mbtiles    import MBTilesReader, make_metadata, get_metadata_geom, export_tiles, import_tiles
+from    tmsapp.utils.mbtiles    import get_metadata_format
+from    tmsapp.utils.storage    import TileStorage, FileSystemStorage, SQLiteStorage, ArchiveStorage
+from    tmsapp.utils.storage    import STORAGES, ARCHIVE_STORAGE, get_default_storage
+from    tmsapp.utils.encoding   import encode_tile, encode_variants, parse_formats, validate_formats, get_tile_quality
+from    tmsapp.constant         import MBTILES_BATCH_SIZE
 from    django.contrib.gis.geos import MultiPolygon
-from    threading               import Thread
-import  time
+from    django.utils            import timezone
+from    io                      import BytesIO
+import  json
+import  shutil
+import  os
 
 
 
@@ -20,119 +39,450 @@ class ImageLayer(models.Model):
 
     imagelayer_id        = models.AutoField(primary_key=True)
     imagelayer_name      = models.CharField(max_length=200, verbose_name='Name')
-    imagelayer_file      = models.FileField(upload_to='upload-imagelayer', verbose_name='File (.tif / .zip)')
+    imagelayer_file      = models.FileField(upload_to='upload-imagelayer', blank=True, null=True,
+                                            verbose_name='File (.tif / .zip)')
     imagelayer_crs       = models.IntegerField(default=3857, editable=False, verbose_name='CRS')
     imagelayer_minz      = models.IntegerField(default=0, verbose_name='Min zoom')
     imagelayer_maxz      = models.IntegerField(default=18, verbose_name='Max zoom')
     imagelayer_available = models.BooleanField(default=False, editable=False, verbose_name='Available')
     imagelayer_crea      = models.DateTimeField(auto_now_add=True, verbose_name='Creation')
+    imagelayer_updt      = models.DateTimeField(auto_now=True, verbose_name='Update')
+    imagelayer_maxage    = models.IntegerField(default=TILE_MAX_AGE, verbose_name='Cache max age (s)')
+    imagelayer_storage   = models.CharField(max_length=20, choices=[ (x, x) for x in STORAGES ],
+                                            default=get_default_storage, verbose_name='Storage')
+    imagelayer_packed    = models.BooleanField(default=False, editable=False, verbose_name='Packed')
+    imagelayer_metatile  = models.IntegerField(default=get_metatile, verbose_name='Metatile size')
+    imagelayer_eagerz    = models.IntegerField(null=True, blank=True, verbose_name='Eager max zoom')
+    imagelayer_formats   = models.CharField(max_length=50, blank=True, default='', validators=[ validate_formats ],
+                                            verbose_name='Formats encoded at tiling (webp, jpg)')
+    imagelayer_quality   = models.IntegerField(default=get_tile_quality, verbose_name='Quality (webp, jpg)')
 
     geom                 = models.MultiPolygonField(srid=3857, editable=False, null=True)
 
+    # serialized TileCoverage, built when the pyramid is finished
+    imagelayer_coverage  = models.BinaryField(null=True, editable=False)
+
+    # progress of the last tiling job as JSON (see TilingProgress.report)
+    imagelayer_progress  = models.TextField(null=True, editable=False)
+
     # override
     def save(self : object, *args : tuple(), **kwargs : dict()) -> None:
 
         """ Save ImageLayer object """
 
+        # coverage is built again with tiles
+        self.imagelayer_coverage = None
+
         # override
         super(ImageLayer, self).save( *args, **kwargs )
 
-        # start job creation
-        self.__start_imagetiles_creation__( *args, **kwargs )
+        # drop cached tiles & name of layer
+        self.__drop_cache__()
+
+        # a layer imported from a MBTiles file has no source to tile
+        if not self.imagelayer_file:
+            return
+
+        # queue tiling job, run by a worker (manage.py tilingworker)
+        TilingJob.submit( 'image', self.imagelayer_id )
+
+    # override
+    def delete(self : object, *args : tuple(), **kwargs : dict()) -> tuple():
+
+        """ Delete ImageLayer object """
+
+        # drop cached tiles & name of layer
+        self.__drop_cache__()
+
+        # stop tiling of layer
+        TilingJob.cancel( 'image', self.imagelayer_id )
+        TilingUnit.clear( 'image', self.imagelayer_id )
+
+        # drop tiles of file backends & extracted sources
+        self.__delete_tiles__( archive=True )
+        shutil.rmtree(get_source_dir('image', self.imagelayer_id), ignore_errors=True)
+
+        return super(ImageLayer, self).delete( *args, **kwargs )
+
+    def get_storage(self : object) -> TileStorage:
+
+        """ Get storage backend of tiles """
+
+        return IMAGE_STORAGES[ self.imagelayer_storage ]
+
+    def __delete_tiles__(self : object, archive : bool = False) -> None:
+
+        """
+        Delete tiles in all backends (backend may have changed since last tiling). Archives are kept unless archive :
+        a packed layer is served from its archive while it is tiled again, then the archive is replaced
+        """
+
+        for name, storage in IMAGE_STORAGES.items():
+            if archive or name != ARCHIVE_STORAGE:
+                storage.delete_layer( self.imagelayer_id )
+
+        for storages in IMAGE_ENCODED_STORAGES.values():
+            for name, storage in storages.items():
+                if archive or name != ARCHIVE_STORAGE:
+                    storage.delete_layer( self.imagelayer_id )
+
+    def __encode_tiles__(self : object) -> int:
+
+        """ Encode png of the pyramid in formats of layer (imagelayer_formats). Return number of encoded tiles """
+
+        formats  = parse_formats( self.imagelayer_formats )
+        storages = { frmt : IMAGE_ENCODED_STORAGES[ frmt ][ self.imagelayer_storage ] for frmt in formats }
+        tiles    = self.get_storage().iter_tiles( self.imagelayer_id )
+
+        push     = lambda frmt, encoded: storages[ frmt ].put_many(self.imagelayer_id, encoded)
+
+        return encode_variants(tiles, formats, self.imagelayer_quality, push)
+
+    def __drop_cache__(self : object) -> None:
+
+        """ Drop cached tiles, coverage & cached name of layer (current name and previous ones) """
+
+        IMAGE_COVERAGE_INDEX.drop( self.imagelayer_id )
+
+        names = IMAGE_LAYER_INDEX.drop( self.imagelayer_id )
+
+        for name in set( names + [ self.imagelayer_name ] ):
+            IMAGE_TILE_CACHE.drop_layer( name )
+
+    @staticmethod
+    def get_info(name : str) -> tuple():
+
+        """
+        Get ImageLayer (id, update, max age, storage, eager max zoom, max zoom, formats encoded at tiling, quality) by
+        name, resolution is cached
+        """
+
+        params = ( 'imagelayer_id', 'imagelayer_updt', 'imagelayer_maxage', 'imagelayer_storage', 'imagelayer_minz',
+                   'imagelayer_maxz', 'imagelayer_eagerz', 'imagelayer_formats', 'imagelayer_quality',
+                   'imagelayer_packed' )
+        loader = lambda x: ImageLayer.objects.filter(imagelayer_name=x).values_list( *params ).first()
+        info   = IMAGE_LAYER_INDEX.resolve( name, loader )
+
+        if info is None:
+            return None
+
+        # a packed layer is served from its archive
+        storage = ARCHIVE_STORAGE if info[9] else info[3]
+
+        return ( info[0], int( info[1].timestamp() ), info[2], storage, get_eager_zoom( *info[4:7] ), info[5],
+                 parse_formats( info[7] ), info[8] )
+
+    @staticmethod
+    def get_image(info : tuple(), zoom : int, x : int, y : int, frmt : str = 'png') -> bytes:
+
+        """
+        Get tile payload of ImageLayer by info (see get_info) in a format, tiles of lazy zooms are rendered on first
+        request. Formats not encoded at tiling are encoded from png.
+        """
+
+        # encoded at tiling
+        if frmt in info[6]:
+
+            payload = IMAGE_ENCODED_STORAGES[ frmt ][ info[3] ].get(info[0], zoom, x, y)
+
+            if payload is not None:
+                return payload
+
+        payload = IMAGE_STORAGES[ info[3] ].get(info[0], zoom, x, y)
+
+        # tile of a lazy zoom not rendered yet
+        if payload is None and is_lazy(zoom, info[4], info[5]):
+            payload = ImageLayer.__render_imagetile__(info, zoom, x, y)
+
+        return encode_tile(payload, frmt, info[7])
+
+    @staticmethod
+    def __render_imagetile__(info : tuple(), zoom : int, x : int, y : int) -> bytes:
+
+        """ Render a tile from sources, written in storage in background. None if no source under tile """
+
+        layer = ImageLayer.objects.filter(pk=info[0]).first()
+
+        if layer is None:
+            return None
+
+        # a layer imported from a MBTiles file has no source
+        if not layer.imagelayer_file:
+            return None
+
+        paths = get_sources( layer.imagelayer_file.path, get_source_dir('image', info[0]) )
+        tile  = render_imagetile(paths, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, zoom, x, y)
+
+        if tile is None:
+            return None
+
+        # a packed layer is read-only, its lazy tiles are rendered on each request
+        if info[3] != ARCHIVE_STORAGE:
+            sync = IMAGE_TILE_FLIGHT.is_shared()
+            IMAGE_LAZY_WRITER.push( (info[0], info[1]), layer.__create_imagetiles_batch__, tile, sync )
+
+        return tile[3].getvalue()
+
+    @staticmethod
+    def get_coverage(info : tuple()) -> object:
+
+        """ Get TileCoverage of ImageLayer by (id, update timestamp, ...), loaded once by version, None if not built """
+
+        loader = lambda x: ImageLayer.objects.filter(pk=x).values_list('imagelayer_coverage', flat=True).first()
+
+        return IMAGE_COVERAGE_INDEX.get( info[0], info[1], loader )
+
+    def __build_coverage__(self) -> None:
+
+        """ Build coverage from rendered tiles, zoom by zoom """
+
+        storage  = self.get_storage()
+        tiles    = { zoom : storage.list_tiles(self.imagelayer_id, zoom)
+                     for zoom in range(self.imagelayer_minz, self.imagelayer_maxz + 1) }
+
+        self.imagelayer_coverage = TileCoverage.build( tiles ).dumps()
+
+    @staticmethod
+    def get_id(name : str) -> int:
+
+        """ Get ImageLayer id by name, resolution is cached """
+
+        info = ImageLayer.get_info( name )
+
+        return None if info is None else info[0]
 
     def get_tile(self : object, z : int, x : int, y : int) -> object:
         """ Get ImageTile by Zomm, X, Y"""
         return ImageTile.get(self, z, x, y)
 
+    def export_mbtiles(self : object, path : str, batch_size : int = MBTILES_BATCH_SIZE) -> dict():
+
+        """ Export tiles in a MBTiles file, tiles are streamed by batch. Return throughput report """
+
+        tiles    = self.get_storage().iter_tiles( self.imagelayer_id )
+        metadata = make_metadata(self.imagelayer_name, self.geom, self.imagelayer_minz, self.imagelayer_maxz)
+
+        return export_tiles(tiles, path, metadata, batch_size)
+
+    def __pack_tiles__(self : object) -> dict():
+
+        """ Pack tiles of the storage backend of layer in its read-only archive. Return report """
+
+        tiles = self.get_storage().iter_tiles( self.imagelayer_id )
+        stats = IMAGE_STORAGES[ ARCHIVE_STORAGE ].pack(self.imagelayer_id, tiles)
+
+        # formats encoded at tiling are packed in their own archive
+        for frmt in parse_formats( self.imagelayer_formats ):
+            storages = IMAGE_ENCODED_STORAGES[ frmt ]
+            encoded  = storages[ self.imagelayer_storage ].iter_tiles( self.imagelayer_id )
+            storages[ ARCHIVE_STORAGE ].pack(self.imagelayer_id, encoded)
+
+        return stats
+
+    def pack_archive(self : object) -> dict():
+
+        """ Pack tiles in a read-only archive & serve the layer from it. Return report """
+
+        stats = self.__pack_tiles__()
+
+        # serve from archive without tiling again, tiles & validators are unchanged. The storage backend is kept : a
+        # new tiling writes in it, then packs again
+        self.imagelayer_packed = True
+        ImageLayer.objects.filter(pk=self.pk).update( imagelayer_packed=True )
 
-    def __create_imagetile__(self, zoom : int, x : int, y : int, buffer) -> None:
+        # drop cached tiles & name of layer
+        self.__drop_cache__()
 
-        ImageTile.objects.create(
-            imagetile_x=x,
-            imagetile_y=y,
-            imagetile_zoom=zoom,
-            imagetile_layer=self,
-            image=buffer.getvalue()
+        return stats
+
+    @staticmethod
+    def import_mbtiles(path : str, name : str = None, batch_size : int = MBTILES_BATCH_SIZE,
+                       storage : str = None) -> (object, dict()):
+
+        """
+        Import a MBTiles file as a new ImageLayer, tiles are written by batch (jpg & webp are converted to png). Return
+        layer & throughput report
+        """
+
+        with MBTilesReader( path ) as reader:
+            metadata   = reader.get_metadata()
+            minz, maxz = reader.zooms()
+
+        # tiles are converted to png, raise ValueError before creating the layer if they are not images
+        get_metadata_format( metadata )
+
+        layer = ImageLayer(
+            imagelayer_name    = name or metadata.get( 'name', path ),
+            imagelayer_minz    = 0  if minz is None else minz,
+            imagelayer_maxz    = 18 if maxz is None else maxz,
+            imagelayer_storage = storage or get_default_storage(),
+            geom               = get_metadata_geom( metadata )
         )
 
-    def __start_imagetiles_creation__(self, *args, **kwargs ) -> None:
-        _job = Thread(target=self.__create_imagetiles__, args=args, kwargs=kwargs).start()
+        # insert without save, there is no source to tile
+        ImageLayer.objects.bulk_create([ layer ])
 
-    def __create_imagetiles__(self, *args, **kwargs):
+        push  = lambda tiles: layer.__create_imagetiles_batch__([ (z, x, y, BytesIO( data )) for z, x, y, data in tiles ])
+        stats = import_tiles(path, push, batch_size)
 
-        if self.imagelayer_file.path.split('.')[ -1 ] == 'tif':
+        # encode formats of layer (none by default)
+        layer.__encode_tiles__()
 
-            # create tiles for one image
-            seconds, polygon = self.__create_imagetiles_one__( self.imagelayer_file.path, *args, **kwargs )
+        # update layer
+        layer.imagelayer_available = True
+        layer.imagelayer_updt      = timezone.now()
+        layer.__build_coverage__()
 
-            # update layer
-            self.geom                 = MultiPolygon([ polygon ])
-            self.imagelayer_available = True
+        fields = [ 'imagelayer_available', 'imagelayer_updt', 'imagelayer_coverage' ]
+        ImageLayer.objects.filter(pk=layer.pk).update( **{ field : getattr(layer, field) for field in fields } )
 
-            # override again
-            super(ImageLayer, self).save(*args, **kwargs)
+        # drop cached tiles & name of layer
+        layer.__drop_cache__()
 
-        elif self.imagelayer_file.path.split('.')[ -1 ] == 'zip':
+        return layer, stats
+
+
+    def __create_imagetiles_batch__(self, tiles : list()) -> None:
+
+        # write payloads in storage backend
+        payloads = [ (zoom, x, y, buffer.getvalue()) for zoom, x, y, buffer in tiles ]
+
+        self.get_storage().put_many(self.imagelayer_id, payloads)
+
+    def __get_imagetile__(self, zoom : int, x : int, y : int) -> bytes:
+
+        return self.get_storage().get(self.imagelayer_id, zoom, x, y)
 
-            # data
-            m_polyset = []
-            seconds   = 0
+    def make_tiles(self : object, generation : int = None) -> None:
 
-            # unzip file
-            for path in unzip(self.imagelayer_file.path, '/tmp'):
+        """ Tile layer (run by the tiling job of the layer, generation of the job keys its written units) """
 
-                # create tiles for one image
-                second, polygon = self.__create_imagetiles_one__(path, *args, **kwargs)
-                print( polygon )
+        # a layer imported from a MBTiles file has no source to tile
+        if not self.imagelayer_file:
+            return
 
-                # update data
-                seconds += second
-                m_polyset.append( polygon )
+        self.__create_imagetiles__( generation )
 
-            # update layer
-            self.geom = MultiPolygon( m_polyset )
-            self.imagelayer_available = True
+    def __create_imagetiles__(self, generation : int) -> None:
 
-            print( seconds )
+        # resume a stopped tiling (its written units are kept), else remove tiles of a previous tiling
+        if not TilingUnit.exists( generation ):
+            self.__delete_tiles__()
 
-            # override again
-            super(ImageLayer, self).save(*args, **kwargs)
+        # progress of the job, saved on the layer row
+        progress = TilingProgress( self.__save_progress__ )
+        progress.save()
 
+        # get images, the tif or the tifs of the zip
+        if self.imagelayer_file.path.split('.')[ -1 ] == 'tif':
+            paths = [ self.imagelayer_file.path ]
+
+        elif self.imagelayer_file.path.split('.')[ -1 ] == 'zip':
+            paths = extract_sources(self.imagelayer_file.path, get_source_dir('image', self.imagelayer_id))
 
         else:
             assert False
 
-    def __create_imagetiles_one__(self, image_path, *args, **kwargs):
+        try:
+
+            # create tiles for each image
+            polyset = [ self.__create_imagetiles_one__(path, progress, generation) for path in paths ]
+
+            # then, encode formats of layer from the png pyramid
+            with progress.stage( 'encode' ):
+                self.__encode_tiles__()
+
+            # a packed layer is packed again from the new pyramid
+            if self.imagelayer_packed:
+                with progress.stage( 'write' ):
+                    self.__pack_tiles__()
+
+        except Exception as error:
+            progress.finish( error )
+            raise
+
+        # update layer
+        self.geom = MultiPolygon( polyset )
+        self.imagelayer_available = True
+        self.__build_coverage__()
+
+        # pyramid is complete, nothing to resume
+        TilingUnit.clear( 'image', self.imagelayer_id )
+
+        progress.finish()
 
-        # get time at start
-        start_time = time.time()
+        # write only tiling fields, the layer may have been edited during the tiling (a save would revert the edits)
+        self.imagelayer_updt = timezone.now()
+
+        ImageLayer.objects.filter(pk=self.pk).update( geom=self.geom, imagelayer_available=True,
+                                                      imagelayer_coverage=self.imagelayer_coverage,
+                                                      imagelayer_updt=self.imagelayer_updt )
+
+    def __create_imagetiles_one__(self, image_path : str, progress : TilingProgress, generation : int = None) -> object:
 
         # first, reprojected raster to WEB_MERCATOR SRID
-        reprojected_raster(image_path, image_path, dst_crs=WEB_MERCATOR_SRID)
+        with progress.stage( 'reproject' ):
+            reprojected_raster(image_path, image_path, dst_crs=WEB_MERCATOR_SRID)
 
         # get raster extent as polygon
         polygon   = get_raster_extent( image_path )
 
-        # get min & max zoom
-        minZ = self.imagelayer_minz
-        maxZ = self.imagelayer_maxz
+        # get min & max zoom, zooms above eager max zoom are rendered on request
+        eager = get_eager_zoom(self.imagelayer_minz, self.imagelayer_maxz, self.imagelayer_eagerz)
+        minZ  = self.imagelayer_minz
+        maxZ  = self.imagelayer_maxz if eager is None else eager
+
+        # tiles are written by batch
+        sink = TileSink( self.__create_imagetiles_batch__ )
+
+        # written units, by image of the layer & tiling (none out of a tiling job)
+        source     = os.path.basename( image_path )
+        checkpoint = None if generation is None else UnitCheckpoint('image', self.imagelayer_id, generation, source)
 
         # then, make image tiles
-        make_imagetiles(
-            image_path ,
-            WEB_MERCATOR_WORLD_SIZE   ,
-            WEB_MERCATOR_TILE_SIZE    ,
-            minZ                      ,
-            maxZ                      ,
-            self.__create_imagetile__
-        )
+        try:
+
+            make_imagetiles(
+                image_path ,
+                WEB_MERCATOR_WORLD_SIZE   ,
+                WEB_MERCATOR_TILE_SIZE    ,
+                minZ                      ,
+                maxZ                      ,
+                sink                      ,
+                pull_from_db_fun = self.__get_imagetile__,
+                metatile         = self.imagelayer_metatile,
+                progress         = progress,
+                checkpoint       = checkpoint
+            )
+
+        finally:
+            sink.close()
+
+        # return polygon
+        return polygon
+
+    def __save_progress__(self, report : dict()) -> None:
+
+        """ Save progress of the tiling job on the layer row (update_fields of a save would touch imagelayer_updt) """
 
-        # get time at end
-        end_time = time.time()
-        total_time = end_time - start_time
+        self.imagelayer_progress = json.dumps( report )
 
-        # return time & polygon
-        return total_time, polygon
+        ImageLayer.objects.filter(pk=self.pk).update( imagelayer_progress=self.imagelayer_progress )
+
+    def get_progress(self) -> dict():
+
+        """ Get progress of the last tiling job (see TilingProgress.report), None if never tiled """
+
+        return None if self.imagelayer_progress is None else json.loads( self.imagelayer_progress )
+
+    def end_progress(self, state : str, error : str = None) -> None:
+
+        """ End progress of a tiling job stopped before saving its final progress (see end_report) """
+
+        report = end_report(self.get_progress(), state, error)
+
+        if report is not None:
+            self.__save_progress__( report )
 
     def __str__(self):
         return "%s" % self.imagelayer_name
@@ -149,6 +499,7 @@ class ImageTile(models.Model):
 
     class Meta:
         verbose_name_plural = 'Image Tiles'
+        unique_together     = ( ( 'imagetile_layer', 'imagetile_zoom', 'imagetile_x', 'imagetile_y' ), )
 
     imagetile_id    = models.AutoField(primary_key=True)
     imagetile_x     = models.IntegerField(null=True, verbose_name="X")
@@ -182,3 +533,108 @@ class ImageTile(models.Model):
 
         # return value
         return tile
+
+    @staticmethod
+    def get_image(imagelayer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        """ Get image tile payload by imagelayer id, X, Y, Zoom with one indexed query, None if tile not exist """
+
+        # create params
+        params = { 'imagetile_layer_id' : imagelayer_id, 'imagetile_zoom' : zoom, 'imagetile_x' : x, 'imagetile_y' : y }
+
+        # select payload only
+        images = ImageTile.objects.filter( **params ).values_list( 'image', flat=True )[ :1 ]
+
+        for image in images:
+            return None if image is None else bytes( image )
+
+        return None
+
+
+
+# Image tile storage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ImageTileStorage(TileStorage):
+
+    """ PostGIS backend : tiles are ImageTile rows """
+
+    @staticmethod
+    def __params__(layer_id : int, zoom : int, x : int, y : int) -> dict():
+        return { 'imagetile_layer_id' : layer_id, 'imagetile_zoom' : zoom, 'imagetile_x' : x, 'imagetile_y' : y }
+
+    def __put__(self, layer_id : int, zoom : int, x : int, y : int, payload : bytes) -> None:
+
+        """ Create a tile, merge it with the stored one if it already exist """
+
+        params = self.__params__(layer_id, zoom, x, y)
+
+        try:
+
+            with transaction.atomic():
+                ImageTile.objects.create( image=payload, **params )
+
+        except IntegrityError:
+
+            # tile shared with another image of the layer, merge them
+            imagetile       = ImageTile.objects.get( **params )
+            imagetile.image = __merge_png__( bytes( imagetile.image ), payload )
+            imagetile.save( update_fields=[ 'image' ] )
+
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        return ImageTile.get_image(layer_id, zoom, x, y)
+
+    def put_many(self, layer_id : int, tiles : list()) -> None:
+
+        # make objects
+        objects  = [ ImageTile( image=payload, **self.__params__(layer_id, zoom, x, y) )
+                     for zoom, x, y, payload in tiles ]
+
+        # tiles shared with another image of the layer, create them one by one
+        fallback = lambda: [ self.__put__(layer_id, *tile) for tile in tiles ]
+
+        bulk_write( objects, fallback )
+
+    def delete_layer(self, layer_id : int) -> None:
+
+        ImageTile.objects.filter(imagetile_layer_id=layer_id).delete()
+
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        queryset = ImageTile.objects.filter(imagetile_layer_id=layer_id)
+        existing = set()
+
+        # one query by zoom
+        for zoom in set( tile[0] for tile in tiles ):
+            xy        = [ (x, y) for z, x, y in tiles if z == zoom ]
+            rows      = queryset.filter(imagetile_zoom=zoom, imagetile_x__in=set( x for x, _ in xy ),
+                                        imagetile_y__in=set( y for _, y in xy ))
+            existing |= set( (zoom, x, y) for x, y in rows.values_list('imagetile_x', 'imagetile_y') )
+
+        return [ tuple( tile ) in existing for tile in tiles ]
+
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        queryset = ImageTile.objects.filter(imagetile_layer_id=layer_id, imagetile_zoom=zoom)
+
+        return queryset.values_list('imagetile_x', 'imagetile_y').iterator()
+
+    def iter_tiles(self, layer_id : int) -> object:
+
+        params   = ( 'imagetile_zoom', 'imagetile_x', 'imagetile_y', 'image' )
+        queryset = ImageTile.objects.filter(imagetile_layer_id=layer_id).exclude(image=None).values_list( *params )
+
+        for zoom, x, y, image in queryset.iterator():
+            yield zoom, x, y, bytes( image )
+
+# storage backends of image layers
+IMAGE_STORAGES = {
+    'postgis'    : ImageTileStorage(),
+    'filesystem' : FileSystemStorage( 'image' ),
+    'mbtiles'    : SQLiteStorage( 'image' ),
+    'archive'    : ArchiveStorage( 'image' )
+}
+
+# storage backends of formats encoded at tiling, by format then backend of layer
+IMAGE_ENCODED_STORAGES = make_encoded_storages( 'image' )
@@ -0,0 +1,336 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from    django.contrib.gis.db   import models
+from    django.db               import transaction, IntegrityError
+from    django.db.models        import Exists, OuterRef
+from    django.conf             import settings
+from    django.utils            import timezone
+from    tmsapp.constant         import *
+from    tmsapp.utils.progress   import TilingCheckpoint
+from    datetime                import timedelta
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# kinds of tiling job, by kind of layer
+JOB_KINDS  = ( 'image', 'raster' )
+
+# states of a tiling job
+JOB_STATES = ( 'queued', 'running', 'done', 'failed', 'cancelled' )
+
+# get number of attempts of a job
+def get_job_attempts() -> int:
+
+    """ Get number of attempts of a tiling job (settings.TMS_TILING_JOB_ATTEMPTS) """
+
+    return max( 1, getattr(settings, 'TMS_TILING_JOB_ATTEMPTS', TILING_JOB_ATTEMPTS) )
+
+# get timeout of a running job
+def get_job_timeout() -> int:
+
+    """ Get seconds without heartbeat before a running job is lost (settings.TMS_TILING_JOB_TIMEOUT) """
+
+    return getattr(settings, 'TMS_TILING_JOB_TIMEOUT', TILING_JOB_TIMEOUT)
+
+
+
+# Tiling job
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingJob(models.Model):
+
+    """
+    Tiling of a layer, run by a worker (manage.py tilingworker) out of the processes serving tiles.
+    Workers claim queued jobs with SELECT ... FOR UPDATE SKIP LOCKED, beat while running & stop cancelled jobs.
+    A failed or lost job (no heartbeat) is queued again until its attempts are exhausted.
+    """
+
+    class Meta:
+        verbose_name_plural = 'Tiling Jobs'
+
+    tilingjob_id        = models.AutoField(primary_key=True)
+    tilingjob_kind      = models.CharField(max_length=20, choices=[ (x, x) for x in JOB_KINDS ], verbose_name='Kind')
+    tilingjob_layer     = models.IntegerField(verbose_name='Layer id')
+
+    # tiling the job belongs to : id of the job, or of the resumed one (kept across retries & requeues)
+    tilingjob_generation = models.IntegerField(null=True, db_index=True, verbose_name='Generation')
+    tilingjob_state     = models.CharField(max_length=20, choices=[ (x, x) for x in JOB_STATES ], default='queued',
+                                           db_index=True, verbose_name='State')
+    tilingjob_attempts  = models.IntegerField(default=0, verbose_name='Attempts')
+    tilingjob_max       = models.IntegerField(default=get_job_attempts, verbose_name='Max attempts')
+    tilingjob_cancel    = models.BooleanField(default=False, verbose_name='Cancel requested')
+    tilingjob_worker    = models.CharField(max_length=200, null=True, blank=True, verbose_name='Worker')
+    tilingjob_heartbeat = models.DateTimeField(null=True, blank=True, verbose_name='Heartbeat')
+    tilingjob_crea      = models.DateTimeField(auto_now_add=True, verbose_name='Creation')
+    tilingjob_start     = models.DateTimeField(null=True, blank=True, verbose_name='Start')
+    tilingjob_end       = models.DateTimeField(null=True, blank=True, verbose_name='End')
+    tilingjob_error     = models.TextField(null=True, blank=True, verbose_name='Error')
+
+    @staticmethod
+    def submit(kind : str, layer_id : int, resume : bool = False) -> object:
+
+        """
+        Queue tiling of a layer, previous jobs of the layer are cancelled. A new tiling starts from scratch in a new
+        generation, a resumed one keeps the generation of the previous tiling & skips its written units (see
+        TilingUnit). Units marked late by a cancelled job stay in its generation.
+        """
+
+        assert kind in JOB_KINDS
+
+        with transaction.atomic():
+
+            TilingJob.cancel(kind, layer_id)
+
+            jobs       = TilingJob.objects.filter( tilingjob_kind=kind, tilingjob_layer=layer_id )
+            generation = jobs.order_by( '-tilingjob_id' ).values_list( 'tilingjob_generation', flat=True ).first()
+
+            if not resume:
+                TilingUnit.clear(kind, layer_id)
+                generation = None
+
+            job = TilingJob.objects.create( tilingjob_kind=kind, tilingjob_layer=layer_id,
+                                            tilingjob_generation=generation )
+
+            # a new tiling
+            if job.tilingjob_generation is None:
+                job.tilingjob_generation = job.pk
+                TilingJob.objects.filter( pk=job.pk ).update( tilingjob_generation=job.pk )
+
+            return job
+
+    @staticmethod
+    def cancel(kind : str, layer_id : int) -> None:
+
+        """ Cancel jobs of a layer : queued ones at once, running ones by their worker """
+
+        jobs = TilingJob.objects.filter( tilingjob_kind=kind, tilingjob_layer=layer_id )
+
+        jobs.filter( tilingjob_state='queued' ).update( tilingjob_state='cancelled', tilingjob_end=timezone.now() )
+        jobs.filter( tilingjob_state='running' ).update( tilingjob_cancel=True )
+
+    @staticmethod
+    def claim(worker : str) -> object:
+
+        """
+        Claim the oldest queued job for worker, None if no job. Jobs locked by other workers are skipped, so are jobs
+        of a layer whose previous job is still running (cancelled, until its worker stops it)
+        """
+
+        running = TilingJob.objects.filter( tilingjob_state='running', tilingjob_kind=OuterRef( 'tilingjob_kind' ),
+                                            tilingjob_layer=OuterRef( 'tilingjob_layer' ) )
+
+        with transaction.atomic():
+
+            queued = TilingJob.objects.select_for_update( skip_locked=True ).filter( tilingjob_state='queued' )
+            job    = queued.filter( ~Exists( running ) ).order_by( 'tilingjob_id' ).first()
+
+            if job is None:
+                return None
+
+            now = timezone.now()
+
+            job.tilingjob_state     = 'running'
+            job.tilingjob_worker    = worker
+            job.tilingjob_heartbeat = now
+            job.tilingjob_start     = now
+            job.tilingjob_attempts += 1
+            job.tilingjob_error     = None
+            job.save()
+
+            return job
+
+    @staticmethod
+    def requeue_lost() -> int:
+
+        """ Queue again running jobs without heartbeat since the timeout (worker died). Return number of jobs """
+
+        limit = timezone.now() - timedelta( seconds=get_job_timeout() )
+        count = 0
+
+        with transaction.atomic():
+
+            lost = TilingJob.objects.select_for_update( skip_locked=True ).filter( tilingjob_state='running',
+                                                                                   tilingjob_heartbeat__lt=limit )
+
+            for job in lost:
+                job.finish( 'lost : no heartbeat since %s' % job.tilingjob_heartbeat )
+                count += 1
+
+        return count
+
+    def beat(self : object) -> bool:
+
+        """ Save heartbeat of a running job. Return True if the job must stop (cancelled, or claimed again) """
+
+        params = { 'pk' : self.pk, 'tilingjob_state' : 'running', 'tilingjob_worker' : self.tilingjob_worker }
+        rows   = TilingJob.objects.filter( **params )
+
+        rows.update( tilingjob_heartbeat=timezone.now() )
+
+        return not rows.filter( tilingjob_cancel=False ).exists()
+
+    def __lock__(self : object) -> object:
+
+        """ Lock row of the job (in a transaction) while it runs for its worker, None if not (lost job claimed again) """
+
+        params = { 'pk' : self.pk, 'tilingjob_state' : 'running', 'tilingjob_worker' : self.tilingjob_worker }
+        fields = ( 'tilingjob_attempts', 'tilingjob_max', 'tilingjob_cancel' )
+
+        return TilingJob.objects.select_for_update().filter( **params ).only( *fields ).first()
+
+    def release(self : object) -> None:
+
+        """ Queue a running job again without counting the attempt (worker stopped) """
+
+        with transaction.atomic():
+
+            row = self.__lock__()
+
+            if row is None:
+                return
+
+            # progress of the stopped job, before the job can be claimed again
+            self.__end_progress__( 'cancelled' )
+
+            self.tilingjob_state     = 'queued'
+            self.tilingjob_attempts  = row.tilingjob_attempts - 1
+            self.tilingjob_heartbeat = None
+            self.save( update_fields=[ 'tilingjob_state', 'tilingjob_attempts', 'tilingjob_heartbeat' ] )
+
+    def finish(self : object, error : str = None) -> None:
+
+        """ End a running job : done, cancelled, or failed (queued again while attempts remain) """
+
+        with transaction.atomic():
+
+            row = self.__lock__()
+
+            if row is None:
+                return
+
+            self.tilingjob_cancel = row.tilingjob_cancel
+
+            if row.tilingjob_cancel:
+                self.tilingjob_state = 'cancelled'
+
+            elif error is None:
+                self.tilingjob_state = 'done'
+
+            else:
+                self.tilingjob_state = 'queued' if row.tilingjob_attempts < row.tilingjob_max else 'failed'
+
+            # progress of a job not done (killed, cancelled or lost), before the job can be claimed again
+            if self.tilingjob_state != 'done':
+                self.__end_progress__( 'cancelled' if self.tilingjob_state == 'cancelled' else 'failed', error )
+
+            self.tilingjob_error     = error
+            self.tilingjob_heartbeat = None
+            self.tilingjob_end       = None if self.tilingjob_state == 'queued' else timezone.now()
+            self.save( update_fields=[ 'tilingjob_state', 'tilingjob_error', 'tilingjob_heartbeat', 'tilingjob_end' ] )
+
+    def __end_progress__(self : object, state : str, error : str = None) -> None:
+
+        """ End progress of layer left 'running' by the job process (see end_report) """
+
+        layer = self.get_layer()
+
+        if layer is not None:
+            layer.end_progress(state, error)
+
+    def get_layer(self : object) -> object:
+
+        """ Get layer to tile, None if it was deleted """
+
+        from .image  import ImageLayer
+        from .raster import RasterLayer
+
+        model = ImageLayer if self.tilingjob_kind == 'image' else RasterLayer
+
+        return model.objects.filter( pk=self.tilingjob_layer ).first()
+
+    def __str__(self):
+        return "%s %s #%d (%s)" % (self.tilingjob_kind, self.tilingjob_layer, self.tilingjob_id, self.tilingjob_state)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+
+# Tiling checkpoint
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingUnit(models.Model):
+
+    """ A work unit (zoom, quadrant) of a source of a layer, written by a tiling (generation) of the layer """
+
+    class Meta:
+        verbose_name_plural = 'Tiling Units'
+        unique_together     = ( 'tilingunit_generation', 'tilingunit_source', 'tilingunit_zoom', 'tilingunit_xmin',
+                                'tilingunit_ymin' )
+        index_together      = ( 'tilingunit_generation', 'tilingunit_source' )
+
+    tilingunit_id     = models.AutoField(primary_key=True)
+    tilingunit_kind   = models.CharField(max_length=20, choices=[ (x, x) for x in JOB_KINDS ], verbose_name='Kind')
+    tilingunit_layer  = models.IntegerField(verbose_name='Layer id')
+
+    # generation of the tiling (see TilingJob), units of other tilings of the layer are ignored
+    tilingunit_generation = models.IntegerField(verbose_name='Generation')
+    tilingunit_source = models.CharField(max_length=255, verbose_name='Source')
+    tilingunit_zoom   = models.IntegerField(verbose_name='Zoom')
+    tilingunit_xmin   = models.IntegerField()
+    tilingunit_ymin   = models.IntegerField()
+    tilingunit_xmax   = models.IntegerField()
+    tilingunit_ymax   = models.IntegerField()
+    tilingunit_tiles  = models.IntegerField(verbose_name='Tiles')
+
+    @staticmethod
+    def exists(generation : int) -> bool:
+
+        """ Test if a tiling was stopped after writing units (it can be resumed) """
+
+        return generation is not None and TilingUnit.objects.filter( tilingunit_generation=generation ).exists()
+
+    @staticmethod
+    def clear(kind : str, layer_id : int) -> None:
+
+        """ Forget written units of a layer (tiling done, or started again from scratch) """
+
+        TilingUnit.objects.filter( tilingunit_kind=kind, tilingunit_layer=layer_id ).delete()
+
+class UnitCheckpoint(TilingCheckpoint):
+
+    """ Written units of a source of a layer by a tiling (generation), in the TilingUnit table """
+
+    def __init__(self, kind : str, layer_id : int, generation : int, source : str):
+
+        self.params = { 'tilingunit_kind' : kind, 'tilingunit_layer' : layer_id, 'tilingunit_source' : source,
+                        'tilingunit_generation' : generation }
+
+    def load(self) -> dict():
+
+        fields = ( 'tilingunit_zoom', 'tilingunit_xmin', 'tilingunit_ymin', 'tilingunit_xmax', 'tilingunit_ymax',
+                   'tilingunit_tiles' )
+        params = { 'tilingunit_generation' : self.params[ 'tilingunit_generation' ],
+                   'tilingunit_source'     : self.params[ 'tilingunit_source' ] }
+        rows   = TilingUnit.objects.filter( **params ).values_list( *fields )
+
+        return { ( zoom, (xmin, ymin, xmax, ymax) ) : tiles for zoom, xmin, ymin, xmax, ymax, tiles in rows }
+
+    def mark(self, zoom : int, quadrant : tuple(), tiles : int) -> None:
+
+        xmin, ymin, xmax, ymax = quadrant
+
+        try:
+
+            with transaction.atomic():
+                TilingUnit.objects.create( tilingunit_zoom=zoom, tilingunit_xmin=xmin, tilingunit_ymin=ymin,
+                                           tilingunit_xmax=xmax, tilingunit_ymax=ymax, tilingunit_tiles=tiles,
+                                           **self.params )
+
+        # unit written again (a retried unit)
+        except IntegrityError:
+            pass
+
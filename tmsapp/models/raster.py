@@ -2,18 +2,39 @@
 #-----------------------------------------------------------------------------------------------------------------------
 
 from    django.contrib.gis.db   import models
-from    django.db               import connection
+from    django.db               import transaction, IntegrityError
 from    tmsapp.utils            import *
-from    tmsapp.constant         import WEB_MERCATOR_SRID, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE
+from    tmsapp.utils            import __bands_to_png__, __merge_png__, __merge_rasters__, __make_rastertile_from_bands__
+from    tmsapp.constant         import WEB_MERCATOR_SRID, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, TILE_MAX_AGE
+from    tmsapp.utils.cache      import RASTER_TILE_CACHE, RASTER_LAYER_INDEX, MISSING
+from    tmsapp.utils.sink       import TileSink, bulk_write
+from    tmsapp.utils.coverage   import TileCoverage, RASTER_COVERAGE_INDEX
+from    tmsapp.utils.lazy       import RASTER_LAZY_WRITER
+from    tmsapp.utils.progress   import TilingProgress, end_report
+from    .job                    import TilingJob, TilingUnit, UnitCheckpoint
+from    .encoded                import make_encoded_storages
+from    tmsapp.utils.mbtiles    import MBTilesReader, make_metadata, get_metadata_geom, export_tiles, import_tiles
+from    tmsapp.utils.mbtiles    import get_metadata_format
+from    tmsapp.utils.storage    import TileStorage, FileSystemStorage, SQLiteStorage, ArchiveStorage
+from    tmsapp.utils.storage    import STORAGES, ARCHIVE_STORAGE, get_default_storage
+from    tmsapp.utils.encoding   import encode_tile, encode_variants, parse_formats, validate_formats, get_tile_quality
+from    tmsapp.utils.style      import RasterStyle, RASTER_STYLE_INDEX, STRETCHES, compute_stats, get_raster_stretch
+from    tmsapp.utils.style      import get_colormaps
+from    tmsapp.utils.identify   import RASTER_ARRAY_CACHE
+from    tmsapp.utils.flight     import RASTER_TILE_FLIGHT
+from    tmsapp.constant         import MBTILES_BATCH_SIZE
 from    django.contrib.gis.geos import MultiPolygon
-from    threading               import Thread
+from    django.utils            import timezone
 from    zipfile                 import ZipFile
+from    tempfile                import TemporaryDirectory
 
 import rasterio as rio
 import numpy    as np
+import json
+import shutil
+import os
 from PIL import Image
 from io import BytesIO
-import os
 
 
 
@@ -90,15 +111,25 @@ def __check_raster__(path : str) -> None:
         raise NotValidRasterException
 
 # Check raster
-def __check_rasters__(path : str) -> list():
+def __check_rasters__(path : str, dst : str = None) -> list():
 
-    """ Check if path is valid list of raster """
+    """
+    Check if path is valid list of raster. Rasters of a zip are extracted in dst (the source directory of layer at
+    tiling), or in a temporary directory for a check only
+    """
 
     # Case zip
     if __is_zip__( path ):
 
+        # check only, sources of layer are left to the tiling
+        if dst is None:
+            with TemporaryDirectory() as tmp:
+                __liter__( extract_sources( path, tmp ), __check_raster__ )
+
+            return []
+
         # unzip file
-        paths = __unzip__( path, '/tmp' )
+        paths = extract_sources( path, dst )
 
         # check raster on all list
         __liter__( paths, __check_raster__ )
@@ -115,37 +146,108 @@ def __check_rasters__(path : str) -> list():
         # ok, return list of path
         return [ path ]
 
-# Create raster tile by layer, zoom, X pos, Y pos and buffer
-def __create_tile__(layer : object, zoom: int, x: int, y: int, buffer : object) -> object:
+# Create raster tile by layer, zoom, X pos, Y pos, buffer and encoded image
+def __create_tile__(layer : object, zoom: int, x: int, y: int, buffer : object, image : object = None) -> object:
 
     """ Shortcut for raster tile creation """
 
+    # get encoded image as bytes
+    image  = None if image is None else image.getvalue()
+
     # create parameters objects
-    kwargs = { 'rastertile_x':x, 'rastertile_y':y, 'rastertile_zoom':zoom, 'rastertile_layer':layer, 'rast':buffer }
+    kwargs = { 'rastertile_x':x, 'rastertile_y':y, 'rastertile_zoom':zoom, 'rastertile_layer':layer }
+
+    try:
+
+        # create raster tile
+        with transaction.atomic():
+            obj = RasterTile.objects.create( rast=buffer, image=image, **kwargs )
+
+    except IntegrityError:
 
-    # create raster tile
-    obj = RasterTile.objects.create( **kwargs )
+        # tile shared with another raster of the layer, merge them
+        obj       = RasterTile.objects.get( **kwargs )
+        obj.rast  = __merge_rasters__( obj.rast, buffer )
+        obj.image = image if obj.image is None or image is None else __merge_png__( bytes( obj.image ), image )
+        obj.save( update_fields=[ 'rast', 'image' ] )
 
     # return raster tile
     return obj
 
+# Create a batch of raster tiles
+def __create_tiles__(layer : object, tiles : list()) -> None:
+
+    """ Shortcut for raster tiles creation by batch """
+
+    # rasters are always rows, png are rows only with the postgis backend
+    postgis  = layer.rasterlayer_storage == 'postgis'
+    rows     = [ (zoom, x, y, buffer, image if postgis else None) for zoom, x, y, buffer, image in tiles ]
+
+    # make objects
+    objects  = [ RasterTile(rastertile_layer=layer, rastertile_zoom=zoom, rastertile_x=x, rastertile_y=y, rast=buffer,
+                            image=None if image is None else image.getvalue()) for zoom, x, y, buffer, image in rows ]
+
+    # tiles shared with another raster of the layer, create them one by one
+    fallback = lambda: [ __create_tile__(layer, *tile) for tile in rows ]
+
+    bulk_write( objects, fallback )
+
+    # write png in storage backend
+    if not postgis:
+        payloads = [ (zoom, x, y, image.getvalue()) for zoom, x, y, _, image in tiles if image is not None ]
+        layer.get_storage().put_many(layer.rasterlayer_id, payloads)
+
+# Make raster tile from png
+def __png_to_tile__(zoom : int, x : int, y : int, data : bytes) -> tuple():
+
+    """ Make (zoom, x, y, GDALRaster, png) from a png, the raster is RGB (uint8) & transparent pixels are nodata (0) """
+
+    # decode as RGBA (band, row, col)
+    rgba  = np.asarray( Image.open( BytesIO( data ) ).convert('RGBA') ).transpose(2, 0, 1)
+    bands = np.where( rgba[3] > 0, rgba[:3], 0 ).astype( np.uint8 )
+
+    zoom, x, y, gdal_raster, _ = __make_rastertile_from_bands__(bands, 0, 1, WEB_MERCATOR_WORLD_SIZE, bands.shape[1],
+                                                                zoom, x, y)
+
+    # keep the imported png as is
+    return zoom, x, y, gdal_raster, BytesIO( data )
+
+# Make png of a raster
+def __raster_to_png__(raster : object, style : RasterStyle = None) -> BytesIO:
+
+    """ Render bands of a GDALRaster as png with style (see RasterStyle) """
+
+    bands  = np.array( [ band.data() for band in raster.bands ] )
+    nodata = raster.bands[0].nodata_value
+
+    return __bands_to_png__( bands, nodata, style )
+
 # Saving layer & create tiles for all zoom
-def __save__(layer : object, *args : tuple(), **kwargs : dict()) -> None:
+def __save__(layer : object, generation : int) -> None:
 
-    # first, reprojected all rasters to WEB_MERCATOR SRID
-    for path in layer.paths:
-        reprojected_raster(path, path, dst_crs=WEB_MERCATOR_SRID)
+    # resume a stopped tiling (its written units are kept), else remove tiles of a previous tiling
+    if not TilingUnit.exists( generation ):
+        layer.__delete_tiles__()
 
-    # get image_path
-    for image_path in layer.paths:
+    # progress of the job, saved on the layer row
+    progress = TilingProgress( layer.__save_progress__ )
+    progress.save()
+
+    try:
+        __make_tiles__(layer, progress, generation)
 
-        # get min & max zoom
-        minZ = layer.rasterlayer_minz
-        maxZ = layer.rasterlayer_maxz
+        # then, encode formats of layer from the png pyramid
+        with progress.stage( 'encode' ):
+            layer.__encode_tiles__()
 
-        # then, make image tiles
-        args0 = [image_path, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, minZ, maxZ, layer.__create_tile__]
-        make_rastertiles(*args0)
+        # a packed layer is packed again from the new pyramid
+        if layer.rasterlayer_packed:
+            with progress.stage( 'write' ):
+                layer.__pack_tiles__()
+
+    except Exception as error:
+        progress.finish( error )
+        raise
 
     # get all raster extent as polygon
     polyset = [ get_raster_extent(path) for path in layer.paths]
@@ -153,43 +255,58 @@ def __save__(layer : object, *args : tuple(), **kwargs : dict()) -> None:
     # update fields
     layer.geom = MultiPolygon( polyset )
     layer.rasterlayer_available = True
+    layer.__build_coverage__()
 
-    # override
-    super(RasterLayer, layer).save(*args, **kwargs)
+    # pyramid is complete, nothing to resume
+    TilingUnit.clear( 'raster', layer.rasterlayer_id )
 
-# Create a background job
-def __create_background_job__(target, *args, **kwargs):
+    progress.finish()
 
-    """ Create an independant processus for make tiling """
+    # write only tiling fields, the layer may have been edited during the tiling (a save would revert the edits)
+    layer.rasterlayer_updt = timezone.now()
 
-    # Fork 1
-    pid = os.fork()
+    RasterLayer.objects.filter(pk=layer.pk).update( geom=layer.geom, rasterlayer_available=True,
+                                                    rasterlayer_coverage=layer.rasterlayer_coverage,
+                                                    rasterlayer_updt=layer.rasterlayer_updt )
 
-    # Child execution
-    if pid == 0:
+# Reproject rasters of layer & create their tiles
+def __make_tiles__(layer : object, progress : TilingProgress, generation : int = None) -> None:
 
-        os.setsid()
+    # first, reprojected all rasters to WEB_MERCATOR SRID
+    with progress.stage( 'reproject' ):
+        for path in layer.paths:
+            reprojected_raster(path, path, dst_crs=WEB_MERCATOR_SRID)
 
-        # Fork 2
-        pidd = os.fork()
+    # then, compute band statistics of layer, png of tiles are rendered from them
+    with progress.stage( 'read' ):
+        layer.__compute_stats__()
 
-        if pidd == 0:
+    style = layer.__make_style__()
 
-            # Make new connection to db
-            connection.connect()
+    # get image_path
+    for image_path in layer.paths:
 
-            # Start action
-            target( *args, **kwargs )
+        # get min & max zoom, zooms above eager max zoom are rendered on request
+        eager = get_eager_zoom(layer.rasterlayer_minz, layer.rasterlayer_maxz, layer.rasterlayer_eagerz)
+        minZ  = layer.rasterlayer_minz
+        maxZ  = layer.rasterlayer_maxz if eager is None else eager
 
-            # kill
-            os._exit( 0 )
+        # tiles are written by batch
+        sink  = TileSink( layer.__create_tiles__ )
 
-        else:
+        # written units, by raster of the layer & tiling (none out of a tiling job)
+        source     = os.path.basename( image_path )
+        checkpoint = None if generation is None else UnitCheckpoint('raster', layer.rasterlayer_id, generation, source)
 
-            # kill
-            os._exit( 0 )
+        # then, make image tiles
+        args0 = [image_path, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, minZ, maxZ, sink]
 
+        try:
+            make_rastertiles(*args0, pull_from_db_fun=layer.__get_tile__, metatile=layer.rasterlayer_metatile,
+                             progress=progress, checkpoint=checkpoint, style=style)
 
+        finally:
+            sink.close()
 
 # Raster Layer
 #-----------------------------------------------------------------------------------------------------------------------
@@ -201,22 +318,62 @@ class RasterLayer(models.Model):
 
     rasterlayer_id        = models.AutoField(primary_key=True)
     rasterlayer_name      = models.CharField(max_length=200, verbose_name='Name')
-    rasterlayer_file      = models.FileField(upload_to='upload-rasterlayer', verbose_name='File (.tif / .zip)')
+    rasterlayer_file      = models.FileField(upload_to='upload-rasterlayer', blank=True, null=True,
+                                             verbose_name='File (.tif / .zip)')
     rasterlayer_crs       = models.IntegerField(default=3857, editable=False, verbose_name='CRS')
     rasterlayer_minz      = models.IntegerField(default=0, verbose_name='Min zoom')
     rasterlayer_maxz      = models.IntegerField(default=18, verbose_name='Max zoom')
     rasterlayer_count     = models.IntegerField(null=True, editable=False, verbose_name='Number of band')
     rasterlayer_available = models.BooleanField(default=False, editable=False, verbose_name='Available')
     rasterlayer_crea      = models.DateTimeField(auto_now_add=True, verbose_name='Creation')
+    rasterlayer_updt      = models.DateTimeField(auto_now=True, verbose_name='Update')
+    rasterlayer_maxage    = models.IntegerField(default=TILE_MAX_AGE, verbose_name='Cache max age (s)')
+    rasterlayer_storage   = models.CharField(max_length=20, choices=[ (x, x) for x in STORAGES ],
+                                             default=get_default_storage, verbose_name='Storage')
+    rasterlayer_packed    = models.BooleanField(default=False, editable=False, verbose_name='Packed')
+    rasterlayer_metatile  = models.IntegerField(default=get_metatile, verbose_name='Metatile size')
+    rasterlayer_eagerz    = models.IntegerField(null=True, blank=True, verbose_name='Eager max zoom')
+    rasterlayer_formats   = models.CharField(max_length=50, blank=True, default='', validators=[ validate_formats ],
+                                             verbose_name='Formats encoded at tiling (webp, jpg)')
+    rasterlayer_quality   = models.IntegerField(default=get_tile_quality, verbose_name='Quality (webp, jpg)')
+    rasterlayer_stretch   = models.CharField(max_length=20, choices=[ (x, x) for x in STRETCHES ],
+                                             default=get_raster_stretch, verbose_name='Stretch')
+    rasterlayer_colormap  = models.CharField(max_length=50, blank=True, default='', verbose_name='Colormap (single band)',
+                                             choices=[ ('', 'none') ] + [ (x, x) for x in get_colormaps() ])
+
+    # band statistics & histograms as JSON (see compute_stats), computed at tiling
+    rasterlayer_stats     = models.TextField(null=True, editable=False)
 
     geom                  = models.MultiPolygonField(srid=3857, editable=False, null=True)
 
+    # serialized TileCoverage, built when the pyramid is finished
+    rasterlayer_coverage  = models.BinaryField(null=True, editable=False)
+
+    # progress of the last tiling job as JSON (see TilingProgress.report)
+    rasterlayer_progress  = models.TextField(null=True, editable=False)
+
     # hidden method
-    def __create_tile__(self : object, zoom : int, x : int, y : int, buffer : object) -> object:
+    def __create_tile__(self : object, zoom : int, x : int, y : int, buffer : object, image : object = None) -> object:
 
         """ Create tile function """
 
-        return __create_tile__(self, zoom, x, y, buffer)
+        return __create_tile__(self, zoom, x, y, buffer, image)
+
+    # hidden method
+    def __create_tiles__(self : object, tiles : list()) -> None:
+
+        """ Create tiles by batch function """
+
+        __create_tiles__(self, tiles)
+
+    # hidden method
+    def __get_tile__(self : object, zoom : int, x : int, y : int) -> object:
+
+        """ Get GDALRaster of a tile, None if tile not exist """
+
+        params = { 'rastertile_layer':self, 'rastertile_zoom':zoom, 'rastertile_x':x, 'rastertile_y':y }
+
+        return RasterTile.objects.filter( **params ).values_list( 'rast', flat=True ).first()
 
     # hidden method
     def __save__(self : object) -> None:
@@ -225,22 +382,349 @@ class RasterLayer(models.Model):
 
         __save__( self )
 
+    # hidden method
+    def __save_progress__(self : object, report : dict()) -> None:
+
+        """ Save progress of the tiling job on the layer row (update_fields of a save would touch rasterlayer_updt) """
+
+        self.rasterlayer_progress = json.dumps( report )
+
+        RasterLayer.objects.filter(pk=self.pk).update( rasterlayer_progress=self.rasterlayer_progress )
+
+    def get_progress(self : object) -> dict():
+
+        """ Get progress of the last tiling job (see TilingProgress.report), None if never tiled """
+
+        return None if self.rasterlayer_progress is None else json.loads( self.rasterlayer_progress )
+
+    def end_progress(self, state : str, error : str = None) -> None:
+
+        """ End progress of a tiling job stopped before saving its final progress (see end_report) """
+
+        report = end_report(self.get_progress(), state, error)
+
+        if report is not None:
+            self.__save_progress__( report )
+
+    # hidden method
+    def __compute_stats__(self : object) -> None:
+
+        """ Compute band statistics of sources, saved on the layer row with the number of bands """
+
+        stats                    = compute_stats( self.paths )
+        self.rasterlayer_stats   = json.dumps( stats )
+        self.rasterlayer_count   = stats[ 'count' ]
+
+        RasterLayer.objects.filter(pk=self.pk).update( rasterlayer_stats=self.rasterlayer_stats,
+                                                       rasterlayer_count=self.rasterlayer_count )
+
+    def get_stats(self : object) -> dict():
+
+        """ Get band statistics & histograms (see compute_stats), None if never tiled """
+
+        return None if self.rasterlayer_stats is None else json.loads( self.rasterlayer_stats )
+
+    # hidden method
+    def __make_style__(self : object) -> RasterStyle:
+
+        """ Make style of layer from its fields, not cached (used at tiling) """
+
+        return RasterStyle(self.get_stats(), self.rasterlayer_stretch, self.rasterlayer_colormap)
+
+    @staticmethod
+    def get_style(layer_id : int, version : int, stretch : str = None, colormap : str = None) -> RasterStyle:
+
+        """ Get style of RasterLayer by id & update timestamp, stretch & colormap are the ones of layer when None """
+
+        def loader(pk : int) -> tuple():
+
+            params = ( 'rasterlayer_stats', 'rasterlayer_stretch', 'rasterlayer_colormap' )
+            row    = RasterLayer.objects.filter(pk=pk).values_list( *params ).first()
+
+            if row is None:
+                return None, None, None
+
+            return ( None if row[0] is None else json.loads( row[0] ), row[1], row[2] )
+
+        return RASTER_STYLE_INDEX.get(layer_id, version, stretch, colormap, loader)
+
     # override save method
     def save(self : object, *args : tuple(), **kwargs : dict()) -> None:
 
         """ Save method """
 
+        # coverage is built again with tiles
+        self.rasterlayer_coverage = None
+
         # override
         super(RasterLayer, self).save( *args, **kwargs )
 
+        # drop cached tiles & name of layer
+        self.__drop_cache__()
+
+        # a layer imported from a MBTiles file has no source to tile
+        if not self.rasterlayer_file:
+            return
+
         # check raster
-        paths = __check_rasters__( self.rasterlayer_file.path )
+        __check_rasters__( self.rasterlayer_file.path )
+
+        # queue tiling job, run by a worker (manage.py tilingworker)
+        TilingJob.submit( 'raster', self.rasterlayer_id )
+
+    def make_tiles(self : object, generation : int = None) -> None:
+
+        """ Tile layer (run by the tiling job of the layer, generation of the job keys its written units) """
+
+        # a layer imported from a MBTiles file has no source to tile
+        if not self.rasterlayer_file:
+            return
+
+        # store path, rasters of a zip are extracted in the source directory of layer
+        self.paths = __check_rasters__( self.rasterlayer_file.path, get_source_dir('raster', self.rasterlayer_id) )
+
+        __save__( self, generation )
+
+    # override delete method
+    def delete(self : object, *args : tuple(), **kwargs : dict()) -> tuple():
+
+        """ Delete method """
+
+        # drop cached tiles & name of layer
+        self.__drop_cache__()
+
+        # stop tiling of layer
+        TilingJob.cancel( 'raster', self.rasterlayer_id )
+        TilingUnit.clear( 'raster', self.rasterlayer_id )
+
+        # drop tiles of file backends & extracted sources
+        self.__delete_tiles__( archive=True )
+        shutil.rmtree(get_source_dir('raster', self.rasterlayer_id), ignore_errors=True)
+
+        return super(RasterLayer, self).delete( *args, **kwargs )
+
+    def get_storage(self : object) -> TileStorage:
+
+        """ Get storage backend of tiles png """
+
+        return RASTER_STORAGES[ self.rasterlayer_storage ]
+
+    # hidden method
+    def __delete_tiles__(self : object, archive : bool = False) -> None:
+
+        """
+        Delete tiles in all backends (backend may have changed since last tiling). Archives are kept unless archive :
+        a packed layer is served from its archive while it is tiled again, then the archive is replaced
+        """
+
+        for name, storage in RASTER_STORAGES.items():
+            if archive or name != ARCHIVE_STORAGE:
+                storage.delete_layer( self.rasterlayer_id )
+
+        for storages in RASTER_ENCODED_STORAGES.values():
+            for name, storage in storages.items():
+                if archive or name != ARCHIVE_STORAGE:
+                    storage.delete_layer( self.rasterlayer_id )
+
+    # hidden method
+    def __encode_tiles__(self : object) -> int:
+
+        """ Encode png of the pyramid in formats of layer (rasterlayer_formats). Return number of encoded tiles """
+
+        formats  = parse_formats( self.rasterlayer_formats )
+        storages = { frmt : RASTER_ENCODED_STORAGES[ frmt ][ self.rasterlayer_storage ] for frmt in formats }
+        tiles    = self.get_storage().iter_tiles( self.rasterlayer_id )
+
+        push     = lambda frmt, encoded: storages[ frmt ].put_many(self.rasterlayer_id, encoded)
+
+        return encode_variants(tiles, formats, self.rasterlayer_quality, push)
+
+    # hidden method
+    def __drop_cache__(self : object) -> None:
+
+        """ Drop cached tiles, coverage & cached name of layer (current name and previous ones) """
+
+        RASTER_COVERAGE_INDEX.drop( self.rasterlayer_id )
+        RASTER_STYLE_INDEX.drop( self.rasterlayer_id )
+
+        names = RASTER_LAYER_INDEX.drop( self.rasterlayer_id )
+
+        for name in set( names + [ self.rasterlayer_name ] ):
+            RASTER_TILE_CACHE.drop_layer( name )
+            RASTER_ARRAY_CACHE.drop_layer( name )
+
+    @staticmethod
+    def get_info(name : str) -> tuple():
+
+        """
+        Get RasterLayer (id, update, max age, storage, eager max zoom, max zoom, formats encoded at tiling, quality, min
+        zoom, number of bands) by name, resolution is cached
+        """
+
+        params = ( 'rasterlayer_id', 'rasterlayer_updt', 'rasterlayer_maxage', 'rasterlayer_storage', 'rasterlayer_minz',
+                   'rasterlayer_maxz', 'rasterlayer_eagerz', 'rasterlayer_formats', 'rasterlayer_quality',
+                   'rasterlayer_count', 'rasterlayer_packed' )
+        loader = lambda x: RasterLayer.objects.filter(rasterlayer_name=x).values_list( *params ).first()
+        info   = RASTER_LAYER_INDEX.resolve( name, loader )
+
+        if info is None:
+            return None
+
+        # a packed layer is served from its archive
+        storage = ARCHIVE_STORAGE if info[10] else info[3]
+
+        return ( info[0], int( info[1].timestamp() ), info[2], storage, get_eager_zoom( *info[4:7] ), info[5],
+                 parse_formats( info[7] ), info[8], info[4], info[9] )
+
+    @staticmethod
+    def get_image(info : tuple(), zoom : int, x : int, y : int, frmt : str = 'png', stretch : str = None,
+                  colormap : str = None) -> bytes:
+
+        """
+        Get tile image of RasterLayer by info (see get_info) in a format, tiles of lazy zooms are rendered on first
+        request. Formats not encoded at tiling are encoded from png. With a stretch or a colormap, the image is
+        rendered again from the raster of the tile.
+        """
+
+        # style of request
+        if stretch is not None or colormap is not None:
+            return encode_tile(RasterLayer.__render_style__(info, zoom, x, y, stretch, colormap), frmt, info[7])
+
+        # encoded at tiling
+        if frmt in info[6]:
+
+            payload = RASTER_ENCODED_STORAGES[ frmt ][ info[3] ].get(info[0], zoom, x, y)
+
+            if payload is not None:
+                return payload
+
+        payload = RASTER_STORAGES[ info[3] ].get(info[0], zoom, x, y)
 
-        # store path
-        self.paths = paths
+        # tile of a lazy zoom not rendered yet
+        if payload is None and is_lazy(zoom, info[4], info[5]):
+            tile    = RasterLayer.__render_tile__(info, zoom, x, y)
+            payload = None if tile is None else tile[4].getvalue()
 
-        # start saving job
-        __create_background_job__( self.__save__, *args, **kwargs )
+        return encode_tile(payload, frmt, info[7])
+
+    @staticmethod
+    def __render_style__(info : tuple(), zoom : int, x : int, y : int, stretch : str, colormap : str) -> bytes:
+
+        """ Render png of a tile from its raster with a style (see get_style), None if tile not exist """
+
+        raster = RasterTile.get_raster(info[0], zoom, x, y)
+
+        # tile of a lazy zoom not rendered yet
+        if raster is None and is_lazy(zoom, info[4], info[5]):
+            tile   = RasterLayer.__render_tile__(info, zoom, x, y)
+            raster = None if tile is None else tile[3]
+
+        if raster is None:
+            return None
+
+        return __raster_to_png__(raster, RasterLayer.get_style(info[0], info[1], stretch, colormap)).getvalue()
+
+    @staticmethod
+    def get_array(info : tuple(), name : str, zoom : int, x : int, y : int) -> tuple():
+
+        """
+        Get decoded bands (band, row, col) & nodata of a tile of RasterLayer by info (see get_info), None if tile not
+        exist. Arrays are read-only & cached by layer name, concurrent misses of a tile wait on one load.
+        """
+
+        key    = 'array::%s:%d:%d:%d:%d' % (name, info[1], zoom, x, y)
+        arrays = RASTER_ARRAY_CACHE.get( key )
+
+        if arrays is not MISSING:
+            return arrays
+
+        def load():
+
+            # cached by a previous leader while waiting the lock between processes
+            arrays = RASTER_ARRAY_CACHE.get( key )
+
+            if arrays is not MISSING:
+                return arrays
+
+            raster = RasterTile.get_raster(info[0], zoom, x, y)
+
+            # tile of a lazy zoom not rendered yet
+            if raster is None and is_lazy(zoom, info[4], info[5]):
+                tile   = RasterLayer.__render_tile__(info, zoom, x, y)
+                raster = None if tile is None else tile[3]
+
+            arrays = None
+
+            if raster is not None:
+                bands  = np.array( [ band.data() for band in raster.bands[ :info[9] ] ] )
+                bands.setflags( write=False )
+                arrays = ( bands, raster.bands[0].nodata_value )
+
+            RASTER_ARRAY_CACHE.set( name, key, arrays )
+
+            return arrays
+
+        return RASTER_TILE_FLIGHT.do( key, load )
+
+    @staticmethod
+    def __render_tile__(info : tuple(), zoom : int, x : int, y : int) -> tuple():
+
+        """
+        Render a tile (zoom, x, y, GDALRaster, png) from sources, written in database & storage in background. None if
+        no source under tile
+        """
+
+        layer = RasterLayer.objects.filter(pk=info[0]).first()
+
+        if layer is None:
+            return None
+
+        # a layer imported from a MBTiles file has no source
+        if not layer.rasterlayer_file:
+            return None
+
+        paths = get_sources( layer.rasterlayer_file.path, get_source_dir('raster', info[0]) )
+        style = RasterLayer.get_style(info[0], info[1])
+        tile  = render_rastertile(paths, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE, zoom, x, y, style)
+
+        if tile is None:
+            return None
+
+        # a packed layer is read-only, its lazy tiles are rendered on each request
+        if info[3] != ARCHIVE_STORAGE:
+            sync = RASTER_TILE_FLIGHT.is_shared()
+            RASTER_LAZY_WRITER.push( (info[0], info[1]), layer.__create_tiles__, tile, sync )
+
+        return tile
+
+    @staticmethod
+    def get_coverage(info : tuple()) -> object:
+
+        """ Get TileCoverage of RasterLayer by (id, update timestamp, ...), loaded once by version, None if not built """
+
+        loader = lambda x: RasterLayer.objects.filter(pk=x).values_list('rasterlayer_coverage', flat=True).first()
+
+        return RASTER_COVERAGE_INDEX.get( info[0], info[1], loader )
+
+    # hidden method
+    def __build_coverage__(self : object) -> None:
+
+        """ Build coverage from rendered tiles, zoom by zoom """
+
+        queryset = RasterTile.objects.filter(rastertile_layer=self)
+        tiles    = { zoom : queryset.filter(rastertile_zoom=zoom).values_list('rastertile_x', 'rastertile_y').iterator()
+                     for zoom in range(self.rasterlayer_minz, self.rasterlayer_maxz + 1) }
+
+        self.rasterlayer_coverage = TileCoverage.build( tiles ).dumps()
+
+    @staticmethod
+    def get_id(name : str) -> int:
+
+        """ Get RasterLayer id by name, resolution is cached """
+
+        info = RasterLayer.get_info( name )
+
+        return None if info is None else info[0]
 
     def get_tile(self : object, z : int, x : int, y : int) -> object:
 
@@ -248,6 +732,93 @@ class RasterLayer(models.Model):
 
         return RasterTile.get(self, z, x, y)
 
+    def export_mbtiles(self : object, path : str, batch_size : int = MBTILES_BATCH_SIZE) -> dict():
+
+        """ Export png of tiles in a MBTiles file, tiles are streamed by batch. Return throughput report """
+
+        tiles    = self.get_storage().iter_tiles( self.rasterlayer_id )
+        metadata = make_metadata(self.rasterlayer_name, self.geom, self.rasterlayer_minz, self.rasterlayer_maxz)
+
+        return export_tiles(tiles, path, metadata, batch_size)
+
+    def __pack_tiles__(self : object) -> dict():
+
+        """ Pack tiles of the storage backend of layer in its read-only archive. Return report """
+
+        tiles = self.get_storage().iter_tiles( self.rasterlayer_id )
+        stats = RASTER_STORAGES[ ARCHIVE_STORAGE ].pack(self.rasterlayer_id, tiles)
+
+        # formats encoded at tiling are packed in their own archive
+        for frmt in parse_formats( self.rasterlayer_formats ):
+            storages = RASTER_ENCODED_STORAGES[ frmt ]
+            encoded  = storages[ self.rasterlayer_storage ].iter_tiles( self.rasterlayer_id )
+            storages[ ARCHIVE_STORAGE ].pack(self.rasterlayer_id, encoded)
+
+        return stats
+
+    def pack_archive(self : object) -> dict():
+
+        """ Pack tiles in a read-only archive & serve the layer from it. Return report """
+
+        stats = self.__pack_tiles__()
+
+        # serve from archive without tiling again, tiles & validators are unchanged. The storage backend is kept : a
+        # new tiling writes in it, then packs again
+        self.rasterlayer_packed = True
+        RasterLayer.objects.filter(pk=self.pk).update( rasterlayer_packed=True )
+
+        # drop cached tiles & name of layer
+        self.__drop_cache__()
+
+        return stats
+
+    @staticmethod
+    def import_mbtiles(path : str, name : str = None, batch_size : int = MBTILES_BATCH_SIZE,
+                       storage : str = None) -> (object, dict()):
+
+        """
+        Import a MBTiles file as a new RasterLayer, tiles are written by batch. Return layer & throughput report.
+        Tiles are imported as png (jpg & webp are converted), the analytic raster of a tile is its RGB bands.
+        """
+
+        with MBTilesReader( path ) as reader:
+            metadata   = reader.get_metadata()
+            minz, maxz = reader.zooms()
+
+        # tiles are converted to png, raise ValueError before creating the layer if they are not images
+        get_metadata_format( metadata )
+
+        layer = RasterLayer(
+            rasterlayer_name    = name or metadata.get( 'name', path ),
+            rasterlayer_minz    = 0  if minz is None else minz,
+            rasterlayer_maxz    = 18 if maxz is None else maxz,
+            rasterlayer_count   = 3,
+            rasterlayer_storage = storage or get_default_storage(),
+            geom                = get_metadata_geom( metadata )
+        )
+
+        # insert without save, there is no source to tile
+        RasterLayer.objects.bulk_create([ layer ])
+
+        push  = lambda tiles: layer.__create_tiles__([ __png_to_tile__( *tile ) for tile in tiles ])
+        stats = import_tiles(path, push, batch_size)
+
+        # encode formats of layer (none by default)
+        layer.__encode_tiles__()
+
+        # update layer
+        layer.rasterlayer_available = True
+        layer.rasterlayer_updt      = timezone.now()
+        layer.__build_coverage__()
+
+        fields = [ 'rasterlayer_available', 'rasterlayer_updt', 'rasterlayer_coverage' ]
+        RasterLayer.objects.filter(pk=layer.pk).update( **{ field : getattr(layer, field) for field in fields } )
+
+        # drop cached tiles & name of layer
+        layer.__drop_cache__()
+
+        return layer, stats
+
     def __str__(self):
         return self.rasterlayer_name
 
@@ -263,6 +834,7 @@ class RasterTile(models.Model):
 
     class Meta:
         verbose_name_plural = 'Raster Tiles'
+        unique_together     = ( ( 'rastertile_layer', 'rastertile_zoom', 'rastertile_x', 'rastertile_y' ), )
 
     rastertile_id    = models.AutoField(primary_key=True)
     rastertile_x     = models.IntegerField(null=True, verbose_name='X')
@@ -273,25 +845,23 @@ class RasterTile(models.Model):
 
     rast             = models.RasterField(srid=3857)
 
+    # png encoded at tiling time, served as is
+    image            = models.BinaryField(null=True)
 
-    def to_png(self):
 
-        """ Convert raster to png """
+    def to_png(self, style : RasterStyle = None):
 
-        raster     = self.rast
-        gdal_bands = np.array( [raster.bands[x].data() for x in range(len(raster.bands))] )
-        nodata     = raster.bands[0].nodata_value
-        rgb        = np.rollaxis(gdal_bands, 0, 3)
+        """ Convert raster to png, with style of layer when not given """
 
-        a          = (( np.sum( rgb, axis=2 ) != nodata * 3 ) * 255).astype( np.uint8 )
-        p_a        = Image.fromarray( a.astype(np.uint8) , 'L' )
-        p_rgb      = Image.fromarray( rgb.astype(np.uint8) )
-        p_rgb.putalpha( p_a )
+        # already encoded
+        if self.image is not None and style is None:
+            return BytesIO( bytes( self.image ) )
 
-        buffer = BytesIO()
-        p_rgb.save(fp=buffer, format="PNG")
+        if style is None:
+            layer = self.rastertile_layer
+            style = RasterLayer.get_style(layer.rasterlayer_id, int( layer.rasterlayer_updt.timestamp() ))
 
-        return buffer
+        return __raster_to_png__( self.rast, style )
 
     def __str__(self):
         params = (self.rastertile_layer.rasterlayer_name, self.rastertile_zoom, self.rastertile_x, self.rastertile_y)
@@ -302,4 +872,132 @@ class RasterTile(models.Model):
 
     @staticmethod
     def get(rasterlayer, zoom, x, y):
-        return RasterTile.objects.filter(rastertile_layer=rasterlayer, rastertile_x=x, rastertile_y=y, rastertile_zoom=zoom).first()
\ No newline at end of file
+
+        """ Get raster tile by rasterlayer, X, Y, Zoom, the analytic raster is loaded on first access """
+
+        params = { 'rastertile_layer':rasterlayer, 'rastertile_x':x, 'rastertile_y':y, 'rastertile_zoom':zoom }
+
+        return RasterTile.objects.filter( **params ).defer( 'rast' ).first()
+
+    @staticmethod
+    def get_raster(rasterlayer_id : int, zoom : int, x : int, y : int) -> object:
+
+        """ Get GDALRaster of a tile by rasterlayer id, X, Y, Zoom, None if tile not exist """
+
+        params = { 'rastertile_layer_id':rasterlayer_id, 'rastertile_zoom':zoom, 'rastertile_x':x, 'rastertile_y':y }
+
+        return RasterTile.objects.filter( **params ).values_list( 'rast', flat=True ).first()
+
+    @staticmethod
+    def get_image(rasterlayer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        """ Get raster tile png by rasterlayer id, X, Y, Zoom with one indexed query, None if tile not exist """
+
+        params = { 'rastertile_layer_id':rasterlayer_id, 'rastertile_zoom':zoom, 'rastertile_x':x, 'rastertile_y':y }
+
+        # select payload only
+        for rastertile_id, image in RasterTile.objects.filter( **params ).values_list( 'rastertile_id', 'image' )[ :1 ]:
+
+            # tile without stored png, encode it
+            if image is None:
+                return RasterTile.objects.get( rastertile_id=rastertile_id ).to_png().getvalue()
+
+            return bytes( image )
+
+        return None
+
+
+
+# Raster tile storage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class RasterTileStorage(TileStorage):
+
+    """ PostGIS backend : png are in the image column of RasterTile rows, rows are created with their raster """
+
+    @staticmethod
+    def __params__(layer_id : int) -> dict():
+        return { 'rastertile_layer_id' : layer_id }
+
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        return RasterTile.get_image(layer_id, zoom, x, y)
+
+    def put_many(self, layer_id : int, tiles : list()) -> None:
+
+        tiles    = list( tiles )
+        queryset = RasterTile.objects.filter( **self.__params__( layer_id ) ).defer( 'rast' )
+        objects  = []
+
+        # set png of existing rows, merged with the stored one, one query by zoom & one update
+        with transaction.atomic():
+
+            for zoom in set( tile[0] for tile in tiles ):
+
+                payloads = dict()
+
+                for z, x, y, payload in tiles:
+                    if z == zoom:
+                        payloads.setdefault( (x, y), [] ).append( payload )
+
+                rows = queryset.filter(rastertile_zoom=zoom, rastertile_x__in=set( x for x, _ in payloads ),
+                                       rastertile_y__in=set( y for _, y in payloads ))
+
+                for obj in rows:
+
+                    # x & y sets cover other tiles
+                    for payload in payloads.get( (obj.rastertile_x, obj.rastertile_y), [] ):
+                        obj.image = payload if obj.image is None else __merge_png__( bytes( obj.image ), payload )
+
+                    if ( obj.rastertile_x, obj.rastertile_y ) in payloads:
+                        objects.append( obj )
+
+            RasterTile.objects.bulk_update( objects, [ 'image' ] )
+
+    def delete_layer(self, layer_id : int) -> None:
+
+        RasterTile.objects.filter( **self.__params__( layer_id ) ).delete()
+
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        queryset = RasterTile.objects.filter( **self.__params__( layer_id ) )
+        existing = set()
+
+        # one query by zoom
+        for zoom in set( tile[0] for tile in tiles ):
+            xy        = [ (x, y) for z, x, y in tiles if z == zoom ]
+            rows      = queryset.filter(rastertile_zoom=zoom, rastertile_x__in=set( x for x, _ in xy ),
+                                        rastertile_y__in=set( y for _, y in xy ))
+            existing |= set( (zoom, x, y) for x, y in rows.values_list('rastertile_x', 'rastertile_y') )
+
+        return [ tuple( tile ) in existing for tile in tiles ]
+
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        queryset = RasterTile.objects.filter( rastertile_zoom=zoom, **self.__params__( layer_id ) )
+
+        return queryset.values_list('rastertile_x', 'rastertile_y').iterator()
+
+    def iter_tiles(self, layer_id : int) -> object:
+
+        params   = ( 'rastertile_id', 'rastertile_zoom', 'rastertile_x', 'rastertile_y', 'image' )
+        queryset = RasterTile.objects.filter( **self.__params__( layer_id ) ).values_list( *params )
+
+        for pk, zoom, x, y, image in queryset.iterator():
+
+            # tile without stored png, encode it
+            if image is None:
+                image = RasterTile.objects.get( rastertile_id=pk ).to_png().getvalue()
+
+            yield zoom, x, y, bytes( image )
+
+# storage backends of png of raster layers (rasters always stay in PostGIS)
+RASTER_STORAGES = {
+    'postgis'    : RasterTileStorage(),
+    'filesystem' : FileSystemStorage( 'raster' ),
+    'mbtiles'    : SQLiteStorage( 'raster' ),
+    'archive'    : ArchiveStorage( 'raster' )
+}
+
+# storage backends of formats encoded at tiling, by format then backend of layer
+RASTER_ENCODED_STORAGES = make_encoded_storages( 'raster' )
@@ -2,9 +2,11 @@
 #-----------------------------------------------------------------------------------------------------------------------
 
 from    django.contrib.gis.db   import models
+from    django.db               import connection
 from    tmsapp.utils            import *
-from    tmsapp.constant         import WEB_MERCATOR_SRID
-from    django.contrib.gis.geos import MultiPolygon
+from    tmsapp.constant         import WEB_MERCATOR_SRID, WEB_MERCATOR_WORLD_SIZE, MVT_EXTENT, MVT_BUFFER, TILE_MAX_AGE
+from    tmsapp.utils.cache      import VECTOR_LAYER_INDEX
+from    django.contrib.gis.geos import MultiPolygon, Polygon
 from    django.contrib.gis.gdal import SpatialReference, CoordTransform
 import  json
 
@@ -24,6 +26,8 @@ class VectorLayer(models.Model):
     vectorlayer_crs       = models.IntegerField(default=3857, editable=False, verbose_name='CRS')
     vectorlayer_available = models.BooleanField(default=False, verbose_name='Available')
     vectorlayer_crea = models.DateTimeField(auto_now_add=True, verbose_name='Creation')
+    vectorlayer_updt      = models.DateTimeField(auto_now=True, verbose_name='Update')
+    vectorlayer_maxage    = models.IntegerField(default=TILE_MAX_AGE, verbose_name='Cache max age (s)')
 
     def __load_geojson__(self, crs : int ):
 
@@ -56,9 +60,39 @@ class VectorLayer(models.Model):
         # override
         super(VectorLayer, self).save( *args, **kwargs )
 
+        # drop cached name of layer
+        VECTOR_LAYER_INDEX.drop( self.vectorlayer_id )
+
         # load geojson
         self.__load_geojson__( WEB_MERCATOR_SRID )
 
+    def delete(self, *args, **kwargs):
+
+        # drop cached name of layer
+        VECTOR_LAYER_INDEX.drop( self.vectorlayer_id )
+
+        return super(VectorLayer, self).delete( *args, **kwargs )
+
+    @staticmethod
+    def get_info(name : str) -> tuple():
+
+        """ Get VectorLayer (id, update timestamp, max age) by name, resolution is cached """
+
+        params = ( 'vectorlayer_id', 'vectorlayer_updt', 'vectorlayer_maxage' )
+        loader = lambda x: VectorLayer.objects.filter(vectorlayer_name=x).values_list( *params ).first()
+        info   = VECTOR_LAYER_INDEX.resolve( name, loader )
+
+        return None if info is None else ( info[0], int( info[1].timestamp() ), info[2] )
+
+    @staticmethod
+    def get_id(name : str) -> int:
+
+        """ Get VectorLayer id by name, resolution is cached """
+
+        info = VectorLayer.get_info( name )
+
+        return None if info is None else info[0]
+
     def __str__(self):
         return self.vectorlayer_name
 
@@ -76,5 +110,35 @@ class VectorGeometry(models.Model):
         verbose_name_plural = 'Vector Geometries'
 
     vectorgeometry_id    = models.AutoField(primary_key=True)
-    vectorgeometry_layer = models.ForeignKey(VectorLayer, on_delete=models.CASCADE)
-    geom                 = models.MultiPolygonField(srid=3857)
\ No newline at end of file
+    vectorgeometry_layer = models.ForeignKey(VectorLayer, on_delete=models.CASCADE, db_index=True)
+    geom                 = models.MultiPolygonField(srid=3857, spatial_index=True)
+
+    @staticmethod
+    def get_mvt(vectorlayer_id : int, name : str, zoom : int, x : int, y : int, extent : int = MVT_EXTENT,
+                buffer : int = MVT_BUFFER) -> bytes:
+
+        """ Get Mapbox Vector Tile of a layer by Zoom, X, Y (one aggregated tile, empty bytes when no geometry) """
+
+        # buffer in world unit, for the bbox filter
+        margin = WEB_MERCATOR_WORLD_SIZE / 2. ** zoom * buffer / extent
+
+        query = """
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%s, %s, %s) AS geom
+            ),
+            mvtgeom AS (
+                SELECT ST_AsMVTGeom(g.geom, bounds.geom, %s, %s, true) AS geom, g.vectorgeometry_id AS id
+                FROM   tmsapp_vectorgeometry g, bounds
+                WHERE  g.vectorgeometry_layer_id = %s
+                AND    g.geom && ST_Expand(bounds.geom, %s)
+            )
+            SELECT ST_AsMVT(mvtgeom.*, %s, %s, 'geom', 'id') FROM mvtgeom
+        """
+
+        params = [ zoom, x, y, extent, buffer, vectorlayer_id, margin, name, extent ]
+
+        with connection.cursor() as cursor:
+            cursor.execute( query, params )
+            row = cursor.fetchone()
+
+        return b'' if row is None or row[0] is None else bytes( row[0] )
\ No newline at end of file
@@ -0,0 +1,173 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.test   import TestCase, override_settings
+from   tmsapp.models import TilingJob, TilingUnit, UnitCheckpoint
+
+
+
+# Tiling jobs
+#-----------------------------------------------------------------------------------------------------------------------
+
+# layers are never loaded : jobs & units only hold a layer id
+LAYER = 1
+
+class TilingJobTest(TestCase):
+
+    def test_submit_claim_finish(self):
+
+        job = TilingJob.submit( 'raster', LAYER )
+
+        self.assertEqual( job.tilingjob_state, 'queued' )
+        self.assertEqual( job.tilingjob_generation, job.pk )
+
+        claimed = TilingJob.claim( 'worker-1' )
+
+        self.assertEqual( claimed.pk, job.pk )
+        self.assertEqual( claimed.tilingjob_state, 'running' )
+        self.assertEqual( claimed.tilingjob_attempts, 1 )
+
+        # nothing left to claim
+        self.assertIsNone( TilingJob.claim( 'worker-2' ) )
+
+        claimed.finish()
+        job.refresh_from_db()
+
+        self.assertEqual( job.tilingjob_state, 'done' )
+        self.assertIsNotNone( job.tilingjob_end )
+        self.assertIsNone( job.tilingjob_heartbeat )
+
+    def test_submit_cancels_queued_job(self):
+
+        first  = TilingJob.submit( 'raster', LAYER )
+        second = TilingJob.submit( 'raster', LAYER )
+
+        first.refresh_from_db()
+
+        self.assertEqual( first.tilingjob_state, 'cancelled' )
+        self.assertEqual( TilingJob.claim( 'worker-1' ).pk, second.pk )
+
+    def test_cancel_running_job(self):
+
+        TilingJob.submit( 'image', LAYER )
+        claimed = TilingJob.claim( 'worker-1' )
+
+        TilingJob.cancel( 'image', LAYER )
+
+        # the worker is told to stop, then the job ends cancelled
+        self.assertTrue( claimed.beat() )
+
+        claimed.finish( 'stopped' )
+        claimed.refresh_from_db()
+
+        self.assertEqual( claimed.tilingjob_state, 'cancelled' )
+
+    def test_claim_waits_running_job_of_layer(self):
+
+        TilingJob.submit( 'raster', LAYER )
+        running = TilingJob.claim( 'worker-1' )
+        queued  = TilingJob.submit( 'raster', LAYER )
+
+        # previous job of the layer is cancelled but still running
+        self.assertIsNone( TilingJob.claim( 'worker-2' ) )
+
+        running.finish()
+
+        self.assertEqual( TilingJob.claim( 'worker-2' ).pk, queued.pk )
+
+    @override_settings(TMS_TILING_JOB_ATTEMPTS=2)
+    def test_failed_job_is_queued_again(self):
+
+        job = TilingJob.submit( 'raster', LAYER )
+
+        TilingJob.claim( 'worker-1' ).finish( 'error' )
+        job.refresh_from_db()
+
+        self.assertEqual( job.tilingjob_state, 'queued' )
+
+        TilingJob.claim( 'worker-1' ).finish( 'error' )
+        job.refresh_from_db()
+
+        self.assertEqual( job.tilingjob_state, 'failed' )
+        self.assertEqual( job.tilingjob_attempts, 2 )
+        self.assertEqual( job.tilingjob_error, 'error' )
+
+    def test_release_does_not_count_attempt(self):
+
+        job = TilingJob.submit( 'raster', LAYER )
+
+        TilingJob.claim( 'worker-1' ).release()
+        job.refresh_from_db()
+
+        self.assertEqual( job.tilingjob_state, 'queued' )
+        self.assertEqual( job.tilingjob_attempts, 0 )
+
+    def test_finish_of_job_claimed_again(self):
+
+        TilingJob.submit( 'raster', LAYER )
+        lost = TilingJob.claim( 'worker-1' )
+
+        # claimed again by another worker after the timeout
+        TilingJob.objects.filter( pk=lost.pk ).update( tilingjob_worker='worker-2' )
+
+        lost.finish( 'lost' )
+        lost.refresh_from_db()
+
+        self.assertEqual( lost.tilingjob_state, 'running' )
+        self.assertEqual( lost.tilingjob_worker, 'worker-2' )
+
+
+
+# Resume by generation
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingResumeTest(TestCase):
+
+    def __stop_after_unit__(self) -> TilingJob:
+
+        """ Run a job which writes one unit of a source, then is stopped """
+
+        job = TilingJob.submit( 'raster', LAYER )
+
+        TilingJob.claim( 'worker-1' )
+        UnitCheckpoint('raster', LAYER, job.tilingjob_generation, 'a.tif').mark(5, (0, 0, 7, 7), 64)
+
+        TilingJob.cancel( 'raster', LAYER )
+
+        return job
+
+    def test_resume_keeps_generation(self):
+
+        stopped = self.__stop_after_unit__()
+        resumed = TilingJob.submit('raster', LAYER, resume=True)
+
+        self.assertEqual( resumed.tilingjob_generation, stopped.tilingjob_generation )
+        self.assertTrue( TilingUnit.exists( resumed.tilingjob_generation ) )
+
+        # units are read by source of the generation
+        checkpoint = UnitCheckpoint('raster', LAYER, resumed.tilingjob_generation, 'a.tif')
+        other      = UnitCheckpoint('raster', LAYER, resumed.tilingjob_generation, 'b.tif')
+
+        self.assertEqual( checkpoint.load(), { (5, (0, 0, 7, 7)) : 64 } )
+        self.assertEqual( other.load(), {} )
+
+    def test_new_tiling_starts_from_scratch(self):
+
+        stopped = self.__stop_after_unit__()
+        job     = TilingJob.submit( 'raster', LAYER )
+
+        self.assertEqual( job.tilingjob_generation, job.pk )
+        self.assertNotEqual( job.tilingjob_generation, stopped.tilingjob_generation )
+        self.assertFalse( TilingUnit.exists( stopped.tilingjob_generation ) )
+        self.assertFalse( TilingUnit.exists( job.tilingjob_generation ) )
+
+    def test_unit_marked_twice(self):
+
+        job        = TilingJob.submit( 'image', LAYER )
+        checkpoint = UnitCheckpoint('image', LAYER, job.tilingjob_generation, 'a.tif')
+
+        # a retried unit
+        checkpoint.mark(3, (0, 0, 7, 7), 10)
+        checkpoint.mark(3, (0, 0, 7, 7), 10)
+
+        self.assertEqual( checkpoint.load(), { (3, (0, 0, 7, 7)) : 10 } )
@@ -0,0 +1,81 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.test          import SimpleTestCase, override_settings
+from   tmsapp.utils.storage import ArchiveStorage
+from   tmsapp.utils.archive import pack_tiles, ArchiveReader
+from   tempfile             import TemporaryDirectory
+import os
+
+
+
+# Packed archive
+#-----------------------------------------------------------------------------------------------------------------------
+
+# tiles (zoom, x, y, payload), a payload shared by two tiles
+TILES = [ (0, 0, 0, b'root'), (1, 0, 1, b'same'), (1, 1, 1, b'same'), (3, 5, 2, b'leaf') ]
+
+class ArchiveTest(SimpleTestCase):
+
+    def setUp(self):
+
+        self.root     = TemporaryDirectory()
+        self.settings = override_settings( TMS_TILE_STORAGE_ROOT=self.root.name )
+        self.settings.enable()
+
+    def tearDown(self):
+
+        self.settings.disable()
+        self.root.cleanup()
+
+    def test_pack_tiles(self):
+
+        path   = os.path.join(self.root.name, 'layer.tmspack')
+        report = pack_tiles(TILES, path)
+
+        self.assertEqual( report[ 'tiles' ], 4 )
+        self.assertEqual( report[ 'payloads' ], 3 )
+
+        reader = ArchiveReader( path )
+
+        self.assertEqual( reader.count(), 4 )
+        self.assertEqual( bytes( reader.get(1, 1, 1) ), b'same' )
+        self.assertIsNone( reader.get(1, 0, 0) )
+
+    def test_round_trip(self):
+
+        storage = ArchiveStorage( 'raster' )
+        storage.pack(1, TILES)
+
+        for zoom, x, y, payload in TILES:
+            self.assertEqual( bytes( storage.get(1, zoom, x, y) ), payload )
+
+        self.assertEqual( storage.exists_many(1, [ (0, 0, 0), (2, 0, 0) ]), [ True, False ] )
+        self.assertEqual( sorted( storage.list_tiles(1, 1) ), [ (0, 1), (1, 1) ] )
+        self.assertEqual( sorted( (z, x, y, bytes( p )) for z, x, y, p in storage.iter_tiles( 1 ) ), sorted( TILES ) )
+
+    def test_pack_replaces_archive(self):
+
+        storage = ArchiveStorage( 'image' )
+        storage.pack(1, TILES)
+
+        # read before the archive is replaced
+        self.assertEqual( bytes( storage.get(1, 3, 5, 2) ), b'leaf' )
+
+        storage.pack(1, [ (3, 5, 2, b'new') ])
+
+        self.assertEqual( bytes( storage.get(1, 3, 5, 2) ), b'new' )
+        self.assertIsNone( storage.get(1, 0, 0, 0) )
+
+    def test_missing_and_deleted_archive(self):
+
+        storage = ArchiveStorage( 'raster' )
+
+        self.assertIsNone( storage.get(2, 0, 0, 0) )
+        self.assertEqual( list( storage.iter_tiles( 2 ) ), [] )
+
+        storage.pack(2, TILES)
+        storage.delete_layer( 2 )
+
+        self.assertIsNone( storage.get(2, 0, 0, 0) )
+        self.assertEqual( storage.exists_many(2, [ (0, 0, 0) ]), [ False ] )
@@ -0,0 +1,75 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.core.exceptions import ValidationError
+from   django.test            import SimpleTestCase
+from   tmsapp.utils.encoding  import parse_formats, validate_formats, get_format
+from   tmsapp.utils.coverage  import TileCoverage
+
+
+
+# Formats
+#-----------------------------------------------------------------------------------------------------------------------
+
+class FormatsTest(SimpleTestCase):
+
+    def test_parse_formats(self):
+
+        self.assertEqual( parse_formats( 'webp,jpg' ), ( 'jpg', 'webp' ) )
+        self.assertEqual( parse_formats( ' JPEG , webp,jpg ' ), ( 'jpg', 'webp' ) )
+
+        # png is always stored
+        self.assertEqual( parse_formats( 'png' ), () )
+        self.assertEqual( parse_formats( 'png,webp' ), ( 'webp', ) )
+
+        # no format
+        self.assertEqual( parse_formats( '' ), () )
+        self.assertEqual( parse_formats( None ), () )
+        self.assertEqual( parse_formats( ' , ' ), () )
+
+    def test_unknown_format(self):
+
+        with self.assertRaises( AssertionError ):
+            parse_formats( 'webp,gif' )
+
+        with self.assertRaises( ValidationError ):
+            validate_formats( 'gif' )
+
+    def test_get_format(self):
+
+        self.assertEqual( get_format( 'JPEG' ), 'jpg' )
+        self.assertEqual( get_format( 'webp' ), 'webp' )
+        self.assertIsNone( get_format( 'pbf' ) )
+
+
+
+# Coverage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class CoverageTest(SimpleTestCase):
+
+    # tiles far apart at a high zoom, in distinct blocks
+    TILES = { 2 : [ (0, 0), (3, 3) ], 18 : [ (0, 0), (63, 64), (131071, 200000), (262143, 262143) ] }
+
+    def test_build(self):
+
+        coverage = TileCoverage.build( CoverageTest.TILES )
+
+        self.assertEqual( coverage.count(), 6 )
+
+        for zoom, tiles in CoverageTest.TILES.items():
+            for x, y in tiles:
+                self.assertIn( (zoom, x, y), coverage )
+
+        self.assertNotIn( (2, 1, 0), coverage )
+        self.assertNotIn( (18, 63, 63), coverage )
+        self.assertNotIn( (18, 131072, 200000), coverage )
+        self.assertNotIn( (5, 0, 0), coverage )
+
+    def test_dumps_loads(self):
+
+        coverage = TileCoverage.loads( TileCoverage.build( CoverageTest.TILES ).dumps() )
+
+        self.assertEqual( coverage.count(), 6 )
+        self.assertIn( (18, 131071, 200000), coverage )
+        self.assertNotIn( (18, 131071, 200001), coverage )
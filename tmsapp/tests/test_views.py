@@ -0,0 +1,49 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.test import TestCase
+from   django.urls import reverse
+
+
+
+# Identify & statistics
+#-----------------------------------------------------------------------------------------------------------------------
+
+class RasterIdentifyViewTest(TestCase):
+
+    def test_missing_layer(self):
+
+        for name in ( 'raster-identify', 'raster-statistics' ):
+
+            response = self.client.get( reverse( name ), { 'x' : 0, 'y' : 0 } )
+
+            self.assertEqual( response.status_code, 400 )
+            self.assertIn( 'layer is required', response.json()[ 'error' ] )
+
+    def test_unknown_layer(self):
+
+        params = { 'layer' : 'unknown', 'x' : 0, 'y' : 0, 'bbox' : '0,0,1,1' }
+
+        for name in ( 'raster-identify', 'raster-statistics' ):
+
+            response = self.client.get( reverse( name ), params )
+
+            self.assertEqual( response.status_code, 404 )
+            self.assertEqual( response.json(), { 'layer' : 'unknown', 'error' : 'unknown layer' } )
+
+
+
+# Progress
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ProgressViewTest(TestCase):
+
+    def test_missing_layer(self):
+
+        for name in ( 'raster-progress', 'image-progress' ):
+            self.assertEqual( self.client.get( reverse( name ) ).status_code, 400 )
+
+    def test_unknown_layer(self):
+
+        for name in ( 'raster-progress', 'image-progress' ):
+            self.assertEqual( self.client.get( reverse( name ), { 'layer' : 'unknown' } ).status_code, 404 )
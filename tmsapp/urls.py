@@ -1,9 +1,34 @@
 from django.contrib import admin
+from django.conf import settings
 from django.urls import path
 from .views import *
+from .constant import ASYNC_VIEWS
 
-urlpatterns = [
-    path('raster/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', RasterTMSView.as_view(), name='image-tms'),
-    path('image/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', ImageTMSView.as_view(), name='image-tms'),
-    path('vector/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', VectorTMSView.as_view(), name='vector-tms'),
+# async views for ASGI deployments (tms/asgi.py), sync views otherwise
+if getattr(settings, 'TMS_ASYNC_VIEWS', ASYNC_VIEWS):
+
+    urlpatterns = [
+        path('raster/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', async_raster_tms_view, name='image-tms'),
+        path('image/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', async_image_tms_view, name='image-tms'),
+        path('vector/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', async_vector_tms_view, name='vector-tms'),
+    ]
+
+else:
+
+    urlpatterns = [
+        path('raster/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', RasterTMSView.as_view(), name='image-tms'),
+        path('image/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', ImageTMSView.as_view(), name='image-tms'),
+        path('vector/tms/<int:z>/<int:x>/<int:y>.<str:frmt>', VectorTMSView.as_view(), name='vector-tms'),
+    ]
+
+# progress of tiling jobs
+urlpatterns += [
+    path('raster/progress', ProgressView.as_view(), { 'kind' : 'raster' }, name='raster-progress'),
+    path('image/progress', ProgressView.as_view(), { 'kind' : 'image' }, name='image-progress'),
+]
+
+# values & statistics of raster layers
+urlpatterns += [
+    path('raster/identify', RasterIdentifyView.as_view(), { 'mode' : 'point' }, name='raster-identify'),
+    path('raster/statistics', RasterIdentifyView.as_view(), { 'mode' : 'bbox' }, name='raster-statistics'),
 ]
@@ -1,2 +1,13 @@
 from .reprojected import reprojected_by_rio as reprojected_raster
-from .tools       import __pixel_size__, __tile_world_bbox__, __tile_index_bbox__, __make_quadrants__, __extent_to_polyset__, __make_imagetiles_Z__, __make_rastertiles_Z__, make_imagetiles, make_rastertiles, get_raster_extent
\ No newline at end of file
+from .tools       import __pixel_size__, __bands_to_png__, __merge_png__, __merge_rasters__, __make_rastertile_from_bands__, __tile_world_bbox__, __tile_index_bbox__, __make_quadrants__, __read_window__, __extent_to_polyset__, __make_imagetiles_Z__, __make_rastertiles_Z__, __make_imagetiles_Q__, __make_rastertiles_Q__, make_tiles, make_imagetiles, make_rastertiles, get_raster_extent
+from .pool        import run_units, get_workers, get_quadrant_size, get_metatile, get_gdal_cache, get_unit_retries
+from .pyramid     import get_children, mosaic, downsample, get_kernel, get_pyramid_mode
+from .sink        import TileSink, bulk_write
+from .mbtiles     import MBTilesReader, MBTilesWriter, export_tiles, import_tiles
+from .storage     import ReadOnlyTileStorage, TileStorage, FileSystemStorage, SQLiteStorage, ArchiveStorage, get_default_storage, get_storage_root
+from .archive     import ArchiveReader, ArchiveWriter, pack_tiles
+from .lazy        import get_eager_zoom, is_lazy, get_eager_tile, get_sources, get_source_dir, extract_sources, render_imagetile, render_rastertile
+from .progress    import STAGES, STAGE_TIMER, TilingProgress, TilingCheckpoint, format_progress, format_stages, end_report
+from .encoding    import TILE_FORMATS, get_format, get_tile_quality, parse_formats, encode_tile, encode_variants
+from .style       import STRETCHES, RasterStyle, RASTER_STYLE_INDEX, compute_stats, get_raster_stretch, get_colormaps
+from .identify    import RASTER_ARRAY_CACHE, get_bbox_zoom, identify_point, zonal_stats, get_identify_srid, get_identify_bins
@@ -0,0 +1,297 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   tmsapp.constant import *
+from   threading       import RLock
+import numpy           as     np
+import hashlib
+import struct
+import mmap
+import time
+import os
+
+
+
+# Tile id
+#-----------------------------------------------------------------------------------------------------------------------
+
+# header : magic, version, number of tiles, number of stored payloads, offset of directory
+_HEADER  = struct.Struct( '<8sIQQQ' )
+_MAGIC   = b'TMSPACK\0'
+_VERSION = 1
+
+# get id of a tile : tiles of lower zooms first, then hilbert index of the tile in its zoom
+def __tile_id__(zoom : int, x : int, y : int) -> int:
+
+    """ Id of a tile, neighbouring tiles have close ids (hilbert curve) """
+
+    n = 1 << zoom
+    d = 0
+    s = n >> 1
+
+    while s > 0:
+
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ( ( 3 * rx ) ^ ry )
+
+        # rotate quadrant
+        if ry == 0:
+
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+
+            x, y = y, x
+
+        s >>= 1
+
+    return ( ( 1 << ( 2 * zoom ) ) - 1 ) // 3 + d
+
+# get tile of an id
+def __tile_zxy__(tile_id : int) -> tuple():
+
+    """ (zoom, x, y) of a tile id """
+
+    # find zoom of id
+    zoom = 0
+
+    while tile_id >= ( ( 1 << ( 2 * ( zoom + 1 ) ) ) - 1 ) // 3:
+        zoom += 1
+
+    d    = tile_id - ( ( 1 << ( 2 * zoom ) ) - 1 ) // 3
+    x, y = 0, 0
+    s    = 1
+
+    while s < ( 1 << zoom ):
+
+        rx = 1 & ( d // 2 )
+        ry = 1 & ( d ^ rx )
+
+        # rotate quadrant
+        if ry == 0:
+
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+
+            x, y = y, x
+
+        x  += s * rx
+        y  += s * ry
+        d //= 4
+        s <<= 1
+
+    return zoom, x, y
+
+
+
+# Archive writer
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ArchiveWriter(object):
+
+    """
+    Packed tile archive writer : header, concatenated payloads (identical payloads are written once), then directory
+    sorted by tile id as three arrays (ids uint64, offsets uint64, lengths uint32). The file is written in a temporary
+    file & moved into place on close.
+    """
+
+    def __init__(self, path : str):
+
+        self.path     = path
+        self.temp     = '%s.%d.tmp' % (path, os.getpid())
+        self.file     = open(self.temp, 'wb')
+
+        self.entries  = []
+        self.payloads = dict()
+        self.offset   = _HEADER.size
+        self.size     = 0
+
+        # header is written again on close
+        self.file.write( b'\0' * _HEADER.size )
+
+    def write(self, zoom : int, x : int, y : int, data : bytes) -> None:
+
+        """ Write a tile """
+
+        digest = hashlib.sha1( data ).digest()
+        stored = self.payloads.get( digest )
+
+        # new payload
+        if stored is None:
+            stored = ( self.offset, len( data ) )
+            self.payloads[ digest ] = stored
+            self.file.write( data )
+            self.offset += len( data )
+
+        self.entries.append( ( __tile_id__(zoom, x, y), stored[0], stored[1] ) )
+        self.size += len( data )
+
+    def close(self) -> None:
+
+        """ Write directory & header, then move archive into place """
+
+        self.entries.sort()
+
+        count   = len( self.entries )
+        entries = np.array( self.entries, dtype=np.uint64 ).reshape( -1, 3 )
+
+        self.file.write( entries[:, 0].astype('<u8').tobytes() )
+        self.file.write( entries[:, 1].astype('<u8').tobytes() )
+        self.file.write( entries[:, 2].astype('<u4').tobytes() )
+
+        self.file.seek( 0 )
+        self.file.write( _HEADER.pack(_MAGIC, _VERSION, count, len( self.payloads ), self.offset) )
+        self.file.close()
+
+        os.replace(self.temp, self.path)
+
+    def __enter__(self) -> object:
+        return self
+
+    def __exit__(self, error_type, *_args) -> None:
+
+        if error_type is None:
+            self.close()
+
+        # keep previous archive on error
+        else:
+            self.file.close()
+            os.remove( self.temp )
+
+
+
+# Archive reader
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ArchiveReader(object):
+
+    """ Packed tile archive reader : file is mapped in memory, tiles are found by binary search & never copied """
+
+    def __init__(self, path : str):
+
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, _, offset = _HEADER.unpack_from( self.mmap, 0 )
+
+        assert magic == _MAGIC and version == _VERSION
+
+        # directory arrays, views on the mapped file
+        self.ids     = np.frombuffer(self.mmap, dtype='<u8', count=count, offset=offset)
+        self.offsets = np.frombuffer(self.mmap, dtype='<u8', count=count, offset=offset + 8  * count)
+        self.lengths = np.frombuffer(self.mmap, dtype='<u4', count=count, offset=offset + 16 * count)
+        self.view    = memoryview( self.mmap )
+
+    def count(self) -> int:
+
+        """ Get number of tiles """
+
+        return len( self.ids )
+
+    def get(self, zoom : int, x : int, y : int) -> memoryview:
+
+        """ Get payload of a tile as a memoryview on the mapped file, None if tile not exist """
+
+        tile_id = __tile_id__(zoom, x, y)
+        i       = int( np.searchsorted(self.ids, tile_id) )
+
+        if i == len( self.ids ) or self.ids[ i ] != tile_id:
+            return None
+
+        offset = int( self.offsets[ i ] )
+
+        return self.view[ offset : offset + int( self.lengths[ i ] ) ]
+
+    def iter_tiles(self) -> object:
+
+        """ Iterate on tiles (zoom, x, y, payload) in tile id order """
+
+        for tile_id, offset, length in zip(self.ids, self.offsets, self.lengths):
+            zoom, x, y = __tile_zxy__( int( tile_id ) )
+            yield zoom, x, y, self.view[ int( offset ) : int( offset ) + int( length ) ]
+
+    def list_tiles(self, zoom : int) -> object:
+
+        """ Iterate on tiles (x, y) of a zoom """
+
+        first = ( ( 1 << ( 2 * zoom       ) ) - 1 ) // 3
+        last  = ( ( 1 << ( 2 * (zoom + 1) ) ) - 1 ) // 3
+
+        start = int( np.searchsorted(self.ids, first) )
+        stop  = int( np.searchsorted(self.ids, last ) )
+
+        for tile_id in self.ids[ start : stop ]:
+            yield __tile_zxy__( int( tile_id ) )[ 1: ]
+
+
+
+# Pack
+#-----------------------------------------------------------------------------------------------------------------------
+
+def pack_tiles(tiles : object, path : str) -> dict():
+
+    """ Write tiles, an iterable of (zoom, x, y, data), in a new packed archive. Return report """
+
+    start_time = time.time()
+
+    with ArchiveWriter( path ) as writer:
+        for zoom, x, y, data in tiles:
+            writer.write(zoom, x, y, bytes( data ))
+
+    seconds = max( time.time() - start_time, 1e-9 )
+
+    return {
+        'tiles'            : len( writer.entries ),
+        'payloads'         : len( writer.payloads ),
+        'bytes'            : writer.size,
+        'packed_bytes'     : os.path.getsize( path ),
+        'seconds'          : seconds,
+        'tiles_per_second' : len( writer.entries ) / seconds
+    }
+
+
+
+# Readers of the process
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ArchiveIndex(object):
+
+    """ Opened archives of the process by path, reopened when the file is replaced """
+
+    def __init__(self):
+
+        self.readers = dict()
+        self.lock    = RLock()
+
+    def get(self, path : str) -> ArchiveReader:
+
+        """ Get reader of an archive, None if file not exist """
+
+        try:
+            stat = os.stat( path )
+
+        except FileNotFoundError:
+            return None
+
+        version = ( stat.st_ino, stat.st_mtime_ns )
+
+        with self.lock:
+
+            item = self.readers.get( path )
+
+            if item is None or item[0] != version:
+                item = ( version, ArchiveReader( path ) )
+                self.readers[ path ] = item
+
+            return item[1]
+
+    def drop(self, path : str) -> None:
+
+        # mapping is released with the last view on it
+        with self.lock:
+            self.readers.pop( path, None )
+
+# archives of the process
+ARCHIVE_INDEX = ArchiveIndex()
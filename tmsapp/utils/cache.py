@@ -0,0 +1,413 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from collections     import OrderedDict
+from threading       import RLock
+from django.conf     import settings
+from tmsapp.constant import *
+import time
+import sys
+
+
+
+# Structure
+#-----------------------------------------------------------------------------------------------------------------------
+
+# marker returned by TileCache.get when the key is not cached (None is a valid cached value : a tile miss)
+MISSING = object()
+
+# cache entry
+class __Entry__(object):
+
+    __slots__ = ( 'key', 'layer', 'value', 'size', 'expire', 'freq' )
+
+    def __init__(self, key : str, layer : str, value : object, size : int, expire : float):
+
+        self.key    = key
+        self.layer  = layer
+        self.value  = value
+        self.size   = size
+        self.expire = expire
+        self.freq   = 1
+
+# size of a cached value
+def __value_size__(value : object) -> int:
+
+    """ Get size in bytes of a cached value """
+
+    if value is None:
+        return 0
+
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len( value )
+
+    # decoded arrays (numpy), alone or in a tuple
+    if hasattr(value, 'nbytes'):
+        return value.nbytes
+
+    if isinstance(value, tuple):
+        return sum( __value_size__( item ) for item in value )
+
+    return sys.getsizeof( value )
+
+
+
+# Tile store (one eviction policy, one budget)
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TileStore(object):
+
+    """ Bounded store with LRU or LFU eviction, budget is counted in weight (bytes or entries) """
+
+    def __init__(self, budget : int, policy : str = 'lru', by_size : bool = True):
+
+        assert policy in ( 'lru', 'lfu' )
+
+        self.budget  = budget
+        self.policy  = policy
+        self.by_size = by_size
+        self.weight  = 0
+
+        # key -> entry (LRU order for lru policy)
+        self.entries = OrderedDict()
+
+        # freq -> OrderedDict of keys (lfu policy only)
+        self.buckets  = dict()
+        self.min_freq = 0
+
+    def __weight__(self, entry : __Entry__) -> int:
+        return entry.size if self.by_size else 1
+
+    def __len__(self) -> int:
+        return len( self.entries )
+
+    def __touch__(self, entry : __Entry__) -> None:
+
+        """ Register an access on entry """
+
+        if self.policy == 'lru':
+            self.entries.move_to_end( entry.key )
+            return
+
+        # move key to the next frequency bucket
+        bucket = self.buckets[ entry.freq ]
+        del bucket[ entry.key ]
+
+        if len( bucket ) == 0:
+            del self.buckets[ entry.freq ]
+            if self.min_freq == entry.freq:
+                self.min_freq = entry.freq + 1
+
+        entry.freq += 1
+        self.buckets.setdefault( entry.freq, OrderedDict() )[ entry.key ] = None
+
+    def get(self, key : str) -> object:
+
+        """ Get entry by key, None if absent """
+
+        entry = self.entries.get( key )
+
+        if entry is not None:
+            self.__touch__( entry )
+
+        return entry
+
+    def pop(self, key : str) -> object:
+
+        """ Remove entry by key, return it (None if absent) """
+
+        entry = self.entries.pop( key, None )
+
+        if entry is None:
+            return None
+
+        self.weight -= self.__weight__( entry )
+
+        if self.policy == 'lfu':
+
+            bucket = self.buckets[ entry.freq ]
+            del bucket[ entry.key ]
+
+            if len( bucket ) == 0:
+                del self.buckets[ entry.freq ]
+                if self.min_freq == entry.freq:
+                    self.min_freq = min( self.buckets ) if self.buckets else 0
+
+        return entry
+
+    def victim(self) -> object:
+
+        """ Get the next entry to evict """
+
+        if self.policy == 'lru':
+            key = next( iter( self.entries ) )
+        else:
+            key = next( iter( self.buckets[ self.min_freq ] ) )
+
+        return self.entries[ key ]
+
+    def put(self, entry : __Entry__) -> list():
+
+        """ Insert entry, return the list of evicted entries """
+
+        evicted = []
+        weight  = self.__weight__( entry )
+
+        # too big to be cached
+        if weight > self.budget:
+            return evicted
+
+        # make room
+        while self.entries and self.weight + weight > self.budget:
+            evicted.append( self.pop( self.victim().key ) )
+
+        # insert
+        self.entries[ entry.key ] = entry
+        self.weight              += weight
+
+        if self.policy == 'lfu':
+            self.buckets.setdefault( 1, OrderedDict() )[ entry.key ] = None
+            self.min_freq = 1
+
+        return evicted
+
+
+
+# Tile cache
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TileCache(object):
+
+    """
+    In-process tile cache.
+
+    Positive entries (tile payloads) are bounded by a byte budget, negative entries (tile misses, stored as None) are
+    bounded by a number of entries and have their own TTL. All entries of a layer can be dropped at once.
+    """
+
+    def __init__(self, max_bytes : int = TILE_CACHE_MAX_BYTES, max_misses : int = TILE_CACHE_MAX_MISSES,
+                 ttl : float = TILE_CACHE_TTL, miss_ttl : float = TILE_CACHE_MISS_TTL,
+                 policy : str = TILE_CACHE_POLICY):
+
+        self.ttl      = ttl
+        self.miss_ttl = miss_ttl
+
+        self.positive = TileStore(max_bytes , policy, by_size=True )
+        self.negative = TileStore(max_misses, policy, by_size=False)
+
+        # layer -> set of keys
+        self.layers   = dict()
+
+        self.lock     = RLock()
+
+        # counters
+        self.hits        = 0
+        self.miss_hits   = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    def __forget__(self, entry : __Entry__) -> None:
+
+        """ Remove entry from layer index """
+
+        keys = self.layers.get( entry.layer )
+
+        if keys is None:
+            return
+
+        keys.discard( entry.key )
+
+        if len( keys ) == 0:
+            del self.layers[ entry.layer ]
+
+    def __pop__(self, key : str) -> object:
+
+        """ Remove key from both stores """
+
+        entry = self.positive.pop( key ) or self.negative.pop( key )
+
+        if entry is not None:
+            self.__forget__( entry )
+
+        return entry
+
+    def get(self, key : str) -> object:
+
+        """ Get cached value by key, MISSING if not cached """
+
+        with self.lock:
+
+            entry = self.positive.get( key ) or self.negative.get( key )
+
+            # not cached
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            # expired
+            if entry.expire is not None and entry.expire < time.monotonic():
+                self.__pop__( key )
+                self.expirations += 1
+                self.misses      += 1
+                return MISSING
+
+            if entry.value is None:
+                self.miss_hits += 1
+            else:
+                self.hits      += 1
+
+            return entry.value
+
+    def set(self, layer : str, key : str, value : object) -> None:
+
+        """ Cache value (None for a tile miss) by key for a layer """
+
+        with self.lock:
+
+            # replace previous value
+            self.__pop__( key )
+
+            # get store & ttl
+            store = self.negative if value is None else self.positive
+            ttl   = self.miss_ttl if value is None else self.ttl
+
+            expire = None if ttl is None else time.monotonic() + ttl
+            entry  = __Entry__(key, layer, value, __value_size__( value ), expire)
+
+            # insert & evict
+            for evicted in store.put( entry ):
+                self.__forget__( evicted )
+                self.evictions += 1
+
+            if key in store.entries:
+                self.layers.setdefault( layer, set() ).add( key )
+
+    def drop_layer(self, layer : str) -> int:
+
+        """ Drop all entries of a layer, return the number of dropped entries """
+
+        with self.lock:
+
+            keys = list( self.layers.get( layer, () ) )
+
+            for key in keys:
+                self.__pop__( key )
+
+            return len( keys )
+
+    def clear(self) -> None:
+
+        """ Drop all entries """
+
+        with self.lock:
+
+            for layer in list( self.layers ):
+                self.drop_layer( layer )
+
+    def stats(self) -> dict():
+
+        """ Get cache counters """
+
+        with self.lock:
+
+            return {
+                'hits'        : self.hits,
+                'miss_hits'   : self.miss_hits,
+                'misses'      : self.misses,
+                'evictions'   : self.evictions,
+                'expirations' : self.expirations,
+                'entries'     : len( self.positive ),
+                'miss_entries': len( self.negative ),
+                'bytes'       : self.positive.weight,
+                'max_bytes'   : self.positive.budget
+            }
+
+
+
+# Shared caches
+#-----------------------------------------------------------------------------------------------------------------------
+
+# create a tile cache from settings.TMS_TILE_CACHE
+def __make_cache__() -> TileCache:
+
+    """ Create a tile cache configured by settings.TMS_TILE_CACHE """
+
+    options = getattr(settings, 'TMS_TILE_CACHE', dict())
+
+    return TileCache(
+        max_bytes  = options.get( 'MAX_BYTES' , TILE_CACHE_MAX_BYTES  ),
+        max_misses = options.get( 'MAX_MISSES', TILE_CACHE_MAX_MISSES ),
+        ttl        = options.get( 'TTL'       , TILE_CACHE_TTL        ),
+        miss_ttl   = options.get( 'MISS_TTL'  , TILE_CACHE_MISS_TTL   ),
+        policy     = options.get( 'POLICY'    , TILE_CACHE_POLICY     )
+    )
+
+# one cache for each kind of layer
+IMAGE_TILE_CACHE  = __make_cache__()
+RASTER_TILE_CACHE = __make_cache__()
+
+
+
+# Layer name resolution
+#-----------------------------------------------------------------------------------------------------------------------
+
+class LayerIndex(object):
+
+    """
+    In-process map from layer name to layer info, a tuple (layer id, ...) given by a loader.
+    Unknown names are never cached, infos expire after ttl seconds so other processes see rebuilt layers.
+    """
+
+    def __init__(self, ttl : float = LAYER_INDEX_TTL):
+
+        self.ttl   = ttl
+        self.infos = dict()
+        self.lock  = RLock()
+
+    def resolve(self, name : str, loader : object) -> tuple():
+
+        """ Get layer info by name, loader(name) is called when name is not cached """
+
+        with self.lock:
+            item = self.infos.get( name )
+
+        if item is not None and ( item[1] is None or item[1] >= time.monotonic() ):
+            return item[0]
+
+        # load from database, outside of the lock
+        info = loader( name )
+
+        if info is not None:
+
+            expire = None if self.ttl is None else time.monotonic() + self.ttl
+
+            with self.lock:
+                self.infos[ name ] = ( info, expire )
+
+        return info
+
+    def drop(self, layer_id : int) -> list():
+
+        """ Drop all names resolved to layer_id (handle renaming), return dropped names """
+
+        with self.lock:
+
+            names = [ name for name, item in self.infos.items() if item[0][0] == layer_id ]
+
+            for name in names:
+                del self.infos[ name ]
+
+            return names
+
+    def clear(self) -> None:
+
+        """ Drop all names """
+
+        with self.lock:
+            self.infos.clear()
+
+# one index for each kind of layer
+IMAGE_LAYER_INDEX  = LayerIndex()
+RASTER_LAYER_INDEX = LayerIndex()
+VECTOR_LAYER_INDEX = LayerIndex()
@@ -0,0 +1,189 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   threading       import RLock
+from   io              import BytesIO
+from   PIL             import Image
+from   tmsapp.constant import *
+from   .encoding       import encode_tile
+import numpy           as     np
+import struct
+import zlib
+
+
+
+# Tile coverage
+#-----------------------------------------------------------------------------------------------------------------------
+
+# blocks of 64x64 tiles
+_BLOCK_BITS = 6
+_BLOCK      = 1 << _BLOCK_BITS
+_MASK       = _BLOCK - 1
+
+# format of serialized coverages (a coverage of another format is not loaded, as a coverage not built)
+_MAGIC      = b'TMSC\x02'
+
+# header of a block : zoom, block x, block y
+_HEADER     = struct.Struct( '<iii' )
+
+class TileCoverage(object):
+
+    """
+    Tiles of a layer as sparse bitmaps by zoom, for O(1) existence checks : only blocks of 64x64 tiles holding tiles are
+    stored, so memory follows the number of tiles, not the extent of the layer
+    """
+
+    def __init__(self, zooms : dict()):
+
+        # zoom -> { (block x, block y) : bitmap of block, bits packed by row (64, 8) of uint8 }
+        self.zooms = zooms
+
+    def __contains__(self, tile : tuple()) -> bool:
+
+        zoom, x, y = tile
+
+        blocks = self.zooms.get( zoom )
+
+        if blocks is None:
+            return False
+
+        bits = blocks.get( ( x >> _BLOCK_BITS, y >> _BLOCK_BITS ) )
+
+        if bits is None:
+            return False
+
+        col = x & _MASK
+
+        return bool( ( bits[ y & _MASK, col >> 3 ] >> ( 7 - ( col & 7 ) ) ) & 1 )
+
+    def count(self) -> int:
+
+        """ Get number of tiles """
+
+        return int( sum( np.unpackbits( bits ).sum() for blocks in self.zooms.values() for bits in blocks.values() ) )
+
+    @staticmethod
+    def build(tiles_by_zoom : dict()) -> object:
+
+        """ Build coverage from { zoom : iterable of (x, y) } """
+
+        zooms = dict()
+
+        for zoom, tiles in tiles_by_zoom.items():
+
+            xy = np.array( list( tiles ), dtype=np.int64 ).reshape( -1, 2 )
+
+            if len( xy ) == 0:
+                continue
+
+            # blocks holding tiles, then tiles in their block
+            keys, index = np.unique( xy >> _BLOCK_BITS, axis=0, return_inverse=True )
+
+            bitmaps = np.zeros( (len( keys ), _BLOCK, _BLOCK), dtype=bool )
+            bitmaps[ index.reshape( -1 ), xy[:, 1] & _MASK, xy[:, 0] & _MASK ] = True
+
+            packed = np.packbits( bitmaps, axis=2 )
+
+            zooms[ zoom ] = { ( int( bx ), int( by ) ) : packed[ i ] for i, (bx, by) in enumerate( keys ) }
+
+        return TileCoverage( zooms )
+
+    def dumps(self) -> bytes:
+
+        """ Serialize as compressed bytes """
+
+        chunks = [ _MAGIC ]
+
+        for zoom, blocks in sorted( self.zooms.items() ):
+            for (bx, by), bits in sorted( blocks.items() ):
+                chunks.append( _HEADER.pack(zoom, bx, by) )
+                chunks.append( bits.tobytes() )
+
+        return zlib.compress( b''.join( chunks ) )
+
+    @staticmethod
+    def loads(data : bytes) -> object:
+
+        """ Deserialize from compressed bytes, None if data is of another format (built by a previous version) """
+
+        data   = zlib.decompress( bytes( data ) )
+        zooms  = dict()
+        offset = len( _MAGIC )
+        size   = _BLOCK * _BLOCK // 8
+
+        if not data.startswith( _MAGIC ):
+            return None
+
+        while offset < len( data ):
+
+            zoom, bx, by = _HEADER.unpack_from( data, offset )
+            offset      += _HEADER.size
+
+            bits    = np.frombuffer( data, dtype=np.uint8, count=size, offset=offset ).reshape( _BLOCK, _BLOCK // 8 )
+            offset += size
+
+            zooms.setdefault( zoom, dict() )[ ( bx, by ) ] = bits
+
+        return TileCoverage( zooms )
+
+
+
+# Coverage index
+#-----------------------------------------------------------------------------------------------------------------------
+
+class CoverageIndex(object):
+
+    """ In-process map from layer id to its coverage, loaded lazily & reloaded when the layer version change """
+
+    def __init__(self):
+
+        self.coverages = dict()
+        self.lock      = RLock()
+
+    def get(self, layer_id : int, version : int, loader : object) -> TileCoverage:
+
+        """ Get coverage of a layer version, loader(layer_id) give serialized coverage (None if not built) """
+
+        with self.lock:
+            item = self.coverages.get( layer_id )
+
+        if item is not None and item[0] == version:
+            return item[1]
+
+        # load from database, outside of the lock
+        data     = loader( layer_id )
+        coverage = None if data is None else TileCoverage.loads( data )
+
+        with self.lock:
+            self.coverages[ layer_id ] = ( version, coverage )
+
+        return coverage
+
+    def drop(self, layer_id : int) -> None:
+
+        with self.lock:
+            self.coverages.pop( layer_id, None )
+
+# one index for each kind of layer
+IMAGE_COVERAGE_INDEX  = CoverageIndex()
+RASTER_COVERAGE_INDEX = CoverageIndex()
+
+
+
+# Blank tile
+#-----------------------------------------------------------------------------------------------------------------------
+
+_BLANK_TILE = dict()
+
+def get_blank_tile(tile_size : int = WEB_MERCATOR_TILE_SIZE, frmt : str = 'png') -> bytes:
+
+    """ Get a transparent tile (jpg is filled with background), encoded once by format """
+
+    if ( tile_size, frmt ) not in _BLANK_TILE:
+
+        buffer = BytesIO()
+        Image.new( 'RGBA', (tile_size, tile_size), (0, 0, 0, 0) ).save(fp=buffer, format="PNG")
+
+        _BLANK_TILE[ ( tile_size, frmt ) ] = encode_tile(buffer.getvalue(), frmt)
+
+    return _BLANK_TILE[ ( tile_size, frmt ) ]
@@ -0,0 +1,159 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf            import settings
+from   django.core.exceptions import ValidationError
+from   django.db              import connections
+from   tmsapp.constant        import *
+from   .progress              import STAGE_TIMER
+from   .pool                  import get_workers
+from   PIL                    import Image
+from   io                     import BytesIO
+import multiprocessing        as     mp
+
+
+
+# Formats
+#-----------------------------------------------------------------------------------------------------------------------
+
+# content type of served formats, tiles are stored as png & encoded again for the others
+TILE_FORMATS = { 'png' : 'image/png', 'webp' : 'image/webp', 'jpg' : 'image/jpeg' }
+
+# other extensions of formats
+_ALIASES     = { 'jpeg' : 'jpg' }
+
+# get format of an extension
+def get_format(frmt : str) -> str:
+
+    """ Get format of a requested extension ('jpeg' is 'jpg'), None if format is not served """
+
+    frmt = _ALIASES.get( str( frmt ).lower(), str( frmt ).lower() )
+
+    return frmt if frmt in TILE_FORMATS else None
+
+# get default quality
+def get_tile_quality() -> int:
+
+    """ Get quality (1-100) of webp & jpg tiles of new layers (settings.TMS_TILE_QUALITY) """
+
+    return min( 100, max( 1, getattr(settings, 'TMS_TILE_QUALITY', TILE_QUALITY) ) )
+
+# get formats encoded at tiling
+def parse_formats(value : str) -> tuple():
+
+    """ Get formats (other than png) encoded at tiling from a comma separated list, like 'webp,jpg' """
+
+    formats = [ get_format( frmt.strip() ) for frmt in ( value or '' ).split(',') if frmt.strip() ]
+
+    assert None not in formats, 'formats must be in %s' % ', '.join( TILE_FORMATS )
+
+    return tuple( sorted( set( formats ) - { 'png' } ) )
+
+# validate formats field of a layer
+def validate_formats(value : str) -> None:
+
+    try:
+        parse_formats( value )
+
+    except AssertionError as error:
+        raise ValidationError( str( error ) )
+
+# get background of jpg tiles
+def get_jpeg_background() -> tuple():
+
+    """ Get RGB color of transparent pixels of jpg tiles (settings.TMS_TILE_JPEG_BACKGROUND) """
+
+    return tuple( getattr(settings, 'TMS_TILE_JPEG_BACKGROUND', TILE_JPEG_BACKGROUND) )
+
+# get webp encoder effort
+def get_webp_method() -> int:
+
+    """ Get effort (0 fast - 6 small) of the webp encoder (settings.TMS_TILE_WEBP_METHOD) """
+
+    return min( 6, max( 0, getattr(settings, 'TMS_TILE_WEBP_METHOD', TILE_WEBP_METHOD) ) )
+
+
+
+# Encoding
+#-----------------------------------------------------------------------------------------------------------------------
+
+def encode_tile(payload : bytes, frmt : str, quality : int = None) -> bytes:
+
+    """ Encode a png tile in a format : webp keeps alpha (lossless at quality 100), jpg is flattened on background """
+
+    if payload is None or frmt == 'png':
+        return payload
+
+    quality = get_tile_quality() if quality is None else quality
+    image   = Image.open( BytesIO( payload ) ).convert( 'RGBA' )
+    buffer  = BytesIO()
+
+    with STAGE_TIMER.stage( 'encode' ):
+
+        if frmt == 'webp':
+            image.save(fp=buffer, format='WEBP', quality=quality, lossless=quality >= 100, method=get_webp_method())
+
+        elif frmt == 'jpg':
+            flat = Image.new( 'RGBA', image.size, get_jpeg_background() + ( 255, ) )
+            Image.alpha_composite(flat, image).convert( 'RGB' ).save(fp=buffer, format='JPEG', quality=quality)
+
+        else:
+            raise ValueError( 'format "%s" is not supported' % frmt )
+
+    return buffer.getvalue()
+
+# encode a batch of tiles in a format
+def __encode_batch__(args : tuple()) -> list():
+
+    frmt, quality, tiles = args
+
+    return frmt, [ (zoom, x, y, encode_tile(payload, frmt, quality)) for zoom, x, y, payload in tiles ]
+
+def encode_variants(tiles : object, formats : tuple(), quality : int, push_fun, workers : int = None,
+                    batch_size : int = TILE_VARIANT_BATCH_SIZE) -> int:
+
+    """
+    Encode png tiles (zoom, x, y, payload) in each format, batches are encoded by tiling processes & written by
+    push_fun(frmt, tiles) in the current process. Return number of encoded tiles.
+    """
+
+    if not formats:
+        return 0
+
+    def batches():
+
+        batch = []
+
+        for tile in tiles:
+
+            batch.append( (tile[0], tile[1], tile[2], bytes( tile[3] )) )
+
+            if len( batch ) >= batch_size:
+                yield from ( (frmt, quality, batch) for frmt in formats )
+                batch = []
+
+        if batch:
+            yield from ( (frmt, quality, batch) for frmt in formats )
+
+    workers = get_workers( workers )
+    count   = 0
+
+    # sequential, in the current process
+    if workers == 1:
+
+        for frmt, encoded in map(__encode_batch__, batches()):
+            push_fun(frmt, encoded)
+            count += len( encoded )
+
+        return count
+
+    # close connections before fork, children only encode & tiles are read in the current process
+    connections.close_all()
+
+    with mp.get_context( 'fork' ).Pool( workers ) as pool:
+
+        for frmt, encoded in pool.imap(__encode_batch__, batches()):
+            push_fun(frmt, encoded)
+            count += len( encoded )
+
+    return count
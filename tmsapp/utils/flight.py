@@ -0,0 +1,259 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   django.db       import connection
+from   tmsapp.constant import *
+from   threading       import Lock, Event
+import hashlib
+import fcntl
+import time
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get lock between processes
+def get_process_lock() -> object:
+
+    """ Get lock between processes of settings.TMS_SINGLE_FLIGHT_LOCK : None, 'file' or 'advisory' """
+
+    kind = getattr(settings, 'TMS_SINGLE_FLIGHT_LOCK', SINGLE_FLIGHT_LOCK)
+
+    assert kind in ( None, 'file', 'advisory' )
+
+    if kind == 'file':
+        return FileLock( getattr(settings, 'TMS_SINGLE_FLIGHT_LOCK_FILE', SINGLE_FLIGHT_LOCK_FILE) )
+
+    if kind == 'advisory':
+        return AdvisoryLock()
+
+    return None
+
+# hash a key on 63 bits
+def __key_hash__(key : str) -> int:
+    return int.from_bytes( hashlib.sha1( key.encode() ).digest()[ :8 ], 'little' ) >> 1
+
+
+
+# Locks between processes
+#-----------------------------------------------------------------------------------------------------------------------
+
+class FileLock(object):
+
+    """
+    Host-wide lock by key : a byte-range lock (fcntl) of one lock file, at the offset given by the key hash.
+    Byte-range locks belong to the process, so only one file descriptor is opened by process, & threads of the process
+    take a lock by offset first (a process does not wait on its own byte-range lock).
+    """
+
+    def __init__(self, path : str):
+
+        self.path = path
+        self.pid  = None
+        self.fd   = None
+
+    def __check__(self) -> None:
+
+        # descriptor & locks are not shared with forked processes (a lock held by another thread would never be released)
+        if self.pid != os.getpid():
+            self.fd    = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            self.lock  = Lock()
+            self.locks = dict()
+            self.pid   = os.getpid()
+
+    def acquire(self, key : str) -> object:
+
+        offset = __key_hash__( key ) % ( 1 << 31 )
+
+        self.__check__()
+
+        # thread lock of offset, [ lock, number of threads using it ]
+        with self.lock:
+            entry     = self.locks.setdefault( offset, [ Lock(), 0 ] )
+            entry[1] += 1
+
+        entry[0].acquire()
+
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, offset)
+
+        except BaseException:
+            self.__release_thread__( offset )
+            raise
+
+        return offset
+
+    def release(self, token : object) -> None:
+
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, token)
+
+        finally:
+            self.__release_thread__( token )
+
+    def __release_thread__(self, offset : int) -> None:
+
+        with self.lock:
+
+            entry     = self.locks[ offset ]
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del self.locks[ offset ]
+
+        entry[0].release()
+
+class AdvisoryLock(object):
+
+    """ Cluster-wide lock by key : a PostgreSQL advisory lock of the database connection of the thread """
+
+    def acquire(self, key : str) -> object:
+
+        token = __key_hash__( key )
+
+        with connection.cursor() as cursor:
+            cursor.execute( 'SELECT pg_advisory_lock(%s)', [ token ] )
+
+        return token
+
+    def release(self, token : object) -> None:
+
+        with connection.cursor() as cursor:
+            cursor.execute( 'SELECT pg_advisory_unlock(%s)', [ token ] )
+
+
+
+# Single flight
+#-----------------------------------------------------------------------------------------------------------------------
+
+# a call in flight
+class __Call__(object):
+
+    __slots__ = ( 'event', 'value', 'error' )
+
+    def __init__(self):
+
+        self.event = Event()
+        self.value = None
+        self.error = None
+
+class SingleFlight(object):
+
+    """
+    Concurrent calls with the same key wait on the first one (the leader) & share its result. Between processes, an
+    optional lock (FileLock or AdvisoryLock) serializes leaders of the same key : fun must then read the shared storage
+    first & write its result there before returning, so the next leader finds it (see is_shared).
+    """
+
+    def __init__(self, process_lock : object = None):
+
+        self.process_lock = process_lock
+        self.calls        = dict()
+        self.lock         = Lock()
+
+        # metrics
+        self.leaders      = 0
+        self.followers    = 0
+        self.wait_time    = 0.
+        self.max_wait     = 0.
+        self.lock_waits   = 0
+        self.lock_time    = 0.
+
+    def do(self, key : str, fun) -> object:
+
+        """ Get result of fun(), called once for all concurrent calls of key """
+
+        with self.lock:
+
+            call   = self.calls.get( key )
+            leader = call is None
+
+            if leader:
+                call = __Call__()
+                self.calls[ key ] = call
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        # wait for the leader
+        if not leader:
+
+            start = time.monotonic()
+            call.event.wait()
+            self.__wait__( time.monotonic() - start )
+
+            if call.error is not None:
+                raise call.error
+
+            return call.value
+
+        try:
+            call.value = self.__run__(key, fun)
+
+        except Exception as error:
+            call.error = error
+            raise
+
+        finally:
+
+            with self.lock:
+                self.calls.pop( key, None )
+
+            call.event.set()
+
+        return call.value
+
+    def __run__(self, key : str, fun) -> object:
+
+        """ Call fun, holding the lock of key between processes """
+
+        if self.process_lock is None:
+            return fun()
+
+        start = time.monotonic()
+        token = self.process_lock.acquire( key )
+
+        with self.lock:
+            self.lock_waits += 1
+            self.lock_time  += time.monotonic() - start
+
+        try:
+            return fun()
+
+        finally:
+            self.process_lock.release( token )
+
+    def is_shared(self) -> bool:
+
+        """ Test if leaders are serialized between processes (results must be written before the lock is released) """
+
+        return self.process_lock is not None
+
+    def __wait__(self, seconds : float) -> None:
+
+        with self.lock:
+            self.wait_time += seconds
+            self.max_wait   = max( self.max_wait, seconds )
+
+    def stats(self) -> dict():
+
+        """ Get counters : calls done (leaders), calls coalesced (followers) & their wait, waits on process lock """
+
+        with self.lock:
+
+            return {
+                'leaders'    : self.leaders,
+                'followers'  : self.followers,
+                'in_flight'  : len( self.calls ),
+                'wait_time'  : self.wait_time,
+                'max_wait'   : self.max_wait,
+                'lock_waits' : self.lock_waits,
+                'lock_time'  : self.lock_time
+            }
+
+# one single flight by kind of tile
+IMAGE_TILE_FLIGHT  = SingleFlight( get_process_lock() )
+RASTER_TILE_FLIGHT = SingleFlight( get_process_lock() )
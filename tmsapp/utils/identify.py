@@ -0,0 +1,216 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   tmsapp.constant import *
+from   .tools          import __pixel_size__, __tile_world_bbox__, __tile_index_bbox__
+from   .cache          import TileCache
+import numpy           as     np
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get max number of tiles read by a statistics request
+def get_identify_max_tiles() -> int:
+
+    """ Get max number of tiles read for the statistics of a bbox (settings.TMS_IDENTIFY_MAX_TILES) """
+
+    return max( 1, getattr(settings, 'TMS_IDENTIFY_MAX_TILES', IDENTIFY_MAX_TILES) )
+
+# get srid of requests
+def get_identify_srid() -> int:
+
+    """ Get SRID of coordinates of identify & statistics requests, when not given (settings.TMS_IDENTIFY_SRID) """
+
+    return getattr(settings, 'TMS_IDENTIFY_SRID', IDENTIFY_SRID)
+
+# get number of bins of histograms
+def get_identify_bins(bins : int = None) -> int:
+
+    """ Get number of bins of histograms (settings.TMS_IDENTIFY_BINS when not given), at most IDENTIFY_MAX_BINS """
+
+    bins = getattr(settings, 'TMS_IDENTIFY_BINS', IDENTIFY_BINS) if bins is None else bins
+
+    return min( IDENTIFY_MAX_BINS, max( 1, bins ) )
+
+# create the cache of decoded tiles
+def __make_array_cache__() -> TileCache:
+
+    """ Create the cache of decoded raster tiles, bounded by settings.TMS_IDENTIFY_CACHE_MAX_BYTES """
+
+    max_bytes = getattr(settings, 'TMS_IDENTIFY_CACHE_MAX_BYTES', IDENTIFY_CACHE_MAX_BYTES)
+
+    return TileCache(max_bytes=max_bytes, ttl=None)
+
+# decoded raster tiles (bands, nodata), by layer name
+RASTER_ARRAY_CACHE = __make_array_cache__()
+
+
+
+# Tiles of a point or a bbox
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get zoom of a bbox
+def get_bbox_zoom(bbox : tuple(), minz : int, maxz : int, world_size : float, max_tiles : int = None) -> int:
+
+    """
+    Get the highest zoom between minz & maxz where bbox (left, top, right, bottom) is covered by at most max_tiles
+    tiles, None if bbox needs more tiles at minz
+    """
+
+    max_tiles = get_identify_max_tiles() if max_tiles is None else max_tiles
+
+    for zoom in range(maxz, minz - 1, -1):
+
+        xmin, ymin, xmax, ymax = __bbox_tiles__(bbox, zoom, world_size)
+
+        if ( xmax - xmin + 1 ) * ( ymax - ymin + 1 ) <= max_tiles:
+            return zoom
+
+    return None
+
+# get tiles of a bbox
+def __bbox_tiles__(bbox : tuple(), zoom : int, world_size : float) -> (int, int, int, int):
+
+    """ Get (xmin, ymin, xmax, ymax) indexes of tiles of bbox (left, top, right, bottom), clipped to the world """
+
+    last = 2 ** zoom - 1
+
+    return tuple( min( last, max( 0, index ) ) for index in __tile_index_bbox__(bbox, zoom, world_size) )
+
+# get pixel window of a bbox in a tile
+def __tile_window__(bbox : tuple(), world_size : float, tile_size : int, zoom : int, x : int,
+                    y : int) -> (int, int, int, int):
+
+    """ Get (row0, row1, col0, col1) of pixels of tile whose center is in bbox (left, top, right, bottom) """
+
+    left, top, _, _ = __tile_world_bbox__(x, y, zoom, world_size, tile_size)
+    pixel_size      = __pixel_size__(world_size, tile_size, zoom)
+
+    col0 = int( np.clip( np.ceil( ( bbox[0] - left ) / pixel_size - 0.5 ), 0, tile_size ) )
+    col1 = int( np.clip( np.ceil( ( bbox[2] - left ) / pixel_size - 0.5 ), 0, tile_size ) )
+    row0 = int( np.clip( np.ceil( ( top - bbox[1] ) / pixel_size - 0.5 ), 0, tile_size ) )
+    row1 = int( np.clip( np.ceil( ( top - bbox[3] ) / pixel_size - 0.5 ), 0, tile_size ) )
+
+    return row0, row1, col0, col1
+
+# get valid pixels of a band
+def __valid__(band : np.ndarray, nodata : float) -> np.ndarray:
+
+    valid = np.ones( band.shape, dtype=bool ) if nodata is None else band != nodata
+
+    # NaN is nodata of float bands
+    if np.issubdtype( band.dtype, np.floating ):
+        valid &= ~np.isnan( band )
+
+    return valid
+
+
+
+# Identify & statistics
+#-----------------------------------------------------------------------------------------------------------------------
+
+def identify_point(load_fun, point : tuple(), zoom : int, world_size : float) -> dict():
+
+    """
+    Get values of bands at a point (x, y in WEB_MERCATOR_SRID) from the tile of zoom under it, load_fun(zoom, x, y)
+    give decoded tile (bands, nodata), None if tile not exist. A nodata value is None.
+    """
+
+    x, y, _, _ = __bbox_tiles__((point[0], point[1], point[0], point[1]), zoom, world_size)
+
+    report = { 'zoom' : zoom, 'tile' : [ zoom, x, y ], 'pixel' : None, 'values' : None }
+    tile   = load_fun(zoom, x, y)
+
+    if tile is None:
+        return report
+
+    # pixel of point, tiles are square
+    bands, nodata   = tile
+    tile_size       = bands.shape[ -1 ]
+    left, top, _, _ = __tile_world_bbox__(x, y, zoom, world_size, tile_size)
+    pixel_size      = __pixel_size__(world_size, tile_size, zoom)
+
+    col = min( tile_size - 1, max( 0, int( ( point[0] - left ) / pixel_size ) ) )
+    row = min( tile_size - 1, max( 0, int( ( top - point[1] ) / pixel_size ) ) )
+
+    values = bands[ :, row, col ]
+    valid  = __valid__(values, nodata)
+
+    report[ 'pixel'      ] = [ col, row ]
+    report[ 'resolution' ] = pixel_size
+    report[ 'values'     ] = [ value.item() if ok else None for value, ok in zip(values, valid) ]
+
+    return report
+
+def zonal_stats(load_fun, bbox : tuple(), zoom : int, world_size : float, bins : int) -> dict():
+
+    """
+    Get statistics of bands (count, min, max, mean, std, histogram of bins between min & max) of pixels whose center is
+    in bbox (left, top, right, bottom in WEB_MERCATOR_SRID), from tiles of zoom. load_fun(zoom, x, y) give decoded tile
+    (bands, nodata), None if tile not exist.
+    """
+
+    xmin, ymin, xmax, ymax = __bbox_tiles__(bbox, zoom, world_size)
+
+    # valid values of each band in each tile window (views on cached tiles)
+    windows    = []
+    pixels     = 0
+    resolution = None
+
+    for x in range(xmin, xmax + 1):
+        for y in range(ymin, ymax + 1):
+
+            tile = load_fun(zoom, x, y)
+
+            if tile is None:
+                continue
+
+            bands, nodata          = tile
+            row0, row1, col0, col1 = __tile_window__(bbox, world_size, bands.shape[ -1 ], zoom, x, y)
+
+            # bbox only touch the tile
+            if row1 <= row0 or col1 <= col0:
+                continue
+
+            pixels    += ( row1 - row0 ) * ( col1 - col0 )
+            resolution = __pixel_size__(world_size, bands.shape[ -1 ], zoom)
+            windows.append( [ band[ row0:row1, col0:col1 ][ __valid__(band[ row0:row1, col0:col1 ], nodata) ]
+                              for band in bands ] )
+
+    report = { 'zoom' : zoom, 'tiles' : ( xmax - xmin + 1 ) * ( ymax - ymin + 1 ), 'pixels' : pixels,
+               'resolution' : resolution, 'bands' : [] }
+
+    count = max( [ len( window ) for window in windows ] or [ 0 ] )
+
+    for i in range( count ):
+
+        values = [ window[ i ] for window in windows if window[ i ].size > 0 ]
+        size   = sum( value.size for value in values )
+
+        if size == 0:
+            report[ 'bands' ].append({ 'count' : 0 })
+            continue
+
+        # first pass : min, max & mean, accumulated in float64
+        low   = min( value.min() for value in values ).item()
+        high  = max( value.max() for value in values ).item()
+        mean  = sum( value.sum( dtype=np.float64 ) for value in values ) / size
+
+        # second pass : variance & histogram on the common range
+        var   = sum( np.square( value - mean ).sum() for value in values ) / size
+        hist  = sum( np.histogram(value, bins=bins, range=( low, high ))[0] for value in values )
+        edges = np.histogram_bin_edges(values[0], bins=bins, range=( low, high ))
+
+        report[ 'bands' ].append({
+            'count'     : int( size ),
+            'min'       : low,
+            'max'       : high,
+            'mean'      : float( mean ),
+            'std'       : float( np.sqrt( var ) ),
+            'histogram' : { 'edges' : edges.tolist(), 'counts' : hist.tolist() }
+        })
+
+    return report
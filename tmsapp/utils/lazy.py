@@ -0,0 +1,255 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   tmsapp.constant import *
+from   .tools          import __read_window__, __make_imagetile__, __make_rastertile__, __merge_png__, __merge_rasters__
+from   .sink           import TileSink
+from   threading       import local, RLock
+from   io              import BytesIO
+from   zipfile         import ZipFile
+import rasterio        as     rio
+import shutil
+import os
+
+
+
+# Lazy zooms
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get eager max zoom of a layer
+def get_eager_zoom(minz : int, maxz : int, eagerz : int) -> int:
+
+    """ Get last zoom rendered at tiling, None when all zooms are (zooms above are rendered on request) """
+
+    if eagerz is None or eagerz >= maxz:
+        return None
+
+    return max( minz, eagerz )
+
+# test if a tile is rendered on request
+def is_lazy(zoom : int, eager_zoom : int, maxz : int) -> bool:
+
+    return eager_zoom is not None and eager_zoom < zoom <= maxz
+
+# get tile of eager max zoom under a tile
+def get_eager_tile(zoom : int, x : int, y : int, eager_zoom : int) -> tuple():
+
+    """ Get ancestor (zoom, x, y) of a tile at eager max zoom, the tile itself if not lazy """
+
+    if eager_zoom is None or zoom <= eager_zoom:
+        return zoom, x, y
+
+    shift = zoom - eager_zoom
+
+    return eager_zoom, x >> shift, y >> shift
+
+
+
+# Sources
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get directory of sources of a layer
+def get_source_dir(kind : str, layer_id : int) -> str:
+
+    """ Get durable directory of the sources extracted from the zip of a layer (MEDIA_ROOT/sources/<kind>/<id>) """
+
+    return os.path.join(settings.MEDIA_ROOT, TILE_SOURCE_DIR, kind, str( layer_id ))
+
+# get sources of a layer file
+def get_sources(path : str, dst : str) -> list():
+
+    """ Get source paths of a layer file : the tif itself, or the tifs extracted from a zip in dst (none without file) """
+
+    if path is None:
+        return []
+
+    if path.split('.')[ -1 ] == 'zip':
+        with ZipFile(path, 'r') as zip_obj:
+            return [ os.path.join(dst, name) for name in zip_obj.namelist() ]
+
+    return [ path ]
+
+# extract sources of a layer file
+def extract_sources(path : str, dst : str) -> list():
+
+    """ Extract the tifs of a zip layer file in dst (replacing the previous ones), get source paths (see get_sources) """
+
+    if path.split('.')[ -1 ] == 'zip':
+
+        # extract beside dst, lazy renders keep reading the previous sources meanwhile
+        temp = '%s.%d.tmp' % (dst, os.getpid())
+        old  = '%s.%d.old' % (dst, os.getpid())
+
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+
+        try:
+
+            with ZipFile(path, 'r') as zip_obj:
+                zip_obj.extractall( temp )
+
+        except Exception:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+
+        # swap directories (a non empty directory can not be replaced), opened sources stay readable
+        if os.path.exists( dst ):
+            os.replace(dst, old)
+
+        os.replace(temp, dst)
+        shutil.rmtree(old, ignore_errors=True)
+
+    return get_sources(path, dst)
+
+# opened sources of the current process & thread (rasterio handles are not thread safe)
+_SOURCES = local()
+
+def __open_source__(path : str) -> rio.DatasetReader:
+
+    """ Get rasterio handle of a source, reopened when the file change, None if file not exist """
+
+    if getattr(_SOURCES, 'pid', None) != os.getpid():
+        _SOURCES.pid      = os.getpid()
+        _SOURCES.datasets = dict()
+
+    try:
+        version = os.stat( path ).st_mtime_ns
+
+    except FileNotFoundError:
+        return None
+
+    item = _SOURCES.datasets.get( path )
+
+    if item is None or item[0] != version:
+
+        if item is not None:
+            item[1].close()
+
+        item = ( version, rio.open(path, 'r') )
+        _SOURCES.datasets[ path ] = item
+
+    return item[1]
+
+def __read_sources__(paths : list(), world_size : float, tile_size : int, zoom : int, x : int, y : int) -> list():
+
+    """ Get (dataset, bands, transform) of sources under a tile """
+
+    windows = []
+
+    for path in paths:
+
+        src_dataset = __open_source__( path )
+
+        if src_dataset is None:
+            continue
+
+        src_bands, src_transform = __read_window__(src_dataset, world_size, tile_size, zoom, (x, y, x, y))
+
+        if src_bands is not None:
+            windows.append( (src_dataset, src_bands, src_transform) )
+
+    return windows
+
+
+
+# Render on request
+#-----------------------------------------------------------------------------------------------------------------------
+
+def render_imagetile(paths : list(), world_size : float, tile_size : int, zoom : int, x : int, y : int) -> tuple():
+
+    """ Render an image tile (zoom, x, y, BytesIO) from sources (in WEB_MERCATOR_SRID), None if no source """
+
+    tile = None
+
+    for window in __read_sources__(paths, world_size, tile_size, zoom, x, y):
+
+        other = __make_imagetile__(*window, world_size, tile_size, zoom, x, y)
+
+        # tile shared by sources, merge them
+        if tile is not None:
+            other = other[ :3 ] + ( BytesIO( __merge_png__( tile[3].getvalue(), other[3].getvalue() ) ), )
+
+        tile = other
+
+    return tile
+
+def render_rastertile(paths : list(), world_size : float, tile_size : int, zoom : int, x : int, y : int,
+                      style : object = None) -> tuple():
+
+    """ Render a raster tile (zoom, x, y, GDALRaster, BytesIO) from sources, png rendered by style, None if no source """
+
+    tile = None
+
+    for window in __read_sources__(paths, world_size, tile_size, zoom, x, y):
+
+        other = __make_rastertile__(*window, world_size, tile_size, zoom, x, y, style)
+
+        # tile shared by sources, merge them
+        if tile is not None:
+            image = BytesIO( __merge_png__( tile[4].getvalue(), other[4].getvalue() ) )
+            other = other[ :3 ] + ( __merge_rasters__( tile[3], other[3] ), image )
+
+        tile = other
+
+    return tile
+
+
+
+# Persistence
+#-----------------------------------------------------------------------------------------------------------------------
+
+class LazyWriter(object):
+
+    """
+    Tiles rendered on request are written in background, one tile sink by layer version. A synchronous push writes
+    the tile at once (renders coalesced between processes, see SingleFlight.is_shared)
+    """
+
+    def __init__(self):
+
+        self.sinks = dict()
+        self.lock  = RLock()
+
+    def push(self, key : tuple(), write_fun, tile : tuple(), sync : bool = False) -> None:
+
+        """ Queue a tile, write_fun(tiles) is used by the first push of key. When sync, the tile is written at once """
+
+        if sync:
+
+            # a failed write is dropped, the tile is rendered again on next request
+            try:
+                write_fun( [ tile ] )
+            except Exception:
+                pass
+
+            return
+
+        old = []
+
+        with self.lock:
+
+            sink = self.sinks.get( key )
+
+            # written one by one, as soon as possible, a failed write is dropped (the tile is rendered again on request)
+            if sink is None:
+
+                sink = TileSink(write_fun, batch_size=1, drop_errors=True)
+                self.sinks[ key ] = sink
+
+                # sinks of previous versions of the layer (key is layer id, version) are closed
+                old = [ self.sinks.pop( other ) for other in list( self.sinks ) if other[0] == key[0] and other != key ]
+
+            sink( *tile )
+
+        # stop writer threads of old sinks, their pending tiles are written first
+        for other in old:
+
+            try:
+                other.close()
+            except Exception:
+                pass
+
+# writers of the process
+IMAGE_LAZY_WRITER  = LazyWriter()
+RASTER_LAZY_WRITER = LazyWriter()
@@ -0,0 +1,289 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.contrib.gis.geos import Polygon, MultiPolygon
+from   tmsapp.constant         import *
+from   PIL                     import Image
+from   io                      import BytesIO
+import sqlite3
+import time
+import os
+
+
+
+# Utils
+#-----------------------------------------------------------------------------------------------------------------------
+
+# flip y between XYZ (tile server) & TMS (mbtiles) schemes, the flip is its own inverse
+def __flip_y__(zoom : int, y : int) -> int:
+    return ( 1 << zoom ) - 1 - y
+
+# tile formats of MBTiles files (format of metadata), tiles are imported as png
+MBTILES_FORMATS = ( 'png', 'jpg', 'jpeg', 'webp' )
+
+# make a throughput report
+def __make_stats__(tiles : int, size : int, start_time : float) -> dict():
+
+    seconds = max( time.time() - start_time, 1e-9 )
+
+    return {
+        'tiles'            : tiles,
+        'bytes'            : size,
+        'seconds'          : seconds,
+        'tiles_per_second' : tiles / seconds,
+        'bytes_per_second' : size  / seconds
+    }
+
+
+
+# Metadata
+#-----------------------------------------------------------------------------------------------------------------------
+
+def make_metadata(name : str, geom : object, minz : int, maxz : int, description : str = '') -> dict():
+
+    """ Make metadata of a layer, geom in WEB_MERCATOR_SRID (bounds are written in lon/lat) """
+
+    metadata = {
+        'name'        : name,
+        'type'        : 'overlay',
+        'version'     : '1.0',
+        'description' : description,
+        'format'      : 'png',
+        'minzoom'     : minz,
+        'maxzoom'     : maxz
+    }
+
+    if geom is not None:
+        metadata[ 'bounds' ] = ','.join( '%.6f' % v for v in geom.transform(4326, clone=True).extent )
+
+    return metadata
+
+def get_metadata_format(metadata : dict()) -> str:
+
+    """ Get format of tiles of metadata (png when not given), raise ValueError if tiles are not images """
+
+    frmt = metadata.get( 'format', 'png' ).lower()
+
+    if frmt not in MBTILES_FORMATS:
+        raise ValueError( 'MBTiles format "%s" is not supported (%s)' % (frmt, ', '.join( MBTILES_FORMATS )) )
+
+    return frmt
+
+def __to_png__(data : bytes) -> bytes:
+
+    """ Convert a jpg or webp tile to png """
+
+    buffer = BytesIO()
+    Image.open( BytesIO( data ) ).save(fp=buffer, format='PNG')
+
+    return buffer.getvalue()
+
+def get_metadata_geom(metadata : dict()) -> MultiPolygon:
+
+    """ Get bounds of metadata as MultiPolygon in WEB_MERCATOR_SRID, None if no bounds """
+
+    if 'bounds' not in metadata:
+        return None
+
+    # clamp to the web mercator latitude range
+    xmin, ymin, xmax, ymax = [ float( v ) for v in metadata[ 'bounds' ].split(',') ]
+    ymin, ymax             = max( ymin, -85.0511 ), min( ymax, 85.0511 )
+
+    polygon = Polygon.from_bbox( (xmin, ymin, xmax, ymax) )
+    polygon.srid = 4326
+
+    return MultiPolygon([ polygon.transform(WEB_MERCATOR_SRID, clone=True) ], srid=WEB_MERCATOR_SRID)
+
+
+
+# MBTiles writer
+#-----------------------------------------------------------------------------------------------------------------------
+
+class MBTilesWriter(object):
+
+    """ Streaming MBTiles (SQLite) writer, tiles are inserted by batch of batch_size """
+
+    def __init__(self, path : str, batch_size : int = MBTILES_BATCH_SIZE):
+
+        # always start from an empty file
+        if os.path.exists( path ):
+            os.remove( path )
+
+        self.batch_size = batch_size
+        self.batch      = []
+        self.count      = 0
+        self.size       = 0
+
+        self.db = sqlite3.connect( path )
+
+        # bulk load, the file is only valid once closed
+        self.db.execute( 'PRAGMA synchronous = OFF' )
+        self.db.execute( 'PRAGMA journal_mode = OFF' )
+
+        self.db.execute( 'CREATE TABLE metadata (name TEXT, value TEXT)' )
+        self.db.execute( 'CREATE TABLE tiles '
+                         '(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)' )
+
+    def set_metadata(self, metadata : dict()) -> None:
+
+        """ Write metadata (name, format, bounds, minzoom, maxzoom, ...) """
+
+        self.db.execute( 'DELETE FROM metadata' )
+        self.db.executemany( 'INSERT INTO metadata (name, value) VALUES (?, ?)',
+                             [ (name, str( value )) for name, value in metadata.items() if value is not None ] )
+
+    def write(self, zoom : int, x : int, y : int, data : bytes) -> None:
+
+        """ Write a tile, y in XYZ scheme """
+
+        self.batch.append( (zoom, x, __flip_y__(zoom, y), sqlite3.Binary( data )) )
+
+        self.count += 1
+        self.size  += len( data )
+
+        if len( self.batch ) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+
+        """ Insert pending tiles in one transaction """
+
+        with self.db:
+            self.db.executemany( 'INSERT INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)',
+                                 self.batch )
+
+        self.batch = []
+
+    def close(self) -> None:
+
+        """ Flush, index & close file """
+
+        self.flush()
+
+        self.db.execute( 'CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)' )
+        self.db.execute( 'CREATE UNIQUE INDEX name ON metadata (name)' )
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self) -> object:
+        return self
+
+    def __exit__(self, *_args) -> None:
+        self.close()
+
+
+
+# MBTiles reader
+#-----------------------------------------------------------------------------------------------------------------------
+
+class MBTilesReader(object):
+
+    """ MBTiles (SQLite) reader, tiles are given in XYZ scheme """
+
+    def __init__(self, path : str):
+
+        self.db = sqlite3.connect( 'file:%s?mode=ro' % path, uri=True, check_same_thread=False )
+
+    def get_metadata(self) -> dict():
+
+        """ Get metadata as dictionary """
+
+        return dict( self.db.execute( 'SELECT name, value FROM metadata' ).fetchall() )
+
+    def count(self) -> int:
+
+        """ Get number of tiles """
+
+        return self.db.execute( 'SELECT COUNT(*) FROM tiles' ).fetchone()[0]
+
+    def zooms(self) -> tuple():
+
+        """ Get (min zoom, max zoom) of tiles """
+
+        return self.db.execute( 'SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles' ).fetchone()
+
+    def get(self, zoom : int, x : int, y : int) -> bytes:
+
+        """ Get tile data, None if tile not exist """
+
+        query = 'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?'
+        row   = self.db.execute( query, (zoom, x, __flip_y__(zoom, y)) ).fetchone()
+
+        return None if row is None else bytes( row[0] )
+
+    def iter_tiles(self, batch_size : int = MBTILES_BATCH_SIZE) -> object:
+
+        """ Iterate on all tiles (zoom, x, y, data), batch_size tiles are in memory at once """
+
+        cursor = self.db.execute( 'SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles' )
+
+        while True:
+
+            rows = cursor.fetchmany( batch_size )
+
+            if len( rows ) == 0:
+                break
+
+            for zoom, x, y, data in rows:
+                yield zoom, x, __flip_y__(zoom, y), bytes( data )
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> object:
+        return self
+
+    def __exit__(self, *_args) -> None:
+        self.close()
+
+
+
+# Export & import
+#-----------------------------------------------------------------------------------------------------------------------
+
+def export_tiles(tiles : object, path : str, metadata : dict(), batch_size : int = MBTILES_BATCH_SIZE) -> dict():
+
+    """ Write tiles, an iterable of (zoom, x, y, data), in a new MBTiles file. Return throughput report """
+
+    start_time = time.time()
+
+    with MBTilesWriter(path, batch_size) as writer:
+
+        writer.set_metadata( metadata )
+
+        for zoom, x, y, data in tiles:
+            writer.write(zoom, x, y, data)
+
+    return __make_stats__(writer.count, writer.size, start_time)
+
+def import_tiles(path : str, push_batch_fun, batch_size : int = MBTILES_BATCH_SIZE) -> dict():
+
+    """
+    Read tiles of a MBTiles file & give them to push_batch_fun by batch of (zoom, x, y, png), tiles of another format
+    are converted to png. Return report
+    """
+
+    start_time = time.time()
+    count      = 0
+    size       = 0
+    batch      = []
+
+    with MBTilesReader( path ) as reader:
+
+        convert = get_metadata_format( reader.get_metadata() ) != 'png'
+
+        for zoom, x, y, data in reader.iter_tiles( batch_size ):
+
+            batch.append( (zoom, x, y, __to_png__( data ) if convert else data) )
+
+            count += 1
+            size  += len( data )
+
+            if len( batch ) >= batch_size:
+                push_batch_fun( batch )
+                batch = []
+
+        if len( batch ) > 0:
+            push_batch_fun( batch )
+
+    return __make_stats__(count, size, start_time)
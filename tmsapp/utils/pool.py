@@ -0,0 +1,255 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   concurrent.futures   import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from   django.conf          import settings
+from   django.db            import connections, transaction
+from   tmsapp.constant      import *
+from   .progress            import STAGE_TIMER, StageTimer
+from   multiprocessing.util import Finalize
+import multiprocessing      as     mp
+import rasterio             as     rio
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get number of tiling processes
+def get_workers(workers : int = None) -> int:
+
+    """ Get number of tiling processes (argument, then settings.TMS_TILING_WORKERS, then cpu count) """
+
+    if workers is None:
+        workers = getattr(settings, 'TMS_TILING_WORKERS', TILING_WORKERS)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    return max( 1, workers )
+
+# get size of a work unit
+def get_quadrant_size() -> int:
+
+    """ Get number of tiles by side of a work unit (settings.TMS_TILING_QUADRANT_SIZE) """
+
+    return getattr(settings, 'TMS_TILING_QUADRANT_SIZE', TILING_QUADRANT_SIZE)
+
+# get size of a metatile
+def get_metatile(metatile : int = None) -> int:
+
+    """ Get number of tiles by side of a metatile (argument, then settings.TMS_TILING_METATILE) """
+
+    if metatile is None:
+        metatile = getattr(settings, 'TMS_TILING_METATILE', TILING_METATILE)
+
+    return max( 1, metatile )
+
+
+
+# get gdal block cache size
+def get_gdal_cache() -> int:
+
+    """ Get gdal block cache size of a tiling process in Mb (settings.TMS_TILING_GDAL_CACHE) """
+
+    return getattr(settings, 'TMS_TILING_GDAL_CACHE', TILING_GDAL_CACHE)
+
+# get number of retries of a failed work unit
+def get_unit_retries() -> int:
+
+    """ Get number of retries of a failed work unit before failing the tiling (settings.TMS_TILING_UNIT_RETRIES) """
+
+    return max( 0, getattr(settings, 'TMS_TILING_UNIT_RETRIES', TILING_UNIT_RETRIES) )
+
+
+
+# Worker
+#-----------------------------------------------------------------------------------------------------------------------
+
+# state of the current process : gdal environment, rasterio handle, render & push functions
+_WORKER = dict()
+
+def __worker_init__(src : str, render_fun, push_in_db_fun, timer : StageTimer = None) -> None:
+
+    """ Open rasterio handle of the worker (no handle when src is None), stages are timed with timer """
+
+    # gdal block cache, shared by neighbouring windows read by the worker
+    _WORKER[ 'env'     ] = rio.Env( GDAL_CACHEMAX=get_gdal_cache() )
+    _WORKER[ 'env'     ].__enter__()
+
+    _WORKER[ 'dataset' ] = None if src is None else rio.open(src, 'r')
+    _WORKER[ 'render'  ] = render_fun
+    _WORKER[ 'push'    ] = push_in_db_fun
+
+    # stages are timed by unit, with the timer of the tiling only (a forked worker has its own copy)
+    _WORKER[ 'timer'   ] = StageTimer() if timer is None else timer
+    _WORKER[ 'timer'   ].reset()
+
+    STAGE_TIMER.bind( _WORKER[ 'timer' ] )
+
+def __worker_close__() -> None:
+
+    """ Close rasterio handle of the worker """
+
+    dataset = _WORKER.pop( 'dataset' )
+
+    if dataset is not None:
+        dataset.close()
+
+    _WORKER.pop( 'env' ).__exit__(None, None, None)
+    _WORKER.clear()
+
+    STAGE_TIMER.bind( None )
+
+def __pool_worker_init__(*args : tuple()) -> None:
+
+    """ Init a worker of the pool, closed when its process exits """
+
+    __worker_init__( *args )
+
+    Finalize(None, __pool_worker_close__, exitpriority=10)
+
+def __pool_worker_close__() -> None:
+
+    """ Stop the tile sink of the worker (pending tiles are written, writer connection is closed), then close worker """
+
+    push = _WORKER.get( 'push' )
+
+    try:
+        if hasattr(push, 'close'):
+            push.close()
+
+    finally:
+        __worker_close__()
+
+def __worker_run__(world_size : float, tile_size : int, zoom : int, quadrant : tuple()) -> (int, dict()):
+
+    """ Render a work unit & push its tiles in one transaction, return number of tiles & seconds by stage """
+
+    # render (source is read window by window)
+    tiles = _WORKER[ 'render' ](_WORKER[ 'dataset' ], world_size, tile_size, zoom, quadrant)
+
+    push = _WORKER[ 'push' ]
+
+    # push in a tile sink, written when unit is done
+    if hasattr(push, 'flush'):
+
+        for tile in tiles:
+            push( *tile )
+
+        push.flush()
+
+    # push as one batch
+    else:
+
+        with transaction.atomic():
+            for tile in tiles:
+                push( *tile )
+
+    return len( tiles ), _WORKER[ 'timer' ].reset()
+
+def __worker_retry__(retries : int, world_size : float, tile_size : int, zoom : int, quadrant : tuple()) -> tuple():
+
+    """ Run a work unit, again at most retries times when it fails (tiles already written are merged) """
+
+    for attempt in range(retries + 1):
+
+        try:
+            return __worker_run__(world_size, tile_size, zoom, quadrant)
+
+        except Exception:
+
+            if attempt == retries:
+                raise
+
+
+
+# Pool
+#-----------------------------------------------------------------------------------------------------------------------
+
+def run_units(render_fun, src : str, world_size : float, tile_size : int, units : list(), push_in_db_fun,
+              workers : int = None, progress_fun = None, timer : StageTimer = None) -> int:
+
+    """
+    Render work units (zoom, quadrant) of src with render_fun and push tiles with push_in_db_fun.
+
+    Work units are dispatched on a pool of processes, each one with its own rasterio handle and database connection,
+    and are written in any order. push_in_db_fun can be a TileSink, flushed at the end of each unit so a unit is
+    written when run_units returns. progress_fun(zoom, quadrant, tiles, seconds by stage) is called after each unit
+    is written, in the current process, & can stop the tiling by raising. Stages are timed with timer (the timer of the
+    tiling progress). A failed unit is run again (settings.TMS_TILING_UNIT_RETRIES). Return the number of tiles.
+    """
+
+    workers = min( get_workers( workers ), max( 1, len( units ) ) )
+    retries = get_unit_retries()
+
+    # report a done unit
+    def done(unit : tuple(), result : tuple()) -> int:
+
+        if progress_fun is not None:
+            progress_fun( *unit, *result )
+
+        return result[0]
+
+    # sequential, in the current process
+    if workers == 1:
+
+        __worker_init__(src, render_fun, push_in_db_fun, timer)
+
+        try:
+            return sum( done( unit, __worker_retry__(retries, world_size, tile_size, *unit) ) for unit in units )
+
+        finally:
+            __worker_close__()
+
+    # close connections before fork, so each worker open its own connection
+    connections.close_all()
+
+    # fork keep django setup & functions without pickling
+    context = mp.get_context( 'fork' )
+    initargs = (src, render_fun, push_in_db_fun, timer)
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=__pool_worker_init__,
+                                   initargs=initargs)
+
+    with executor:
+
+        # running units & their attempt
+        futures = { executor.submit(__worker_run__, world_size, tile_size, *unit) : (unit, 0) for unit in units }
+        count   = 0
+
+        try:
+
+            while len( futures ) > 0:
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+
+                    unit, attempt = futures.pop( future )
+
+                    try:
+                        result = future.result()
+
+                    except Exception:
+
+                        if attempt == retries:
+                            raise
+
+                        # run failed unit again
+                        futures[ executor.submit(__worker_run__, world_size, tile_size, *unit) ] = (unit, attempt + 1)
+                        continue
+
+                    # errors of progress (stopped tiling, checkpoint) are not retried
+                    count += done( unit, result )
+
+        except BaseException:
+
+            # tiling failed or stopped, drop units not started
+            for future in futures:
+                future.cancel()
+
+            raise
+
+        return count
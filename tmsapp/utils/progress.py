@@ -0,0 +1,311 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   tmsapp.constant import *
+from   contextlib      import contextmanager
+from   abc             import ABC, abstractmethod
+from   threading       import Lock, local
+import time
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# timed stages of a tiling : reprojection of the source, then for each tile read, warp, alpha, encode & write
+STAGES = ( 'reproject', 'read', 'warp', 'alpha', 'encode', 'write' )
+
+# get interval between two saves of the progress
+def get_progress_interval(interval : float = None) -> float:
+
+    """ Get min seconds between two saves of a tiling progress (argument, then settings.TMS_TILING_PROGRESS_INTERVAL) """
+
+    if interval is None:
+        interval = getattr(settings, 'TMS_TILING_PROGRESS_INTERVAL', TILING_PROGRESS_INTERVAL)
+
+    return interval
+
+
+
+# Stage timer
+#-----------------------------------------------------------------------------------------------------------------------
+
+class StageTimer(object):
+
+    """
+    Wall time by stage of a tiling in the current process, summed over the threads bound to it (renderer & tile sink
+    writer, see BoundStageTimer). A timer is not shared with forked processes : each one starts from zero.
+    """
+
+    def __init__(self):
+
+        self.pid = None
+
+    def __check__(self) -> None:
+
+        # a lock held by another thread at fork would never be released
+        if self.pid != os.getpid():
+            self.pid     = os.getpid()
+            self.lock    = Lock()
+            self.seconds = dict.fromkeys( STAGES, 0. )
+
+    def add(self, stage : str, seconds : float) -> None:
+
+        self.__check__()
+
+        with self.lock:
+            self.seconds[ stage ] += seconds
+
+    @contextmanager
+    def stage(self, stage : str) -> None:
+
+        """ Time a block of code as stage """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def reset(self) -> dict():
+
+        """ Get seconds by stage since last reset """
+
+        self.__check__()
+
+        with self.lock:
+            seconds, self.seconds = self.seconds, dict.fromkeys( STAGES, 0. )
+
+        return seconds
+
+class BoundStageTimer(object):
+
+    """
+    Stages are added to the StageTimer bound to the current thread (timer of a tiling progress in its tiling workers &
+    tile sink writers), & not timed in other threads (requests, lazy renders).
+    """
+
+    def __init__(self):
+
+        self.local = local()
+
+    def get(self) -> StageTimer:
+
+        """ Get timer bound to the current thread, None if not bound """
+
+        return getattr(self.local, 'timer', None)
+
+    def bind(self, timer : StageTimer) -> None:
+
+        """ Bind timer to the current thread, None to unbind """
+
+        self.local.timer = timer
+
+    @contextmanager
+    def stage(self, stage : str) -> None:
+
+        """ Time a block of code as stage with the bound timer """
+
+        timer = self.get()
+
+        if timer is None:
+            yield
+            return
+
+        with timer.stage( stage ):
+            yield
+
+# timer of each thread
+STAGE_TIMER = BoundStageTimer()
+
+
+
+# Tiling progress
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingProgress(object):
+
+    """
+    Progress of a tiling job : planned & done tiles by zoom, seconds by stage, tiles/s & ETA. Updated by the tiling
+    pool after each work unit, & saved with save_fun(report) at most every interval seconds. Stages of work units are
+    timed by the tiling workers with timer (see run_units).
+    """
+
+    def __init__(self, save_fun = None, interval : float = None):
+
+        self.save_fun   = save_fun
+        self.interval   = get_progress_interval( interval )
+        self.lock       = Lock()
+
+        self.start_time = time.time()
+        self.saved      = 0.
+        self.state      = 'running'
+        self.error      = None
+        self.zooms      = dict()
+        self.skipped    = 0
+        self.seconds    = dict.fromkeys( STAGES, 0. )
+        self.timer      = StageTimer()
+
+    def plan(self, units : list()) -> None:
+
+        """ Add work units (zoom, quadrant) to the planned tiles """
+
+        with self.lock:
+
+            for zoom, (xmin, ymin, xmax, ymax) in units:
+                self.zooms.setdefault( zoom, [ 0, 0 ] )[ 1 ] += ( xmax - xmin + 1 ) * ( ymax - ymin + 1 )
+
+    def update(self, zoom : int, tiles : int, seconds : dict()) -> None:
+
+        """ Add a done work unit : its number of tiles & seconds by stage """
+
+        with self.lock:
+
+            self.zooms.setdefault( zoom, [ 0, 0 ] )[ 0 ] += tiles
+
+            for stage, value in seconds.items():
+                self.seconds[ stage ] = self.seconds.get( stage, 0. ) + value
+
+        if time.time() - self.saved >= self.interval:
+            self.save()
+
+    def skip(self, zoom : int, tiles : int) -> None:
+
+        """ Add a work unit done by a previous run of the tiling (resumed), not counted in tiles/s """
+
+        with self.lock:
+            self.zooms.setdefault( zoom, [ 0, 0 ] )[ 0 ] += tiles
+            self.skipped += tiles
+
+    @contextmanager
+    def stage(self, stage : str) -> None:
+
+        """ Time a stage run by the job itself (reprojection) """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+
+            with self.lock:
+                self.seconds[ stage ] += time.perf_counter() - start
+
+    def report(self) -> dict():
+
+        """ Get progress as a JSON serializable dict """
+
+        with self.lock:
+
+            zooms   = self.zooms
+            done    = sum( value[0] for value in zooms.values() )
+            total   = sum( value[1] for value in zooms.values() )
+            elapsed = time.time() - self.start_time
+            rate    = ( done - self.skipped ) / elapsed if elapsed > 0 else 0.
+
+            # overview zooms may have less tiles than planned
+            eta     = None if rate == 0 or self.state != 'running' else max( 0, total - done ) / rate
+
+            return {
+                'state'            : self.state,
+                'error'            : self.error,
+                'start'            : self.start_time,
+                'elapsed'          : elapsed,
+                'tiles'            : done,
+                'total'            : total,
+                'resumed'          : self.skipped,
+                'tiles_per_second' : rate,
+                'eta'              : eta,
+                'zooms'            : { str( zoom ) : { 'tiles' : value[0], 'total' : value[1] }
+                                       for zoom, value in sorted( zooms.items() ) },
+                'stages'           : dict( self.seconds )
+            }
+
+    def save(self) -> None:
+
+        self.saved = time.time()
+
+        if self.save_fun is not None:
+            self.save_fun( self.report() )
+
+    def finish(self, error : Exception = None) -> None:
+
+        """ Save final progress, 'done' or 'failed' with error """
+
+        self.state = 'done' if error is None else 'failed'
+        self.error = None if error is None else repr( error )
+
+        self.save()
+
+# end progress of a stopped job
+def end_report(report : dict(), state : str, error : str = None) -> dict():
+
+    """
+    Get a progress report still 'running' ended as state ('failed' or 'cancelled'), for a job stopped without saving its
+    final progress (killed, out of memory, lost). None if report is already ended
+    """
+
+    if report is None or report[ 'state' ] != 'running':
+        return None
+
+    return dict( report, state=state, error=error, eta=None )
+
+
+
+# Tiling checkpoint
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingCheckpoint(ABC):
+
+    """
+    Work units (zoom, quadrant) of a tiling already written, kept durably so a stopped tiling resumes where it
+    stopped : done units are skipped & the pyramid is completed from the tiles in storage.
+    """
+
+    @abstractmethod
+    def load(self) -> dict():
+
+        """ Get done units, { (zoom, quadrant) : number of tiles } """
+
+    @abstractmethod
+    def mark(self, zoom : int, quadrant : tuple(), tiles : int) -> None:
+
+        """ Record a written unit """
+
+
+
+# Format
+#-----------------------------------------------------------------------------------------------------------------------
+
+def format_progress(report : dict()) -> str:
+
+    """ Format a progress report in one line, for the admin """
+
+    if report is None:
+        return '-'
+
+    percent = 100. * report[ 'tiles' ] / report[ 'total' ] if report[ 'total' ] else 0.
+    params  = (report[ 'state' ], percent, report[ 'tiles' ], report[ 'total' ], report[ 'tiles_per_second' ])
+    text    = '%s %.0f%% (%d / %d tiles, %.0f tiles/s' % params
+
+    if report[ 'eta' ] is not None:
+        text += ', ETA %d min %02d s' % divmod( int( report[ 'eta' ] ), 60 )
+
+    return text + ')'
+
+def format_stages(report : dict()) -> str:
+
+    """ Format seconds by stage with their share, for the admin """
+
+    if report is None:
+        return '-'
+
+    total = sum( report[ 'stages' ].values() ) or 1.
+
+    return ', '.join( '%s %.1f s (%.0f%%)' % (stage, seconds, 100. * seconds / total)
+                      for stage, seconds in report[ 'stages' ].items() )
@@ -0,0 +1,141 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   tmsapp.constant import *
+import numpy           as     np
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# resampling kernels for overview
+KERNELS = ( 'average', 'nearest', 'mode' )
+
+# get pyramid mode
+def get_pyramid_mode() -> str:
+
+    """ Get pyramid mode (settings.TMS_TILING_PYRAMID) : 'warp' or 'overview' """
+
+    mode = getattr(settings, 'TMS_TILING_PYRAMID', TILING_PYRAMID)
+
+    assert mode in ( 'warp', 'overview' )
+
+    return mode
+
+# get resampling kernel
+def get_kernel(kernel : str = None) -> str:
+
+    """ Get resampling kernel of overview (argument, then settings.TMS_TILING_RESAMPLING) """
+
+    if kernel is None:
+        kernel = getattr(settings, 'TMS_TILING_RESAMPLING', TILING_RESAMPLING)
+
+    assert kernel in KERNELS
+
+    return kernel
+
+
+
+# Overview
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get the four children of a tile
+def get_children(zoom : int, x : int, y : int) -> list():
+
+    """ Get children (zoom, x, y) of a tile, in mosaic order : top left, top right, bottom left, bottom right """
+
+    return [ (zoom + 1, 2 * x + dx, 2 * y + dy) for dy in (0, 1) for dx in (0, 1) ]
+
+# mosaic four children
+def mosaic(children : list(), fill : float = 0) -> (np.ndarray, np.ndarray):
+
+    """
+    Mosaic 2x2 children (bands, size, size) in mosaic order, missing children (None) are filled with fill.
+    Return data (bands, 2*size, 2*size) and valid mask (2*size, 2*size) where data is not fill.
+    """
+
+    # get shape & dtype from an existing child
+    first = next( child for child in children if child is not None )
+
+    bands, size, _ = first.shape
+
+    data = np.full( (bands, 2 * size, 2 * size), fill, dtype=first.dtype )
+
+    for i, child in enumerate( children ):
+
+        if child is None:
+            continue
+
+        row = (i // 2) * size
+        col = (i %  2) * size
+
+        data[ :, row:row+size, col:col+size ] = child
+
+    valid = np.any( data != fill, axis=0 )
+
+    return data, valid
+
+# downsample by 2
+def downsample(data : np.ndarray, valid : np.ndarray, kernel : str = 'average') -> (np.ndarray, np.ndarray):
+
+    """
+    Downsample data (bands, 2*size, 2*size) by 2 with kernel, pixels out of valid mask are ignored.
+    Return data (bands, size, size) and valid mask (size, size).
+    """
+
+    # the four samples of each 2x2 block
+    samples = [ data [ :, dy::2, dx::2 ] for dy in (0, 1) for dx in (0, 1) ]
+    masks   = [ valid[    dy::2, dx::2 ] for dy in (0, 1) for dx in (0, 1) ]
+
+    count   = np.sum( masks, axis=0 )
+    dst     = np.zeros( samples[0].shape, dtype=data.dtype )
+
+    if kernel == 'average':
+
+        total = np.sum( [ sample * mask for sample, mask in zip(samples, masks) ], axis=0, dtype=np.float64 )
+        mean  = total / np.maximum( count, 1 )
+
+        # round integer data
+        if np.issubdtype( data.dtype, np.integer ):
+            mean = np.rint( mean )
+
+        dst[ : ] = mean
+
+    elif kernel == 'nearest':
+
+        # first valid sample of the block
+        taken = np.zeros( count.shape, dtype=bool )
+
+        for sample, mask in zip(samples, masks):
+
+            take             = mask & ~taken
+            dst[ :, take ]   = sample[ :, take ]
+            taken           |= take
+
+    elif kernel == 'mode':
+
+        # number of valid samples equal to each sample (all bands equal)
+        votes = []
+
+        for sample, mask in zip(samples, masks):
+
+            vote = np.zeros( count.shape, dtype=np.int8 )
+
+            for other, other_mask in zip(samples, masks):
+                vote += np.all( sample == other, axis=0 ) & other_mask
+
+            votes.append( np.where( mask, vote, -1 ) )
+
+        # most frequent sample, first one on tie
+        best = np.argmax( votes, axis=0 )
+
+        for i, sample in enumerate( samples ):
+            take           = best == i
+            dst[ :, take ] = sample[ :, take ]
+
+    else:
+        assert False
+
+    return dst, count > 0
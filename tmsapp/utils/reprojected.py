@@ -3,10 +3,37 @@
 
 # Gdal library
 from django.contrib.gis.gdal import GDALRaster
+from django.conf             import settings
+from tmsapp.constant         import *
 
 # Rasterio library
-from   rasterio.warp import calculate_default_transform, reproject
-import rasterio      as     rio
+from   rasterio.warp    import calculate_default_transform, reproject
+from   rasterio.windows import Window, transform as window_transform
+from   rasterio.crs     import CRS
+import rasterio         as     rio
+import numpy            as     np
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get number of warping threads
+def get_reproject_threads() -> int:
+
+    """ Get number of GDAL warping threads (settings.TMS_REPROJECT_THREADS, None : cpu count) """
+
+    threads = getattr(settings, 'TMS_REPROJECT_THREADS', REPROJECT_THREADS)
+
+    return max( 1, threads or os.cpu_count() or 1 )
+
+# get memory budget
+def get_reproject_memory() -> int:
+
+    """ Get memory budget of reprojection in Mb (settings.TMS_REPROJECT_MEMORY) """
+
+    return getattr(settings, 'TMS_REPROJECT_MEMORY', REPROJECT_MEMORY)
 
 
 
@@ -28,43 +55,99 @@ def reprojected_by_gdal( src : str, dst : str, dst_crs : int = 4326 ) -> None:
 # Reproject raster with rasterio
 #-----------------------------------------------------------------------------------------------------------------------
 
-def reprojected_by_rio( src : str, dst : str, dst_crs : int = 4326 ) -> None:
-
-    """ Reproject raster with rasterio """
-
-    # Get src dataset
-    src_dataset = rio.open(src, 'r')
+# test if a dataset is already a tiled geotiff in crs
+def __is_reprojected__(src_dataset : rio.DatasetReader, dst_crs : CRS) -> bool:
 
-    # get crs
-    src_crs    = src_dataset.crs
-    dst_crs    = 'EPSG:%d' % dst_crs
+    return src_dataset.driver == 'GTiff' and src_dataset.crs == dst_crs and src_dataset.profile.get( 'tiled', False )
 
-    # get src width x height
-    src_width  = src_dataset.width
-    src_height = src_dataset.height
+# get row windows of a raster, each one under the memory budget
+def __make_strips__(width : int, height : int, count : int, dtype : str, budget : int, block_size : int) -> list():
 
-    # get src bounds
-    src_bounds = src_dataset.bounds
+    """ Split raster in strips of full rows, a multiple of block_size rows (a row of blocks) each """
 
-    # get transform
-    src_transform                        = src_dataset.transform
-    dst_transform, dst_width, dst_height = calculate_default_transform(src_crs, dst_crs, src_width, src_height, *src_bounds)
+    row_bytes  = width * count * np.dtype( dtype ).itemsize
+    rows       = max( block_size, ( budget // max( 1, row_bytes ) ) // block_size * block_size )
 
-    # get profile
-    src_profile = src_dataset.profile
-    dst_profile = src_profile.copy()
-    dst_profile.update(crs=dst_crs, width=dst_width, height=dst_height, transform=dst_transform)
+    return [ Window(0, row, width, min( rows, height - row )) for row in range(0, height, rows) ]
 
-    # make reprojection
-    with rio.open(dst, 'w', **dst_profile) as dst_dataset:
-
-        for i in range(1, src_dataset.count+1):
+def reprojected_by_rio( src : str, dst : str, dst_crs : int = 4326 ) -> None:
 
-            reproject(
-                source=rio.band(src_dataset, i),
-                destination=rio.band(dst_dataset, i),
-                src_transform=src_transform,
-                dst_transform=dst_transform,
-                src_crs=src_crs,
-                dst_crs=dst_crs
-            )
\ No newline at end of file
+    """
+    Reproject raster with rasterio, strip by strip under a memory budget & with GDAL multithreaded warping.
+    Output is a tiled & compressed GeoTIFF written in a temporary file, then moved on dst (src can be dst).
+    """
+
+    dst_crs = CRS.from_epsg( dst_crs )
+    budget  = get_reproject_memory() * 1024 * 1024
+    threads = get_reproject_threads()
+
+    with rio.Env( GDAL_NUM_THREADS=threads, GDAL_CACHEMAX=get_reproject_memory() ):
+
+        with rio.open(src, 'r') as src_dataset:
+
+            # nothing to do (layer tiled again)
+            if src == dst and __is_reprojected__(src_dataset, dst_crs):
+                return
+
+            # get transform
+            src_bounds = src_dataset.bounds
+            src_crs    = src_dataset.crs
+            dst_transform, dst_width, dst_height = calculate_default_transform(src_crs, dst_crs, src_dataset.width,
+                                                                               src_dataset.height, *src_bounds)
+
+            # tiled & compressed geotiff, blocks of a tile
+            dst_profile = src_dataset.profile.copy()
+            dst_profile.update(
+                driver     = 'GTiff',
+                crs        = dst_crs,
+                width      = dst_width,
+                height     = dst_height,
+                transform  = dst_transform,
+                tiled      = True,
+                blockxsize = REPROJECT_BLOCK_SIZE,
+                blockysize = REPROJECT_BLOCK_SIZE,
+                compress   = getattr(settings, 'TMS_REPROJECT_COMPRESS', REPROJECT_COMPRESS),
+                BIGTIFF    = 'IF_SAFER'
+            )
+
+            count  = src_dataset.count
+            dtype  = src_dataset.dtypes[ 0 ]
+            nodata = src_dataset.nodata
+            bands  = list( range(1, count + 1) )
+
+            # temporary file next to dst, so the move is atomic
+            temp   = '%s.%d.tmp' % (dst, os.getpid())
+
+            try:
+
+                with rio.open(temp, 'w', **dst_profile) as dst_dataset:
+
+                    # a strip use half of the budget, the other half is for the warper
+                    for window in __make_strips__(dst_width, dst_height, count, dtype, budget // 2, REPROJECT_BLOCK_SIZE):
+
+                        fill  = 0 if nodata is None else nodata
+                        strip = np.full( (count, window.height, window.width), fill, dtype=dtype )
+
+                        # source is read by the warper, only under the strip
+                        reproject(
+                            source         = rio.band(src_dataset, bands),
+                            destination    = strip,
+                            src_transform  = src_dataset.transform,
+                            src_crs        = src_crs,
+                            src_nodata     = nodata,
+                            dst_transform  = window_transform(window, dst_transform),
+                            dst_crs        = dst_crs,
+                            dst_nodata     = nodata,
+                            num_threads    = threads,
+                            warp_mem_limit = budget // 2 // ( 1024 * 1024 )
+                        )
+
+                        dst_dataset.write(strip, window=window)
+
+                os.replace(temp, dst)
+
+            finally:
+
+                # failed reprojection, keep src
+                if os.path.exists( temp ):
+                    os.remove( temp )
@@ -0,0 +1,265 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf                import settings
+from   django.db                  import connection, transaction, IntegrityError
+from   django.contrib.gis.db      import models
+from   tmsapp.constant            import *
+from   .progress                  import STAGE_TIMER
+from   threading                  import Thread
+from   queue                      import Queue
+from   io                         import StringIO
+import csv
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get number of tiles by batch
+def get_batch_size(batch_size : int = None) -> int:
+
+    """ Get number of tiles written by batch (argument, then settings.TMS_TILING_BATCH_SIZE) """
+
+    return batch_size or getattr(settings, 'TMS_TILING_BATCH_SIZE', TILING_BATCH_SIZE)
+
+# get number of tiles waiting for writing
+def get_max_pending(max_pending : int = None) -> int:
+
+    """ Get max number of tiles waiting for writing (argument, then settings.TMS_TILING_MAX_PENDING) """
+
+    return max_pending or getattr(settings, 'TMS_TILING_MAX_PENDING', TILING_MAX_PENDING)
+
+# get write method
+def get_write_method(method : str = None) -> str:
+
+    """ Get write method (argument, then settings.TMS_TILING_WRITE_METHOD) : 'bulk' or 'copy' """
+
+    method = method or getattr(settings, 'TMS_TILING_WRITE_METHOD', TILING_WRITE_METHOD)
+
+    assert method in ( 'bulk', 'copy' )
+
+    return method
+
+
+
+# Bulk write
+#-----------------------------------------------------------------------------------------------------------------------
+
+# test if objects of model can be written with COPY
+def __can_copy__(model : object) -> bool:
+
+    """ COPY is used on PostgreSQL for tables without spatial columns """
+
+    if connection.vendor != 'postgresql':
+        return False
+
+    spatial = (models.GeometryField, models.RasterField)
+
+    return not any( isinstance(field, spatial) for field in model._meta.concrete_fields )
+
+# write objects with COPY
+def __copy__(objects : list()) -> None:
+
+    """ Write objects of one model with COPY ... FROM STDIN (csv) """
+
+    model  = type( objects[0] )
+    fields = [ field for field in model._meta.concrete_fields if not isinstance(field, models.AutoField) ]
+
+    # write rows as csv (empty unquoted value is NULL, bytea as hex)
+    buffer = StringIO()
+    writer = csv.writer( buffer )
+
+    for obj in objects:
+
+        row = []
+
+        for field in fields:
+
+            value = getattr( obj, field.attname )
+
+            if value is None:
+                row.append( '' )
+            elif isinstance(value, (bytes, bytearray, memoryview)):
+                row.append( '\\x' + bytes( value ).hex() )
+            else:
+                row.append( field.get_db_prep_save(value, connection) )
+
+        writer.writerow( row )
+
+    buffer.seek( 0 )
+
+    # copy rows
+    table   = connection.ops.quote_name( model._meta.db_table )
+    columns = ', '.join( connection.ops.quote_name( field.column ) for field in fields )
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert( 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table, columns), buffer )
+
+def bulk_write(objects : list(), fallback_fun = None, method : str = None) -> None:
+
+    """
+    Write objects of one model in one transaction with bulk_create or COPY.
+    If a tile already exist (tile shared by two sources of a layer), the batch is rolled back & fallback_fun() is called.
+    """
+
+    if len( objects ) == 0:
+        return
+
+    try:
+
+        with transaction.atomic():
+
+            if get_write_method( method ) == 'copy' and __can_copy__( type( objects[0] ) ):
+                __copy__( objects )
+            else:
+                type( objects[0] ).objects.bulk_create( objects )
+
+    except IntegrityError:
+
+        if fallback_fun is None:
+            raise
+
+        fallback_fun()
+
+
+
+# Tile sink
+#-----------------------------------------------------------------------------------------------------------------------
+
+# markers of the writer queue
+_FLUSH = object()
+_CLOSE = object()
+
+class TileSink(object):
+
+    """
+    Batched tile writer, usable as push_in_db_fun.
+
+    Pushed tiles are queued & written by a writer thread of the current process with write_fun(tiles), by batch of
+    batch_size tiles. The queue is bounded by max_pending tiles, so push blocks when renderers outrun the writer.
+    A sink can be shared by forked processes : each one starts its own writer thread (and database connection).
+    Writes are timed with the stage timer of the thread starting the writer (see BoundStageTimer).
+    The first write error is raised by flush, or a failed batch is dropped when drop_errors.
+    """
+
+    def __init__(self, write_fun, batch_size : int = None, max_pending : int = None, drop_errors : bool = False):
+
+        self.write_fun   = write_fun
+        self.batch_size  = get_batch_size( batch_size )
+        self.max_pending = get_max_pending( max_pending )
+        self.drop_errors = drop_errors
+
+        self.pid         = None
+        self.queue       = None
+        self.thread      = None
+        self.error       = None
+        self.timer       = None
+
+    def __start__(self) -> None:
+
+        """ Start writer thread of the current process """
+
+        self.pid    = os.getpid()
+        self.queue  = Queue( maxsize=self.max_pending )
+        self.error  = None
+        self.timer  = STAGE_TIMER.get()
+        self.thread = Thread( target=self.__run__, daemon=True )
+        self.thread.start()
+
+    def __write__(self, batch : list()) -> None:
+
+        """ Write a batch, keep the first error for flush (unless drop_errors) """
+
+        try:
+
+            if len( batch ) > 0 and self.error is None:
+                with STAGE_TIMER.stage( 'write' ):
+                    self.write_fun( batch )
+
+        except Exception as error:
+            if not self.drop_errors:
+                self.error = error
+
+        finally:
+
+            for _ in batch:
+                self.queue.task_done()
+
+    def __run__(self) -> None:
+
+        """ Writer thread """
+
+        STAGE_TIMER.bind( self.timer )
+
+        batch = []
+
+        try:
+
+            while True:
+
+                item = self.queue.get()
+
+                # write pending tiles on flush & close
+                if item is _FLUSH or item is _CLOSE:
+
+                    self.__write__( batch )
+                    batch = []
+
+                    self.queue.task_done()
+
+                    if item is _CLOSE:
+                        return
+
+                    continue
+
+                batch.append( item )
+
+                if len( batch ) >= self.batch_size:
+                    self.__write__( batch )
+                    batch = []
+
+        finally:
+
+            # close connection of writer thread
+            connection.close()
+
+    def __call__(self, *tile : tuple()) -> None:
+
+        """ Push a tile (block when too many tiles are waiting) """
+
+        if self.pid != os.getpid():
+            self.__start__()
+
+        self.queue.put( tile )
+
+    def flush(self) -> None:
+
+        """ Wait until all pushed tiles are written, raise the writer error if any """
+
+        if self.pid != os.getpid():
+            return
+
+        self.queue.put( _FLUSH )
+        self.queue.join()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self) -> None:
+
+        """ Write pending tiles & stop writer thread """
+
+        if self.pid != os.getpid():
+            return
+
+        try:
+            self.flush()
+
+        finally:
+
+            self.queue.put( _CLOSE )
+            self.thread.join()
+            self.pid = None
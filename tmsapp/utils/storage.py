@@ -0,0 +1,371 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   tmsapp.constant import *
+from   .tools          import __merge_png__
+from   .mbtiles        import __flip_y__
+from   .archive        import ARCHIVE_INDEX, pack_tiles
+from   threading       import local
+from   abc             import ABC, abstractmethod
+import sqlite3
+import shutil
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# storage backends of tiling, selectable for a layer
+STORAGES = ( 'postgis', 'filesystem', 'mbtiles' )
+
+# read-only backend, filled by packing tiles of another backend (a packed layer is still tiled in its backend)
+ARCHIVE_STORAGE = 'archive'
+
+# get default storage backend
+def get_default_storage() -> str:
+
+    """ Get storage backend of new layers (settings.TMS_TILE_STORAGE) """
+
+    storage = getattr(settings, 'TMS_TILE_STORAGE', TILE_STORAGE)
+
+    assert storage in STORAGES
+
+    return storage
+
+# get root directory of file backends
+def get_storage_root() -> str:
+
+    """ Get root directory of file backends (settings.TMS_TILE_STORAGE_ROOT, then MEDIA_ROOT/tiles) """
+
+    root = getattr(settings, 'TMS_TILE_STORAGE_ROOT', None)
+
+    return root or os.path.join(settings.MEDIA_ROOT, TILE_STORAGE_DIR)
+
+
+
+# Storage interface
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ReadOnlyTileStorage(ABC):
+
+    """ Tile payloads (png bytes) of layers, by layer id, zoom, x, y (XYZ scheme), filled outside of tiling """
+
+    @abstractmethod
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        """ Get payload of a tile, None if tile not exist """
+
+    @abstractmethod
+    def delete_layer(self, layer_id : int) -> None:
+
+        """ Delete all tiles of a layer """
+
+    @abstractmethod
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        """ Test existence of tiles (zoom, x, y), one bool by tile """
+
+    @abstractmethod
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        """ Iterate on tiles (x, y) of a zoom """
+
+    @abstractmethod
+    def iter_tiles(self, layer_id : int) -> object:
+
+        """ Iterate on tiles (zoom, x, y, payload) """
+
+class TileStorage(ReadOnlyTileStorage):
+
+    """
+    Tile payloads of layers written by tiling.
+    A tile put twice (tile shared by two sources of a layer) is merged with the stored one, except in storages of
+    formats encoded at tiling (merge=False) where it is replaced.
+    """
+
+    @abstractmethod
+    def put_many(self, layer_id : int, tiles : list()) -> None:
+
+        """ Write tiles (zoom, x, y, payload) """
+
+
+
+# Filesystem storage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class FileSystemStorage(TileStorage):
+
+    """ Tiles as files <root>/<kind>/<layer id>/<zoom>/<x>/<y>.<ext> """
+
+    def __init__(self, kind : str, ext : str = 'png', merge : bool = True):
+
+        self.kind  = kind
+        self.ext   = '.' + ext
+        self.merge = merge
+
+    def __layer_dir__(self, layer_id : int) -> str:
+        return os.path.join(get_storage_root(), self.kind, str( layer_id ))
+
+    def __path__(self, layer_id : int, zoom : int, x : int, y : int) -> str:
+        return os.path.join(self.__layer_dir__( layer_id ), str( zoom ), str( x ), '%d%s' % (y, self.ext))
+
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        try:
+
+            with open(self.__path__(layer_id, zoom, x, y), 'rb') as file:
+                return file.read()
+
+        except FileNotFoundError:
+            return None
+
+    def put_many(self, layer_id : int, tiles : list()) -> None:
+
+        for zoom, x, y, payload in tiles:
+
+            path = self.__path__(layer_id, zoom, x, y)
+
+            # tile shared with another source of the layer, merge them
+            if self.merge and os.path.exists( path ):
+                payload = __merge_png__(self.get(layer_id, zoom, x, y), payload)
+
+            os.makedirs(os.path.dirname( path ), exist_ok=True)
+
+            # readers never see a partial file
+            temp = '%s.%d.tmp' % (path, os.getpid())
+
+            with open(temp, 'wb') as file:
+                file.write( payload )
+
+            os.replace(temp, path)
+
+    def delete_layer(self, layer_id : int) -> None:
+
+        shutil.rmtree(self.__layer_dir__( layer_id ), ignore_errors=True)
+
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        return [ os.path.exists( self.__path__(layer_id, zoom, x, y) ) for zoom, x, y in tiles ]
+
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        zoom_dir = os.path.join(self.__layer_dir__( layer_id ), str( zoom ))
+
+        if not os.path.isdir( zoom_dir ):
+            return
+
+        for x in os.listdir( zoom_dir ):
+            for name in os.listdir( os.path.join(zoom_dir, x) ):
+                if name.endswith( self.ext ):
+                    yield int( x ), int( name[ :-len( self.ext ) ] )
+
+    def iter_tiles(self, layer_id : int) -> object:
+
+        layer_dir = self.__layer_dir__( layer_id )
+
+        if not os.path.isdir( layer_dir ):
+            return
+
+        for zoom in sorted( int( zoom ) for zoom in os.listdir( layer_dir ) ):
+            for x, y in self.list_tiles(layer_id, zoom):
+                yield zoom, x, y, self.get(layer_id, zoom, x, y)
+
+
+
+# MBTiles (SQLite) storage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class SQLiteStorage(TileStorage):
+
+    """ Tiles in one MBTiles file by layer <root>/<kind>/<layer id>.mbtiles, one connection by process & thread """
+
+    def __init__(self, kind : str, merge : bool = True):
+
+        self.kind    = kind
+        self.merge   = merge
+        self.local   = local()
+
+    def __path__(self, layer_id : int) -> str:
+        return os.path.join(get_storage_root(), self.kind, '%d.mbtiles' % layer_id)
+
+    def __connect__(self, layer_id : int, create : bool = False) -> sqlite3.Connection:
+
+        """ Get connection of the current process & thread, None if file not exist and not create """
+
+        # connections are not shared with forked processes
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.pid         = os.getpid()
+            self.local.connections = dict()
+
+        db = self.local.connections.get( layer_id )
+
+        if db is not None:
+            return db
+
+        path = self.__path__( layer_id )
+
+        if not create and not os.path.exists( path ):
+            return None
+
+        os.makedirs(os.path.dirname( path ), exist_ok=True)
+
+        # WAL : readers are not blocked by the tiling writers
+        db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        db.execute( 'PRAGMA journal_mode = WAL' )
+        db.execute( 'PRAGMA synchronous = NORMAL' )
+        db.execute( 'CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)' )
+        db.execute( 'CREATE TABLE IF NOT EXISTS tiles '
+                    '(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)' )
+        db.execute( 'CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)' )
+
+        self.local.connections[ layer_id ] = db
+
+        return db
+
+    def __close__(self, layer_id : int) -> None:
+
+        db = getattr(self.local, 'connections', dict()).pop( layer_id, None )
+
+        if db is not None:
+            db.close()
+
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> bytes:
+
+        db = self.__connect__( layer_id )
+
+        if db is None:
+            return None
+
+        query = 'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?'
+        row   = db.execute( query, (zoom, x, __flip_y__(zoom, y)) ).fetchone()
+
+        return None if row is None else bytes( row[0] )
+
+    def put_many(self, layer_id : int, tiles : list()) -> None:
+
+        db    = self.__connect__(layer_id, create=True)
+        tiles = list( tiles )
+
+        # tiles shared with another source of the layer, merge them
+        exists = self.exists_many(layer_id, [ tile[ :3 ] for tile in tiles ]) if self.merge else [ False ] * len( tiles )
+        rows   = [ (zoom, x, __flip_y__(zoom, y),
+                    __merge_png__(self.get(layer_id, zoom, x, y), payload) if exist else payload)
+                   for (zoom, x, y, payload), exist in zip(tiles, exists) ]
+
+        db.execute( 'BEGIN IMMEDIATE' )
+
+        try:
+            db.executemany( 'INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) '
+                            'VALUES (?, ?, ?, ?)', rows )
+            db.execute( 'COMMIT' )
+
+        except Exception:
+            db.execute( 'ROLLBACK' )
+            raise
+
+    def delete_layer(self, layer_id : int) -> None:
+
+        self.__close__( layer_id )
+
+        for suffix in ( '', '-wal', '-shm' ):
+            try:
+                os.remove( self.__path__( layer_id ) + suffix )
+            except FileNotFoundError:
+                pass
+
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        db = self.__connect__( layer_id )
+
+        if db is None:
+            return [ False for _ in tiles ]
+
+        query = 'SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?'
+
+        return [ db.execute( query, (zoom, x, __flip_y__(zoom, y)) ).fetchone() is not None for zoom, x, y in tiles ]
+
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        db = self.__connect__( layer_id )
+
+        if db is None:
+            return
+
+        for x, y in db.execute( 'SELECT tile_column, tile_row FROM tiles WHERE zoom_level = ?', (zoom, ) ):
+            yield x, __flip_y__(zoom, y)
+
+    def iter_tiles(self, layer_id : int) -> object:
+
+        db = self.__connect__( layer_id )
+
+        if db is None:
+            return
+
+        for zoom, x, y, payload in db.execute( 'SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles' ):
+            yield zoom, x, __flip_y__(zoom, y), bytes( payload )
+
+
+
+# Packed archive storage
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ArchiveStorage(ReadOnlyTileStorage):
+
+    """ Read-only tiles in one packed archive by layer <root>/<kind>/<layer id>.tmspack, served from mapped memory """
+
+    def __init__(self, kind : str):
+
+        self.kind = kind
+
+    def __path__(self, layer_id : int) -> str:
+        return os.path.join(get_storage_root(), self.kind, '%d.tmspack' % layer_id)
+
+    def pack(self, layer_id : int, tiles : object) -> dict():
+
+        """ Replace archive of a layer by tiles (zoom, x, y, payload). Return report """
+
+        path = self.__path__( layer_id )
+
+        os.makedirs(os.path.dirname( path ), exist_ok=True)
+
+        stats = pack_tiles(tiles, path)
+        ARCHIVE_INDEX.drop( path )
+
+        return stats
+
+    def get(self, layer_id : int, zoom : int, x : int, y : int) -> memoryview:
+
+        reader = ARCHIVE_INDEX.get( self.__path__( layer_id ) )
+
+        return None if reader is None else reader.get(zoom, x, y)
+
+    def delete_layer(self, layer_id : int) -> None:
+
+        path = self.__path__( layer_id )
+
+        ARCHIVE_INDEX.drop( path )
+
+        try:
+            os.remove( path )
+        except FileNotFoundError:
+            pass
+
+    def exists_many(self, layer_id : int, tiles : list()) -> list():
+
+        reader = ARCHIVE_INDEX.get( self.__path__( layer_id ) )
+
+        return [ reader is not None and reader.get(zoom, x, y) is not None for zoom, x, y in tiles ]
+
+    def list_tiles(self, layer_id : int, zoom : int) -> object:
+
+        reader = ARCHIVE_INDEX.get( self.__path__( layer_id ) )
+
+        return iter( [] ) if reader is None else reader.list_tiles( zoom )
+
+    def iter_tiles(self, layer_id : int) -> object:
+
+        reader = ARCHIVE_INDEX.get( self.__path__( layer_id ) )
+
+        return iter( [] ) if reader is None else reader.iter_tiles()
@@ -0,0 +1,295 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   tmsapp.constant import *
+from   threading       import RLock
+import rasterio        as     rio
+import numpy           as     np
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# rescaling of bands to 8 bits ('auto' : 'none' for 8 bits rasters, else 'percent')
+STRETCHES = ( 'auto', 'none', 'minmax', 'percent', 'equalize' )
+
+# get default stretch
+def get_raster_stretch() -> str:
+
+    """ Get stretch of new raster layers (settings.TMS_RASTER_STRETCH) """
+
+    stretch = getattr(settings, 'TMS_RASTER_STRETCH', RASTER_STRETCH)
+
+    assert stretch in STRETCHES
+
+    return stretch
+
+# get colormaps
+def get_colormaps() -> dict():
+
+    """ Get colormaps by name, as RGB stops (RASTER_COLORMAPS & settings.TMS_RASTER_COLORMAPS) """
+
+    return { **RASTER_COLORMAPS, **getattr(settings, 'TMS_RASTER_COLORMAPS', dict()) }
+
+# get lookup table of a colormap
+def __colormap_lut__(stops : list()) -> np.ndarray:
+
+    """ Interpolate RGB stops (evenly spaced) in a (256, 3) uint8 table """
+
+    stops = np.asarray( stops, dtype=np.float64 )
+    at    = np.linspace(0, 255, len( stops ))
+    index = np.arange( 256 )
+
+    return np.stack( [ np.interp(index, at, stops[:, i]) for i in range( 3 ) ], axis=1 ).round().astype( np.uint8 )
+
+
+
+# Band statistics
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get valid pixels of bands
+def __valid_mask__(bands : np.ndarray, nodata : float) -> np.ndarray:
+
+    """ Get (row, col) mask of pixels where at least one band is not nodata (nor NaN) """
+
+    valid = np.zeros( bands.shape[1:], dtype=bool )
+
+    for band in bands:
+
+        mask = band != nodata
+
+        # NaN is nodata of float bands
+        if np.issubdtype( band.dtype, np.floating ):
+            mask &= ~np.isnan( band )
+
+        valid |= mask
+
+    return valid
+
+# read a sample of a source
+def __read_sample__(path : str, size : int) -> (np.ndarray, float, str):
+
+    """ Read bands of a source decimated to at most size pixels by side. Return bands, nodata & dtype """
+
+    with rio.open(path, 'r') as src_dataset:
+
+        factor = max( 1., max( src_dataset.width, src_dataset.height ) / size )
+        shape  = ( src_dataset.count, max( 1, int( src_dataset.height / factor ) ),
+                   max( 1, int( src_dataset.width / factor ) ) )
+
+        return src_dataset.read( out_shape=shape ), src_dataset.nodata, src_dataset.dtypes[ 0 ]
+
+def compute_stats(paths : list(), bins : int = None, percent : float = None, size : int = None) -> dict():
+
+    """
+    Compute statistics of the bands of a layer sources, on a decimated read of each source (at most size pixels by
+    side) : min, max, mean, std, percentiles (percent, 100 - percent) & histogram (bins between min & max) of valid
+    pixels. Sources share the dtype, nodata & number of bands of the first one.
+    """
+
+    bins    = getattr(settings, 'TMS_RASTER_STATS_BINS',    RASTER_STATS_BINS   ) if bins    is None else bins
+    percent = getattr(settings, 'TMS_RASTER_STATS_PERCENT', RASTER_STATS_PERCENT) if percent is None else percent
+    size    = getattr(settings, 'TMS_RASTER_STATS_SIZE',    RASTER_STATS_SIZE   ) if size    is None else size
+
+    values = None
+    nodata = None
+    dtype  = None
+    count  = 0
+
+    for path in paths:
+
+        bands, src_nodata, src_dtype = __read_sample__(path, size)
+
+        # same nodata as tiles (see __make_rastertiles_Q__)
+        if dtype is None:
+            nodata = 0 if src_nodata is None else src_nodata
+            dtype  = src_dtype
+            count  = len( bands )
+            values = [ [] for _ in range( min( 3, count ) ) ]
+
+        for i, band in enumerate( bands[ :len( values ) ] ):
+            valid = __valid_mask__(band[ np.newaxis ], nodata)
+            values[ i ].append( band[ valid ].astype( np.float64 ) )
+
+    # statistics of rendered bands (3 first ones)
+    stats = { 'dtype' : dtype, 'nodata' : nodata, 'count' : count, 'percent' : percent, 'bands' : [] }
+
+    for band_values in values or []:
+
+        band = np.concatenate( band_values )
+
+        # no valid pixel
+        if band.size == 0:
+            stats[ 'bands' ].append( None )
+            continue
+
+        low, high  = np.percentile(band, [ percent, 100 - percent ])
+        hist, _    = np.histogram(band, bins=bins, range=( band.min(), band.max() ))
+
+        stats[ 'bands' ].append({
+            'min'         : float( band.min()  ),
+            'max'         : float( band.max()  ),
+            'mean'        : float( band.mean() ),
+            'std'         : float( band.std()  ),
+            'count'       : int( band.size ),
+            'percentiles' : [ float( low ), float( high ) ],
+            'histogram'   : hist.tolist()
+        })
+
+    return stats
+
+
+
+# Rendering
+#-----------------------------------------------------------------------------------------------------------------------
+
+class RasterStyle(object):
+
+    """
+    Rendering of raster tile bands as RGBA : each band is rescaled to 8 bits from the layer statistics (see
+    compute_stats), then a single band is colored by a colormap. Bands of 8 & 16 bits integers are rescaled with a
+    lookup table built once, other bands with vectorized arithmetic. A pixel is transparent when all bands are nodata.
+    """
+
+    def __init__(self, stats : dict() = None, stretch : str = 'auto', colormap : str = None):
+
+        stats         = stats or { 'dtype' : None, 'nodata' : 0, 'bands' : [] }
+
+        self.dtype    = stats[ 'dtype' ]
+        self.nodata   = stats[ 'nodata' ]
+        self.bands    = stats[ 'bands' ]
+        self.stretch  = stretch or 'auto'
+
+        assert self.stretch in STRETCHES
+
+        # 8 bits data are not rescaled, without statistics neither
+        if self.stretch == 'auto':
+            self.stretch = 'none' if self.dtype in ( None, 'uint8' ) else 'percent'
+
+        # colormap of a single band, a colormap removed from settings is none (the layer is rendered in gray)
+        self.colormap = None
+        stops         = get_colormaps().get( colormap ) if colormap else None
+
+        if stops is not None and len( self.bands ) == 1:
+            self.colormap = __colormap_lut__( stops )
+
+        # lookup tables by band, indexed by value - offset
+        self.offset   = None
+        self.luts     = None
+
+        if self.dtype in ( 'uint8', 'int8', 'uint16', 'int16' ):
+            info        = np.iinfo( self.dtype )
+            self.offset = int( info.min )
+            domain      = np.arange(info.min, info.max + 1, dtype=np.float64)
+            self.luts   = [ self.__rescale__(domain, i) for i in range( len( self.bands ) ) ]
+
+    def __rescale__(self, values : np.ndarray, i : int) -> np.ndarray:
+
+        """ Rescale values of band i to uint8 """
+
+        band = self.bands[ i ] if i < len( self.bands ) else None
+
+        if self.stretch == 'none' or band is None:
+            return np.clip(values, 0, 255).astype( np.uint8 )
+
+        if self.stretch == 'equalize':
+            hist = np.asarray( band[ 'histogram' ], dtype=np.float64 )
+            cdf  = np.cumsum( hist ) / max( hist.sum(), 1. )
+            at   = np.linspace(band[ 'min' ], band[ 'max' ], len( hist ) + 1)[ 1: ]
+            return np.round( np.interp(values, at, cdf) * 255 ).astype( np.uint8 )
+
+        low, high = ( band[ 'min' ], band[ 'max' ] ) if self.stretch == 'minmax' else band[ 'percentiles' ]
+        scale     = 255. / max( high - low, 1e-12 )
+
+        return np.round( np.clip( ( values - low ) * scale, 0, 255 ) ).astype( np.uint8 )
+
+    def __band_to_uint8__(self, band : np.ndarray, i : int) -> np.ndarray:
+
+        if self.luts is not None and i < len( self.luts ) and band.dtype == np.dtype( self.dtype ):
+
+            # unsigned values are indexes of the table
+            if self.offset == 0:
+                return self.luts[ i ][ band ]
+
+            return self.luts[ i ][ band.astype( np.int32 ) - self.offset ]
+
+        return self.__rescale__(np.nan_to_num( band.astype( np.float64 ) ), i)
+
+    def render(self, bands : np.ndarray, nodata : float = None) -> np.ndarray:
+
+        """ Render bands (band, row, col) as a (row, col, 4) uint8 RGBA array """
+
+        nodata = self.nodata if nodata is None else nodata
+        count  = len( self.bands ) or len( bands )
+        bands  = bands[ :count ]
+
+        rgba   = np.empty( bands.shape[1:] + ( 4, ), dtype=np.uint8 )
+
+        # single band : colormap, or gray
+        if len( bands ) == 1:
+            gray = self.__band_to_uint8__(bands[0], 0)
+            rgba[ ..., :3 ] = gray[ ..., np.newaxis ] if self.colormap is None else self.colormap[ gray ]
+
+        # bands as RGB, missing bands are black
+        else:
+            for i in range( 3 ):
+                rgba[ ..., i ] = self.__band_to_uint8__(bands[ i ], i) if i < len( bands ) else 0
+
+        rgba[ ..., 3 ] = __valid_mask__(bands, nodata) * np.uint8( 255 )
+
+        return rgba
+
+
+
+# Style index
+#-----------------------------------------------------------------------------------------------------------------------
+
+class StyleIndex(object):
+
+    """ In-process map from layer id to its styles (by stretch & colormap), dropped when the layer version change """
+
+    def __init__(self):
+
+        self.styles = dict()
+        self.lock   = RLock()
+
+    def get(self, layer_id : int, version : int, stretch : str, colormap : str, loader : object) -> RasterStyle:
+
+        """
+        Get style of a layer version, loader(layer_id) give (statistics, stretch, colormap) of layer. stretch or
+        colormap None are the ones of layer, colormap '' is none.
+        """
+
+        with self.lock:
+
+            item = self.styles.get( layer_id )
+
+            if item is None or item[0] != version:
+                item = ( version, dict() )
+                self.styles[ layer_id ] = item
+
+            style = item[1].get( (stretch, colormap) )
+
+        if style is not None:
+            return style
+
+        # load from database, outside of the lock
+        stats, layer_stretch, layer_colormap = loader( layer_id )
+
+        style = RasterStyle(stats, layer_stretch if stretch is None else stretch,
+                            layer_colormap if colormap is None else colormap)
+
+        with self.lock:
+            item[1][ (stretch, colormap) ] = style
+
+        return style
+
+    def drop(self, layer_id : int) -> None:
+
+        with self.lock:
+            self.styles.pop( layer_id, None )
+
+# styles of raster layers
+RASTER_STYLE_INDEX = StyleIndex()
@@ -7,9 +7,15 @@ import numpy         as     np
 from tmsapp.constant import *
 from django.contrib.gis.geos import Polygon
 from rasterio import Affine as A
+from rasterio.windows import Window
 from django.contrib.gis.gdal import GDALRaster
 from PIL import Image
 from io  import BytesIO
+from .pool import run_units, get_quadrant_size, get_metatile
+from .pyramid import get_children, mosaic, downsample, get_kernel, get_pyramid_mode
+from .progress import STAGE_TIMER
+from .style import RasterStyle
+from functools import partial
 
 
 
@@ -66,180 +72,453 @@ def __make_quadrants__(bbox, zoom, world_size, quadrant_size=50):
 
     return quadrants
 
+# read source window of a quadrant
+def __read_window__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int, quadrant : tuple(),
+                    margin : int = TILING_READ_MARGIN) -> (np.ndarray, A):
 
+    """
+    Read only the source window covering a quadrant of tiles, plus a margin of source pixels for resampling.
+    The window is read at most at the destination resolution. Return bands & their transform, (None, None) when the
+    quadrant is out of the source.
+    """
 
-# Raster tiles creation
-#-----------------------------------------------------------------------------------------------------------------------
+    xmin, ymin, xmax, ymax = quadrant
 
-def __make_rastertiles_Z__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int) -> list():
+    # get world bounds of quadrant
+    left, top, _, _      = __tile_world_bbox__(xmin, ymin, zoom, world_size, tile_size)
+    _, _, right, bottom  = __tile_world_bbox__(xmax, ymax, zoom, world_size, tile_size)
 
-    # get bands
-    src_bands = src_dataset.read()
+    # get source pixel bounds of quadrant
+    inverse  = ~src_dataset.transform
+    col0, row0 = inverse * (left , top   )
+    col1, row1 = inverse * (right, bottom)
 
-    # structure for store tiles
-    tiles = []
+    col0, col1 = sorted( (col0, col1) )
+    row0, row1 = sorted( (row0, row1) )
 
-    # get bounds
-    src_bbox = src_dataset.bounds
-    src_bbox = [src_bbox.left, src_bbox.top, src_bbox.right, src_bbox.bottom]
+    # add margin & clip to source
+    col0 = max( 0, int( np.floor( col0 ) ) - margin )
+    row0 = max( 0, int( np.floor( row0 ) ) - margin )
+    col1 = min( src_dataset.width , int( np.ceil( col1 ) ) + margin )
+    row1 = min( src_dataset.height, int( np.ceil( row1 ) ) + margin )
+
+    # out of source
+    if col1 <= col0 or row1 <= row0:
+        return None, None
+
+    window = Window(col0, row0, col1 - col0, row1 - row0)
+
+    # read at most at destination resolution (decimated read at low zoom)
+    src_res = min( abs( src_dataset.res[0] ), abs( src_dataset.res[1] ) )
+    factor  = max( 1., __pixel_size__(world_size, tile_size, zoom) / src_res )
+    width  = max( 1, int( np.ceil( window.width  / factor ) ) )
+    height = max( 1, int( np.ceil( window.height / factor ) ) )
+
+    with STAGE_TIMER.stage( 'read' ):
+        bands = src_dataset.read(window=window, out_shape=(src_dataset.count, height, width))
+
+    transform = src_dataset.window_transform( window ) * A.scale(window.width / width, window.height / height)
+
+    return bands, transform
+
+# split a quadrant in metatiles
+def __make_metatiles__(quadrant : tuple(), size : int) -> list():
+
+    """ Split a quadrant (xmin, ymin, xmax, ymax) of tiles in blocks of at most size x size tiles """
+
+    xmin, ymin, xmax, ymax = quadrant
+
+    return [ (x, y, min(x + size - 1, xmax), min(y + size - 1, ymax))
+             for x in range(xmin, xmax + 1, size) for y in range(ymin, ymax + 1, size) ]
+
+# warp source on a metatile
+def __warp_metatile__(src_dataset : rio.DatasetReader, src_bands : np.ndarray, src_transform : A, world_size : float,
+                      tile_size : int, zoom : int, metatile : tuple(), count : int, dtype : str,
+                      nodata : float = None) -> np.ndarray:
+
+    """
+    Warp source bands on a metatile (xmin, ymin, xmax, ymax) of tiles with one reproject call, so neighbouring tiles
+    are resampled together (no seam). Return bands (count, rows * tile_size, cols * tile_size).
+    """
+
+    xmin, ymin, xmax, ymax = metatile
+
+    # get top left corner of metatile
+    left, top, _, _ = __tile_world_bbox__(xmin, ymin, zoom, world_size, tile_size)
 
     # get pixel size
     pixel_size = __pixel_size__(world_size, tile_size, zoom)
 
-    # get all quadrant
-    quadrants = __make_quadrants__(src_bbox, zoom, world_size, 1)
+    # make transform with orig (left, top) and scale (psize, -psize)
+    dst_transform = A.translation(left, top) * A.scale(pixel_size, -pixel_size)
 
-    for xmin, ymin, xmax, ymax in quadrants:
+    # init dst bands, pixels out of source & bands missing in source are nodata
+    shape     = (count, (ymax - ymin + 1) * tile_size, (xmax - xmin + 1) * tile_size)
+    dst_bands = np.full( shape, 0 if nodata is None else nodata, dtype=dtype )
 
-        # get bbox of quadrant
-        Xmin, Ymin, Xmax, Ymax = list( __tile_world_bbox__(xmin, ymin, zoom, world_size, tile_size) )
+    # nothing to reproject out of source
+    if src_bands is None:
+        return dst_bands
 
-        # get pixel size
-        pixel_size = __pixel_size__(world_size, tile_size, zoom)
+    # bands missing in source stay empty
+    bands  = min( count, src_bands.shape[0] )
+    kwargs = dict() if nodata is None else { 'src_nodata' : nodata }
 
-        # make dst shape (3, tsize, tsize), 3 is fix because it's an image RGB
-        dst_shape     = (3, tile_size, tile_size)
+    with STAGE_TIMER.stage( 'warp' ):
 
-        # make transform with orig (Xmin, Ymin) and scale (psize, -psize)
-        dst_transform = A.translation(Xmin, Ymin) * A.scale(pixel_size, -pixel_size)
+        reproject(
+            source        = src_bands[ :bands ],
+            destination   = dst_bands[ :bands ],
+            src_transform = src_transform,
+            src_crs       = src_dataset.crs,
+            dst_transform = dst_transform,
+            dst_crs       = src_dataset.crs,
+            **kwargs
+        )
 
-        dtype    = src_dataset.dtypes[ 0 ]
+    return dst_bands
 
-        if dtype == rio.uint8:
-            datatype = 1
-        elif dtype == rio.uint16:
-            datatype = 2
-        elif dtype == rio.int16:
-            datatype = 3
-        elif dtype == rio.uint32:
-            datatype = 4
-        elif dtype == rio.int32:
-            datatype = 5
-        elif dtype == rio.float32:
-            datatype = 6
-        elif dtype == rio.float64:
-            datatype = 7
-        else:
-            assert False
+# get bands of a tile of a metatile
+def __tile_of_metatile__(dst_bands : np.ndarray, metatile : tuple(), tile_size : int, x : int, y : int) -> np.ndarray:
 
+    row = (y - metatile[1]) * tile_size
+    col = (x - metatile[0]) * tile_size
 
-        # init dst bands
-        dst_bands     = np.zeros(dst_shape, dtype=dtype)
+    return np.ascontiguousarray( dst_bands[ :, row:row+tile_size, col:col+tile_size ] )
 
-        count  = dst_bands.shape[0]
-        nodata = 0 if src_dataset.nodata is None else src_dataset.nodata
 
-        # make reprojection for each bands
-        for i in range(count):
 
-            try:
+# Tile encoding
+#-----------------------------------------------------------------------------------------------------------------------
 
-                reproject(
-                    source        = src_bands[i],
-                    destination   = dst_bands[i],
-                    src_transform = src_dataset.transform,
-                    src_crs       = src_dataset.crs,
-                    src_nodata    = nodata,
-                    dst_transform = dst_transform,
-                    dst_crs       = src_dataset.crs
-                )
+# style of bands without layer statistics : 8 bits RGB, clipped
+_DEFAULT_STYLE = RasterStyle()
 
-            except IndexError:
-                continue
+# encode raster bands as png
+def __bands_to_png__(bands : np.ndarray, nodata : float, style : RasterStyle = None) -> BytesIO:
 
-        gdal_bands  = [ { 'data' : dst_bands[x], 'nodata_value' : nodata } for x in range(count) ]
+    """ Encode bands (band, row, col) as RGBA png rendered by style (see RasterStyle), alpha is 0 where all are nodata """
 
-        gdal_raster = GDALRaster({
+    with STAGE_TIMER.stage( 'alpha' ):
 
-            'srid'        : WEB_MERCATOR_SRID,
-            'width'       : tile_size,
-            'height'      : tile_size,
-            'datatype'    : datatype,
-            'nr_of_bands' : count,
-            'origin'      : [ Xmin, Ymin ],
-            'scale'       : [ pixel_size, -pixel_size ],
-            'bands'       : gdal_bands
+        # rescale, color & make alpha band for no data
+        p_rgb = Image.fromarray( ( style or _DEFAULT_STYLE ).render(bands, nodata), 'RGBA' )
 
-        })
+    # write in a buffer as bytes
+    buffer = BytesIO()
 
-        tiles.append( (zoom, xmin, ymin, gdal_raster) )
+    with STAGE_TIMER.stage( 'encode' ):
+        p_rgb.save(fp=buffer, format="PNG")
 
-    del src_bands
+    return buffer
 
-    # return structure
-    return tiles
+# merge two png tiles
+def __merge_png__(under : bytes, over : bytes) -> bytes:
 
+    """ Alpha composite over on under (tile shared by two images of a layer) """
 
-def make_rastertiles(src : str, world_size : float, tilesize : int, minZ : int, maxZ : int, push_in_db_fun) -> list():
+    p_under = Image.open( BytesIO( under ) ).convert( 'RGBA' )
+    p_over  = Image.open( BytesIO( over  ) ).convert( 'RGBA' )
 
-    # Open raster dataset
-    src_dataset = rio.open(src, 'r')
+    buffer = BytesIO()
+    Image.alpha_composite(p_under, p_over).save(fp=buffer, format="PNG")
 
-    # Create tiles dictionary with zoom as key
-    tiles = []
+    return buffer.getvalue()
 
-    # for each zoom between minZ and maxZ, create tiles
-    for zoom in range(minZ, maxZ+1):
+# merge two raster tiles
+def __merge_rasters__(under : GDALRaster, over : GDALRaster) -> GDALRaster:
 
-        # get tile for zoom
-        tiles = __make_rastertiles_Z__(src_dataset, world_size, tilesize, zoom)
+    """ Fill nodata pixels of over with pixels of under (tile shared by two images of a layer) """
 
-        # push all tile for zoom in database
-        for _, x, y, buffer in tiles:
-            push_in_db_fun(zoom, x, y, buffer)
+    for under_band, over_band in zip(under.bands, over.bands):
 
-    # return ret structure
-    return tiles
+        nodata = over_band.nodata_value
 
+        if nodata is None:
+            continue
 
+        # replace nodata pixels
+        data       = over_band.data()
+        mask       = data == nodata
+        data[mask] = under_band.data()[mask]
 
-# Image tiles creation
+        over_band.data( data )
+
+    return over
+
+
+
+# Tiles creation
 #-----------------------------------------------------------------------------------------------------------------------
 
-# make imagetiles for a specific zoom
-def __make_imagetiles_Z__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int) -> list():
+# get all work units (zoom, quadrant) between minZ and maxZ
+def __make_units__(src_bbox : list(), world_size : float, minZ : int, maxZ : int, quadrant_size : int) -> list():
+
+    return [ (zoom, quadrant) for zoom in range(minZ, maxZ+1)
+             for quadrant in __make_quadrants__(src_bbox, zoom, world_size, quadrant_size) ]
+
+# make tiles with render_fun for zoom between minZ and maxZ, return number of tiles
+def make_tiles(render_fun, src : str, world_size : float, tilesize : int, minZ : int, maxZ : int, push_in_db_fun,
+               workers : int = None, overview_fun = None, metatile : int = 1, progress : object = None,
+               checkpoint : object = None) -> int:
+
+    """
+    Make tiles of src between minZ and maxZ.
+
+    In 'overview' pyramid mode (when overview_fun is given), only maxZ is rendered from src with render_fun, then each
+    lower zoom is built by overview_fun from the tiles of the zoom above. Else, all zooms are rendered from src.
+    Work units are a multiple of metatile tiles by side, so render_fun never cut a metatile.
+    progress (a TilingProgress) is given all tiles to make, then is updated after each work unit.
+    checkpoint (a TilingCheckpoint) records each written unit, units recorded by a previous run are skipped.
+    """
+
+    # get bounds
+    with rio.open(src, 'r') as src_dataset:
+        src_bbox = src_dataset.bounds
+        src_bbox = [src_bbox.left, src_bbox.top, src_bbox.right, src_bbox.bottom]
+
+    quadrant_size = -( -get_quadrant_size() // metatile ) * metatile
+
+    # plan all tiles
+    if progress is not None:
+        progress.plan( __make_units__(src_bbox, world_size, minZ, maxZ, quadrant_size) )
+
+    # units done by a previous run
+    done = dict() if checkpoint is None else checkpoint.load()
+
+    # record & report a written unit
+    def unit_done(zoom : int, quadrant : tuple(), tiles : int, seconds : dict()) -> None:
+
+        if checkpoint is not None:
+            checkpoint.mark(zoom, quadrant, tiles)
+
+        if progress is not None:
+            progress.update(zoom, tiles, seconds)
+
+    # run units not done yet
+    def run(fun, src : str, units : list()) -> int:
+
+        todo = []
+
+        for unit in units:
+
+            if unit not in done:
+                todo.append( unit )
+
+            # done unit, reported with its tiles
+            elif progress is not None:
+                progress.skip(unit[0], done[ unit ])
+
+        timer = None if progress is None else progress.timer
+
+        return run_units(fun, src, world_size, tilesize, todo, push_in_db_fun, workers, unit_done, timer)
+
+    # all zooms from src
+    if overview_fun is None or get_pyramid_mode() == 'warp':
+        return run(render_fun, src, __make_units__(src_bbox, world_size, minZ, maxZ, quadrant_size))
+
+    # max zoom from src
+    count = run(render_fun, src, __make_units__(src_bbox, world_size, maxZ, maxZ, quadrant_size))
+
+    # then, each zoom from the zoom above (src is not read)
+    for zoom in range(maxZ - 1, minZ - 1, -1):
+        count += run(overview_fun, None, __make_units__(src_bbox, world_size, zoom, zoom, quadrant_size))
+
+    return count
+
+
+
+# Raster tiles creation
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get gdal datatype of a rasterio dtype
+def __gdal_datatype__(dtype : str) -> int:
+
+    if dtype == rio.uint8:
+        return 1
+    elif dtype == rio.uint16:
+        return 2
+    elif dtype == rio.int16:
+        return 3
+    elif dtype == rio.uint32:
+        return 4
+    elif dtype == rio.int32:
+        return 5
+    elif dtype == rio.float32:
+        return 6
+    elif dtype == rio.float64:
+        return 7
+    else:
+        assert False
+
+# make one raster tile
+def __make_rastertile__(src_dataset : rio.DatasetReader, src_bands : np.ndarray, src_transform : A, world_size : float,
+                        tile_size : int, zoom : int, x : int, y : int, style : RasterStyle = None) -> tuple():
+
+    dtype  = src_dataset.dtypes[ 0 ]
+    nodata = 0 if src_dataset.nodata is None else src_dataset.nodata
+
+    # 3 bands, a metatile of one tile
+    dst_bands = __warp_metatile__(src_dataset, src_bands, src_transform, world_size, tile_size, zoom, (x, y, x, y), 3,
+                                  dtype, nodata)
+
+    return __make_rastertile_from_bands__(dst_bands, nodata, __gdal_datatype__( dtype ), world_size, tile_size, zoom,
+                                          x, y, style)
+
+# make one raster tile from its bands
+def __make_rastertile_from_bands__(dst_bands : np.ndarray, nodata : float, datatype : int, world_size : float,
+                                   tile_size : int, zoom : int, x : int, y : int, style : RasterStyle = None) -> tuple():
+
+    # get bbox of tile
+    Xmin, Ymin, Xmax, Ymax = list( __tile_world_bbox__(x, y, zoom, world_size, tile_size) )
+
+    # get pixel size
+    pixel_size  = __pixel_size__(world_size, tile_size, zoom)
+
+    count       = dst_bands.shape[0]
+    gdal_bands  = [ { 'data' : dst_bands[i], 'nodata_value' : nodata } for i in range(count) ]
+
+    gdal_raster = GDALRaster({
+
+        'srid'        : WEB_MERCATOR_SRID,
+        'width'       : tile_size,
+        'height'      : tile_size,
+        'datatype'    : datatype,
+        'nr_of_bands' : count,
+        'origin'      : [ Xmin, Ymin ],
+        'scale'       : [ pixel_size, -pixel_size ],
+        'bands'       : gdal_bands
+
+    })
+
+    # encode once for serving
+    image       = __bands_to_png__(dst_bands, nodata, style)
+
+    return zoom, x, y, gdal_raster, image
+
+# make one raster tile from its four children
+def __make_rastertile_O__(pull_from_db_fun, kernel : str, world_size : float, tile_size : int, zoom : int, x : int,
+                          y : int, style : RasterStyle = None) -> tuple():
+
+    # get children rasters
+    with STAGE_TIMER.stage( 'read' ):
+        rasters = [ pull_from_db_fun(*child) for child in get_children(zoom, x, y) ]
+
+    # no data under tile
+    if all( raster is None for raster in rasters ):
+        return None
+
+    # get nodata & datatype from an existing child
+    first    = next( raster for raster in rasters if raster is not None )
+    nodata   = first.bands[0].nodata_value
+    nodata   = 0 if nodata is None else nodata
+    datatype = first.bands[0].datatype()
+
+    # get children bands
+    children = [ None if raster is None else np.array( [ band.data() for band in raster.bands ] ) for raster in rasters ]
+
+    # mosaic & downsample
+    with STAGE_TIMER.stage( 'warp' ):
+        data, valid      = mosaic(children, fill=nodata)
+        dst_bands, valid = downsample(data, valid, kernel)
+        dst_bands[ :, ~valid ] = nodata
+
+    return __make_rastertile_from_bands__(dst_bands, nodata, datatype, world_size, tile_size, zoom, x, y, style)
+
+# make raster tiles of a quadrant (work unit)
+def __make_rastertiles_Q__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int,
+                           quadrant : tuple(), metatile : int = 1, style : RasterStyle = None) -> list():
+
+    # read source window once for all tiles of quadrant
+    src_bands, src_transform = __read_window__(src_dataset, world_size, tile_size, zoom, quadrant)
+
+    dtype    = src_dataset.dtypes[ 0 ]
+    datatype = __gdal_datatype__( dtype )
+    nodata   = 0 if src_dataset.nodata is None else src_dataset.nodata
+    tiles    = []
+
+    # warp metatile by metatile, then slice tiles
+    for block in __make_metatiles__(quadrant, metatile):
+
+        dst_bands = __warp_metatile__(src_dataset, src_bands, src_transform, world_size, tile_size, zoom, block, 3,
+                                      dtype, nodata)
+
+        tiles += [ __make_rastertile_from_bands__(__tile_of_metatile__(dst_bands, block, tile_size, x, y), nodata,
+                                                  datatype, world_size, tile_size, zoom, x, y, style)
+                   for x in range(block[0], block[2] + 1) for y in range(block[1], block[3] + 1) ]
+
+    return tiles
+
+# make raster tiles of a quadrant (work unit) from children tiles
+def __make_rastertiles_O__(pull_from_db_fun, kernel : str, src_dataset : rio.DatasetReader, world_size : float,
+                           tile_size : int, zoom : int, quadrant : tuple(), style : RasterStyle = None) -> list():
+
+    xmin, ymin, xmax, ymax = quadrant
+
+    tiles = [ __make_rastertile_O__(pull_from_db_fun, kernel, world_size, tile_size, zoom, x, y, style)
+              for x in range(xmin, xmax + 1) for y in range(ymin, ymax + 1) ]
+
+    return [ tile for tile in tiles if tile is not None ]
+
+# make raster tiles for a specific zoom
+def __make_rastertiles_Z__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int) -> list():
 
     # structure for store tiles
     tiles = []
 
-    # get bounding box
+    # get bounds
     src_bbox = src_dataset.bounds
     src_bbox = [src_bbox.left, src_bbox.top, src_bbox.right, src_bbox.bottom]
 
-    # get pixel size
-    pixel_size = __pixel_size__(world_size, tile_size, zoom)
-
     # get all quadrant
     quadrants = __make_quadrants__(src_bbox, zoom, world_size, 1)
 
-    for xmin, ymin, xmax, ymax in quadrants:
+    for quadrant in quadrants:
+        tiles += __make_rastertiles_Q__(src_dataset, world_size, tile_size, zoom, quadrant)
+
+    # return structure
+    return tiles
+
+# make raster tiles for zoom between minZ and maxZ, return number of tiles
+def make_rastertiles(src : str, world_size : float, tilesize : int, minZ : int, maxZ : int, push_in_db_fun,
+                     workers : int = None, pull_from_db_fun = None, kernel : str = None, metatile : int = None,
+                     progress : object = None, checkpoint : object = None, style : RasterStyle = None) -> int:
 
-        # get bbox of quadrant
-        Xmin, Ymin, Xmax, Ymax = list( __tile_world_bbox__(xmin, ymin, zoom, world_size, tile_size) )
+    # lower zooms from children (pull_from_db_fun give GDALRaster of a tile)
+    overview_fun = None
+
+    if pull_from_db_fun is not None:
+        overview_fun = partial(__make_rastertiles_O__, pull_from_db_fun, get_kernel(kernel), style=style)
+
+    # warp metatile x metatile tiles at once, png are rendered by style (see RasterStyle)
+    metatile   = get_metatile( metatile )
+    render_fun = partial(__make_rastertiles_Q__, metatile=metatile, style=style)
+
+    args = [src, world_size, tilesize, minZ, maxZ, push_in_db_fun, workers, overview_fun, metatile, progress, checkpoint]
+
+    return make_tiles(render_fun, *args)
+
+
+
+# Image tiles creation
+#-----------------------------------------------------------------------------------------------------------------------
 
-        # get pixel size
-        pixel_size = __pixel_size__(world_size, tile_size, zoom)
+# make one image tile
+def __make_imagetile__(src_dataset : rio.DatasetReader, src_bands : np.ndarray, src_transform : A, world_size : float,
+                       tile_size : int, zoom : int, x : int, y : int) -> tuple():
 
-        # make dst shape (3, tsize, tsize), 3 is fix because it's an image RGB
-        dst_shape     = (3, tile_size, tile_size)
+    # RGB, a metatile of one tile
+    dst_bands = __warp_metatile__(src_dataset, src_bands, src_transform, world_size, tile_size, zoom, (x, y, x, y), 3,
+                                  np.uint8)
 
-        # make transform with orig (Xmin, Ymin) and scale (psize, -psize)
-        dst_transform = A.translation(Xmin, Ymin) * A.scale(pixel_size, -pixel_size)
+    return __make_imagetile_from_bands__(dst_bands, zoom, x, y)
 
-        # init dst bands
-        dst_bands     = np.zeros(dst_shape, dtype=np.uint8)
+# make one image tile from its RGB bands
+def __make_imagetile_from_bands__(dst_bands : np.ndarray, zoom : int, x : int, y : int) -> tuple():
 
-        # make reprojection for each bands
-        for i in range(3):
+    tile_size = dst_bands.shape[ 1 ]
 
-            reproject(
-                source        = src_dataset.read(i+1),
-                destination   = dst_bands[i],
-                src_transform = src_dataset.transform,
-                src_crs       = src_dataset.crs,
-                dst_transform = dst_transform,
-                dst_crs       = src_dataset.crs
-            )
+    with STAGE_TIMER.stage( 'alpha' ):
 
         # switch channel fst to channel last
         dst_bands = np.rollaxis(dst_bands, 0, 3)
@@ -256,38 +535,116 @@ def __make_imagetiles_Z__(src_dataset : rio.DatasetReader, world_size : float, t
         pil_tile = Image.fromarray( dst_bands )
         pil_tile.putalpha( pil_alpha )
 
-        # write in a buffer as bytes
-        buffer = BytesIO()
+    # write in a buffer as bytes
+    buffer = BytesIO()
+
+    with STAGE_TIMER.stage( 'encode' ):
         pil_tile.save(fp=buffer, format="PNG")
 
-        # push all in ret structure
-        tiles.append( (zoom, xmin, ymin, buffer) )
+    return zoom, x, y, buffer
+
+# make one image tile from its four children
+def __make_imagetile_O__(pull_from_db_fun, kernel : str, zoom : int, x : int, y : int) -> tuple():
+
+    # get children images
+    with STAGE_TIMER.stage( 'read' ):
+        images = [ pull_from_db_fun(*child) for child in get_children(zoom, x, y) ]
+
+    # no data under tile
+    if all( image is None for image in images ):
+        return None
+
+    # decode children as RGBA bands
+    with STAGE_TIMER.stage( 'read' ):
+        children = [ None if image is None else np.rollaxis( np.array( Image.open( BytesIO(image) ).convert('RGBA') ),
+                                                             2, 0 ) for image in images ]
+
+    # mosaic & downsample, alpha give valid pixels
+    with STAGE_TIMER.stage( 'warp' ):
+        data, valid      = mosaic(children, fill=0)
+        dst_bands, valid = downsample(data, data[3] > 0, kernel)
+        dst_bands[ :, ~valid ] = 0
+
+    # convert dst_bands as pilimage
+    pil_tile = Image.fromarray( np.rollaxis(dst_bands, 0, 3), 'RGBA' )
+
+    # write in a buffer as bytes
+    buffer = BytesIO()
+
+    with STAGE_TIMER.stage( 'encode' ):
+        pil_tile.save(fp=buffer, format="PNG")
+
+    return zoom, x, y, buffer
+
+# make image tiles of a quadrant (work unit)
+def __make_imagetiles_Q__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int,
+                          quadrant : tuple(), metatile : int = 1) -> list():
+
+    # read source window once for all tiles of quadrant
+    src_bands, src_transform = __read_window__(src_dataset, world_size, tile_size, zoom, quadrant)
+
+    tiles = []
+
+    # warp metatile by metatile, then slice tiles
+    for block in __make_metatiles__(quadrant, metatile):
+
+        dst_bands = __warp_metatile__(src_dataset, src_bands, src_transform, world_size, tile_size, zoom, block, 3,
+                                      np.uint8)
+
+        tiles += [ __make_imagetile_from_bands__(__tile_of_metatile__(dst_bands, block, tile_size, x, y), zoom, x, y)
+                   for x in range(block[0], block[2] + 1) for y in range(block[1], block[3] + 1) ]
 
-    # return structure
     return tiles
 
-# make image tiles for zoom between minZ and maxZ
-def make_imagetiles(src : str, world_size : float, tilesize : int, minZ : int, maxZ : int, push_in_db_fun) -> list():
+# make image tiles of a quadrant (work unit) from children tiles
+def __make_imagetiles_O__(pull_from_db_fun, kernel : str, src_dataset : rio.DatasetReader, world_size : float,
+                          tile_size : int, zoom : int, quadrant : tuple()) -> list():
+
+    xmin, ymin, xmax, ymax = quadrant
+
+    tiles = [ __make_imagetile_O__(pull_from_db_fun, kernel, zoom, x, y)
+              for x in range(xmin, xmax + 1) for y in range(ymin, ymax + 1) ]
 
-    # Open raster dataset
-    src_dataset = rio.open(src, 'r')
+    return [ tile for tile in tiles if tile is not None ]
 
-    # Create tiles dictionary with zoom as key
+# make imagetiles for a specific zoom
+def __make_imagetiles_Z__(src_dataset : rio.DatasetReader, world_size : float, tile_size : int, zoom : int) -> list():
+
+    # structure for store tiles
     tiles = []
 
-    # for each zoom between minZ and maxZ, create tiles
-    for zoom in range(minZ, maxZ+1):
+    # get bounding box
+    src_bbox = src_dataset.bounds
+    src_bbox = [src_bbox.left, src_bbox.top, src_bbox.right, src_bbox.bottom]
 
-        # get tile for zoom
-        tiles = __make_imagetiles_Z__(src_dataset, world_size, tilesize, zoom)
+    # get all quadrant
+    quadrants = __make_quadrants__(src_bbox, zoom, world_size, 1)
 
-        # push all tile for zoom in database
-        for _, x, y, buffer in tiles:
-            push_in_db_fun(zoom, x, y, buffer)
+    for quadrant in quadrants:
+        tiles += __make_imagetiles_Q__(src_dataset, world_size, tile_size, zoom, quadrant)
 
-    # return ret structure
+    # return structure
     return tiles
 
+# make image tiles for zoom between minZ and maxZ, return number of tiles
+def make_imagetiles(src : str, world_size : float, tilesize : int, minZ : int, maxZ : int, push_in_db_fun,
+                    workers : int = None, pull_from_db_fun = None, kernel : str = None, metatile : int = None,
+                    progress : object = None, checkpoint : object = None) -> int:
+
+    # lower zooms from children (pull_from_db_fun give png bytes of a tile)
+    overview_fun = None
+
+    if pull_from_db_fun is not None:
+        overview_fun = partial(__make_imagetiles_O__, pull_from_db_fun, get_kernel(kernel))
+
+    # warp metatile x metatile tiles at once
+    metatile   = get_metatile( metatile )
+    render_fun = partial(__make_imagetiles_Q__, metatile=metatile)
+
+    args = [src, world_size, tilesize, minZ, maxZ, push_in_db_fun, workers, overview_fun, metatile, progress, checkpoint]
+
+    return make_tiles(render_fun, *args)
+
 
 
 # Get images extent
@@ -1,26 +1,150 @@
 # Library
 #-----------------------------------------------------------------------------------------------------------------------
 
-from django.http             import HttpResponse
+from django.http             import HttpResponse, JsonResponse
 from django.views.generic    import View
-from .models                 import RasterLayer, ImageLayer, ImageTile
+from django.utils.cache      import get_conditional_response
+from django.utils.http       import http_date
+from django.conf             import settings
+from tmsapp.utils.coverage   import get_blank_tile
+from tmsapp.utils.lazy       import is_lazy, get_eager_tile
+from .models                 import RasterLayer, RasterTile, ImageLayer, ImageTile, VectorLayer, VectorGeometry
 from django.db.models        import Max
-from tmsapp.utils            import __tile_world_bbox__
+from tmsapp.utils.cache      import IMAGE_TILE_CACHE, RASTER_TILE_CACHE, MISSING
+from tmsapp.utils.flight     import IMAGE_TILE_FLIGHT, RASTER_TILE_FLIGHT
+from tmsapp.utils.encoding   import TILE_FORMATS, get_format
+from tmsapp.utils.style      import STRETCHES, get_colormaps
+from tmsapp.utils.identify   import get_bbox_zoom, get_identify_srid, get_identify_bins, identify_point, zonal_stats
+from django.contrib.gis.geos import Point, Polygon, GEOSException
+from django.contrib.gis.gdal import GDALException
+from functools               import partial
+from django.db               import close_old_connections
+from concurrent.futures      import ThreadPoolExecutor
 from .constant               import *
-from django.db               import connection
+import asyncio
 
 
 
 # Structure
 #-----------------------------------------------------------------------------------------------------------------------
 
-# dictionary who contains tiles
-_IMAGE_TILE  = dict()
-_RASTER_TILE = dict()
+# caches who contains tiles payload (None for missing tiles)
+_IMAGE_TILE  = IMAGE_TILE_CACHE
+_RASTER_TILE = RASTER_TILE_CACHE
 
-# function who create key for dictionary
-def __make_key__(layer : str, zoom : int, x : int, y : int) -> str:
-    return 'key::%s:%d:%d:%d' % (layer, zoom, x, y)
+# function who create key for dictionary, each format of a tile is cached once encoded. The key holds the layer version
+# (update timestamp) : a layer rebuilt by the tiling worker is never served from the cache of another process
+def __make_key__(layer : str, version : int, zoom : int, x : int, y : int, frmt : str) -> str:
+    return 'key::%s:%d:%d:%d:%d:%s' % (layer, version, zoom, x, y, frmt)
+
+# function who load a tile missing in cache, concurrent misses of a key wait on one load & share its payload
+def __load_tile__(flight : object, cache : object, loader, layer : str, key : str, info : tuple(), zoom : int, x : int,
+                  y : int, frmt : str) -> bytes:
+
+    def load():
+
+        # cached by a previous leader while waiting the lock between processes
+        payload = cache.get( key )
+
+        if payload is MISSING:
+            payload = loader(info, zoom, x, y, frmt)
+            cache.set( layer, key, payload )
+
+        return payload
+
+    return flight.do( key, load )
+
+
+
+# Missing tiles
+#-----------------------------------------------------------------------------------------------------------------------
+
+# function who create response of a missing tile : shared transparent tile or 204
+def __blank_response__(frmt : str) -> object:
+
+    if getattr(settings, 'TMS_TILE_MISS_RESPONSE', TILE_MISS_RESPONSE) == 'empty':
+        return HttpResponse(status=204)
+
+    response = HttpResponse(content_type=TILE_FORMATS[ frmt ])
+    response.write( get_blank_tile( frmt=frmt ) )
+
+    return response
+
+# function who create response of a format not served
+def __unknown_format_response__(frmt : str) -> object:
+
+    return HttpResponse('unknown tile format "%s", use one of %s' % (frmt, ', '.join( TILE_FORMATS )), status=404,
+                        content_type='text/plain')
+
+# function who create response of a style not served
+def __unknown_style_response__(stretch : str, colormap : str) -> object:
+
+    params = (stretch, colormap, ', '.join( STRETCHES ), ', '.join( get_colormaps() ))
+
+    return HttpResponse('unknown style (stretch "%s", colormap "%s"), stretch in %s, colormap in %s' % params,
+                        status=400, content_type='text/plain')
+
+# function who test if a tile is out of layer coverage (known without database access), a tile of a lazy zoom is
+# covered when its tile at eager max zoom is
+def __is_uncovered__(coverage : object, info : tuple(), zoom : int, x : int, y : int) -> bool:
+
+    if coverage is None:
+        return False
+
+    if is_lazy(zoom, info[4], info[5]):
+        zoom, x, y = get_eager_tile(zoom, x, y, info[4])
+
+    return (zoom, x, y) not in coverage
+
+
+
+# HTTP cache
+#-----------------------------------------------------------------------------------------------------------------------
+
+# function who create validators of a tile, info is (layer id, update timestamp, max age, ...)
+def __make_validators__(info : tuple(), zoom : int, x : int, y : int, frmt : str) -> (str, int):
+
+    layer_id, updated = info[0], info[1]
+
+    # strong etag, change with layer build
+    etag = '"%d-%d-%d-%d-%d-%s"' % (layer_id, updated, zoom, x, y, frmt)
+
+    return etag, updated
+
+# function who answer a conditional request (304) before loading the tile, None if the tile must be sent
+def __not_modified__(request : object, info : tuple(), zoom : int, x : int, y : int, frmt : str) -> object:
+
+    if info is None:
+        return None
+
+    etag, last_modified = __make_validators__(info, zoom, x, y, frmt)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+    return None if response is None else __set_validators__(response, info, zoom, x, y, frmt)
+
+# function who set validators & cache control on a tile response
+def __set_validators__(response : object, info : tuple(), zoom : int, x : int, y : int, frmt : str) -> object:
+
+    if info is None:
+        return response
+
+    etag, last_modified = __make_validators__(info, zoom, x, y, frmt)
+
+    response[ 'ETag'          ] = etag
+    response[ 'Last-Modified' ] = http_date( last_modified )
+    response[ 'Cache-Control' ] = 'public, max-age=%d' % info[2]
+
+    return response
+
+# function who set cache control on a blank tile response, without validators (the tile may exist later)
+def __set_blank_validators__(response : object, info : tuple()) -> object:
+
+    max_age = min( info[2], getattr(settings, 'TMS_TILE_BLANK_MAX_AGE', TILE_BLANK_MAX_AGE) )
+
+    response[ 'Cache-Control' ] = 'public, max-age=%d' % max_age
+
+    return response
 
 
 
@@ -30,36 +154,64 @@ def __make_key__(layer : str, zoom : int, x : int, y : int) -> str:
 class RasterTMSView(View):
 
     @staticmethod
-    def __tile_response__(zoom : int, x : int, y : int, layer : str, frmt : str) -> object:
+    def __tile_response__(request : object, zoom : int, x : int, y : int, layer : str, frmt : str) -> object:
 
-        # get raster layer
-        rasterlayer = RasterLayer.objects.filter(rasterlayer_name=layer).first()
+        # get format of extension ('jpeg' is 'jpg')
+        frmt = get_format( frmt ) or frmt
 
-        # make key
-        key = __make_key__(layer, zoom, x, y)
+        if frmt not in TILE_FORMATS:
+            return __unknown_format_response__( frmt )
 
-        if key in _RASTER_TILE.keys():
-            rastertile = _RASTER_TILE[ key ]
+        # get style of request (rendered from rasters of tiles), None for the one of layer, colormap '' is none
+        stretch  = request.GET.get( 'stretch' ) or None
+        colormap = request.GET.get( 'colormap' )
 
-        else:
-            rastertile = rasterlayer.get_tile(zoom, x, y)
-            _RASTER_TILE[ key ] = rastertile
+        if stretch not in ( None, ) + STRETCHES or colormap not in ( None, '' ) and colormap not in get_colormaps():
+            return __unknown_style_response__(stretch, colormap)
 
+        # format & style of tile, in validators & cache key
+        variant  = frmt if stretch is None and colormap is None else '%s:%s:%s' % (frmt, stretch, colormap)
 
-        # test if image tile exist
-        if rastertile is None:
-            return HttpResponse(content_type="image/%s" % frmt)
+        # get raster layer (id, update, max age, storage, eager max zoom, max zoom, formats encoded at tiling, quality,
+        # min zoom, number of bands)
+        info = RasterLayer.get_info( layer )
 
-        # if exist
-        else:
-            print(rastertile)
-
-            buffer        = rastertile.to_png()
-            response      = HttpResponse(content_type="image/%s" % frmt)
-            response.write( buffer.getvalue() )
+        # answer conditional request before loading tile
+        response = __not_modified__(request, info, zoom, x, y, variant)
 
+        if response is not None:
             return response
 
+        # unknown layer
+        if info is None:
+            return __blank_response__( frmt )
+
+        # answer tiles out of layer coverage from memory
+        if __is_uncovered__(RasterLayer.get_coverage( info ), info, zoom, x, y):
+            return __set_blank_validators__(__blank_response__( frmt ), info)
+
+        # make key
+        key = __make_key__(layer, info[1], zoom, x, y, variant)
+
+        # get payload from cache
+        payload = _RASTER_TILE.get( key )
+
+        if payload is MISSING:
+
+            # get png from storage backend of layer (or render it in style), encoded in format, then cache it
+            loader  = partial(RasterLayer.get_image, stretch=stretch, colormap=colormap)
+            params  = (layer, key, info, zoom, x, y, frmt)
+            payload = __load_tile__(RASTER_TILE_FLIGHT, _RASTER_TILE, loader, *params)
+
+        # test if raster tile exist
+        if payload is None:
+            return __set_blank_validators__(__blank_response__( frmt ), info)
+
+        response = HttpResponse(content_type=TILE_FORMATS[ frmt ])
+        response.write( payload )
+
+        return __set_validators__(response, info, zoom, x, y, variant)
+
     def get(self, request, *_args, **kwargs):
 
         # Get kwargs
@@ -72,7 +224,7 @@ class RasterTMSView(View):
         layer   = request.GET['layer']
 
         # Get image tile
-        return RasterTMSView.__tile_response__(Z, X, Y, layer, frmt)
+        return RasterTMSView.__tile_response__(request, Z, X, Y, layer, frmt)
 
 
 # Image Tile Map Service View
@@ -81,30 +233,51 @@ class RasterTMSView(View):
 class ImageTMSView(View):
 
     @staticmethod
-    def __tile_response__(zoom: int, x: int, y: int, layer: str, frmt : str) -> object:
+    def __tile_response__(request : object, zoom : int, x : int, y : int, layer : str, frmt : str) -> object:
 
-        # get image layer
-        imagelayer = ImageLayer.objects.filter(imagelayer_name=layer).first()
+        # get format of extension ('jpeg' is 'jpg')
+        frmt = get_format( frmt ) or frmt
+
+        if frmt not in TILE_FORMATS:
+            return __unknown_format_response__( frmt )
+
+        # get image layer (id, update, max age, storage, eager max zoom, max zoom, formats encoded at tiling, quality)
+        info = ImageLayer.get_info( layer )
+
+        # answer conditional request before loading tile
+        response = __not_modified__(request, info, zoom, x, y, frmt)
+
+        if response is not None:
+            return response
+
+        # unknown layer
+        if info is None:
+            return __blank_response__( frmt )
+
+        # answer tiles out of layer coverage from memory
+        if __is_uncovered__(ImageLayer.get_coverage( info ), info, zoom, x, y):
+            return __set_blank_validators__(__blank_response__( frmt ), info)
 
         # make key
-        key = __make_key__(layer, zoom, x, y)
+        key = __make_key__(layer, info[1], zoom, x, y, frmt)
 
-        if key in _IMAGE_TILE.keys():
-            imagetile  = _IMAGE_TILE[ key ]
+        # get payload from cache
+        payload = _IMAGE_TILE.get( key )
 
-        else:
-            imagetile  = imagelayer.get_tile(zoom, x, y)
-            _IMAGE_TILE[ key ] = imagetile
+        if payload is MISSING:
+
+            # get image from storage backend of layer, encoded in format, then cache it
+            params  = (layer, key, info, zoom, x, y, frmt)
+            payload = __load_tile__(IMAGE_TILE_FLIGHT, _IMAGE_TILE, ImageLayer.get_image, *params)
 
         # test if image tile exist
-        if imagetile is None:
-            return HttpResponse(content_type="image/%s" % frmt)
+        if payload is None:
+            return __set_blank_validators__(__blank_response__( frmt ), info)
 
-        # if exist
-        else:
-            response = HttpResponse(content_type="image/%s" % frmt)
-            response.write( imagetile.image.tobytes() )
-            return response
+        response = HttpResponse(content_type=TILE_FORMATS[ frmt ])
+        response.write( payload )
+
+        return __set_validators__(response, info, zoom, x, y, frmt)
 
     @staticmethod
     def __max_zoom__(layer : str) -> int:
@@ -129,7 +302,7 @@ class ImageTMSView(View):
         layer   = request.GET['layer']
 
         # Get image tile
-        return ImageTMSView.__tile_response__(Z, X, Y, layer, frmt)
+        return ImageTMSView.__tile_response__(request, Z, X, Y, layer, frmt)
 
 
 
@@ -138,6 +311,26 @@ class ImageTMSView(View):
 
 class VectorTMSView(View):
 
+    @staticmethod
+    def __tile_response__(request : object, zoom : int, x : int, y : int, layer : str, frmt : str) -> object:
+
+        # get vector layer (id, update, max age)
+        info = VectorLayer.get_info( layer )
+
+        # answer conditional request before building tile
+        response = __not_modified__(request, info, zoom, x, y, frmt)
+
+        if response is not None:
+            return response
+
+        # get aggregated tile of layer, clipped on tile envelope
+        payload = b'' if info is None else VectorGeometry.get_mvt(info[0], layer, zoom, x, y)
+
+        response = HttpResponse(content_type=MVT_CONTENT_TYPE)
+        response.write( payload )
+
+        return __set_validators__(response, info, zoom, x, y, frmt)
+
     def get(self, request, *args, **kwargs):
 
         # Get kwargs
@@ -149,22 +342,187 @@ class VectorTMSView(View):
         # Get arguments
         layer = request.GET['layer']
 
-        print( X, Y, Z )
+        # Get vector tile
+        return VectorTMSView.__tile_response__(request, Z, X, Y, layer, frmt)
+
+
+
+# Raster Identify & Statistics View
+#-----------------------------------------------------------------------------------------------------------------------
+
+class RasterIdentifyView(View):
+
+    """
+    Values of bands at a point (mode 'point' : x, y) or statistics of bands in a bbox (mode 'bbox' : bbox as
+    xmin,ymin,xmax,ymax) of a raster layer as JSON, coordinates are in srid (settings.TMS_IDENTIFY_SRID when not given).
+    Values are read from the tiles of zoom : max zoom of layer for a point, highest zoom where the bbox is covered by
+    at most settings.TMS_IDENTIFY_MAX_TILES tiles for a bbox.
+    """
+
+    @staticmethod
+    def __error_response__(layer : str, error : str, status : int = 400) -> object:
+        return JsonResponse({ 'layer' : layer, 'error' : error }, status=status)
+
+    @staticmethod
+    def __to_mercator__(geom : object) -> object:
+
+        """ Transform geometry to WEB_MERCATOR_SRID, clipped to the world """
+
+        geom.transform( WEB_MERCATOR_SRID )
 
-        xmin, ymin, xmax, ymax = __tile_world_bbox__(X, Y, Z, WEB_MERCATOR_WORLD_SIZE, WEB_MERCATOR_TILE_SIZE)
+        half = WEB_MERCATOR_WORLD_SIZE / 2.
 
-        cursor = connection.cursor()
-        query  = "SELECT ST_AsMVTGeom( geom ) FROM tmsapp_vectorgeometry"
+        world      = Polygon.from_bbox( (-half, -half, half, half) )
+        world.srid = WEB_MERCATOR_SRID
 
-        cursor.execute( query )
-        binary = cursor.fetchall()
+        return geom.intersection( world )
 
-        if len( binary ) == 0:
-            return HttpResponse(content_type="image/%s" % frmt)
+    def get(self, request, *_args, **kwargs):
+
+        # Get arguments
+        mode  = kwargs.get( 'mode' )
+        layer = request.GET.get( 'layer' )
+
+        if not layer:
+            return RasterIdentifyView.__error_response__(layer, 'bad parameters (layer is required)')
+
+        # get raster layer (id, update, max age, storage, eager max zoom, max zoom, formats encoded at tiling, quality,
+        # min zoom, number of bands)
+        info = RasterLayer.get_info( layer )
+
+        if info is None:
+            return RasterIdentifyView.__error_response__(layer, 'unknown layer', status=404)
+
+        try:
+            srid = int( request.GET.get( 'srid', get_identify_srid() ) )
+            zoom = request.GET.get( 'zoom' )
+            zoom = None if zoom is None else int( zoom )
+            bins = request.GET.get( 'bins' )
+            bins = get_identify_bins( None if bins is None else int( bins ) )
+
+            if mode == 'point':
+                geom = Point( float( request.GET['x'] ), float( request.GET['y'] ), srid=srid )
+            else:
+                geom = Polygon.from_bbox( [ float( v ) for v in request.GET['bbox'].split(',') ] )
+                geom.srid = srid
+
+            geom = RasterIdentifyView.__to_mercator__( geom )
+
+        except ( KeyError, ValueError, TypeError, GEOSException, GDALException ) as error:
+            return RasterIdentifyView.__error_response__(layer, 'bad parameters (%s)' % error)
+
+        if geom.empty:
+            return RasterIdentifyView.__error_response__(layer, 'out of the world')
+
+        if zoom is not None and not info[8] <= zoom <= info[5]:
+            return RasterIdentifyView.__error_response__(layer, 'zoom must be between %d & %d' % (info[8], info[5]))
+
+        # decoded tiles of layer, cached
+        load = partial(RasterLayer.get_array, info, layer)
+
+        if mode == 'point':
+            zoom   = info[5] if zoom is None else zoom
+            report = identify_point(load, geom.coords, zoom, WEB_MERCATOR_WORLD_SIZE)
 
         else:
+            xmin, ymin, xmax, ymax = geom.extent
+
+            # bbox as (left, top, right, bottom)
+            bbox = ( xmin, ymax, xmax, ymin )
+            minz = info[8] if zoom is None else zoom
+            maxz = info[5] if zoom is None else zoom
+            zoom = get_bbox_zoom(bbox, minz, maxz, WEB_MERCATOR_WORLD_SIZE)
+
+            if zoom is None:
+                return RasterIdentifyView.__error_response__(layer, 'bbox is too large at zoom %d' % minz)
+
+            report = zonal_stats(load, bbox, zoom, WEB_MERCATOR_WORLD_SIZE, bins)
+
+        return JsonResponse({ 'layer' : layer, mode : report })
+
+
+
+# Tiling Progress View
+#-----------------------------------------------------------------------------------------------------------------------
+
+class ProgressView(View):
+
+    """ Progress of the last tiling job of a layer as JSON (see TilingProgress.report) """
+
+    # layer model, name & progress fields by kind
+    models = {
+        'raster' : ( RasterLayer, 'rasterlayer_name', 'rasterlayer_progress' ),
+        'image'  : ( ImageLayer,  'imagelayer_name',  'imagelayer_progress'  )
+    }
+
+    def get(self, request, *_args, **kwargs):
+
+        # Get arguments
+        model, name, field = ProgressView.models[ kwargs.get( 'kind' ) ]
+        layer              = request.GET.get( 'layer' )
+
+        if not layer:
+            return JsonResponse({ 'layer' : layer, 'error' : 'bad parameters (layer is required)' }, status=400)
+
+        # Get layer, without its tiling fields
+        obj = model.objects.filter( **{ name : layer } ).only( field ).first()
+
+        if obj is None:
+            return JsonResponse({ 'layer' : layer, 'error' : 'unknown layer' }, status=404)
+
+        return JsonResponse({ 'layer' : layer, 'progress' : obj.get_progress() })
+
+
+
+# Async Tile Map Service Views (ASGI, Django >= 3.1)
+#-----------------------------------------------------------------------------------------------------------------------
+
+# thread pool of the process, created on first request
+_EXECUTOR = dict()
+
+# function who get the bounded thread pool loading tiles
+def __get_executor__() -> ThreadPoolExecutor:
+
+    if 'executor' not in _EXECUTOR:
+        threads = getattr(settings, 'TMS_ASYNC_THREADS', ASYNC_THREADS)
+        _EXECUTOR.setdefault( 'executor', ThreadPoolExecutor(max_workers=threads, thread_name_prefix='tms-tile') )
+
+    return _EXECUTOR[ 'executor' ]
+
+# function who run a tile response in a thread of the pool, with its own database connection
+def __run_in_thread__(fun, *args : tuple()) -> object:
+
+    def run():
+
+        # drop connection broken or older than CONN_MAX_AGE, like a sync request does
+        close_old_connections()
+
+        return fun( *args )
+
+    return run
+
+# function who await a tile response, the event loop stays free while the tile is loaded
+async def __async_tile_response__(fun, request : object, z : int, x : int, y : int, frmt : str) -> object:
+
+    layer = request.GET['layer']
+
+    return await asyncio.get_running_loop().run_in_executor(__get_executor__(),
+                                                            __run_in_thread__(fun, request, z, x, y, layer, frmt))
+
+async def async_raster_tms_view(request : object, z : int, x : int, y : int, frmt : str) -> object:
+
+    """ Async RasterTMSView """
+
+    return await __async_tile_response__(RasterTMSView.__tile_response__, request, z, x, y, frmt)
+
+async def async_image_tms_view(request : object, z : int, x : int, y : int, frmt : str) -> object:
+
+    """ Async ImageTMSView """
+
+    return await __async_tile_response__(ImageTMSView.__tile_response__, request, z, x, y, frmt)
+
+async def async_vector_tms_view(request : object, z : int, x : int, y : int, frmt : str) -> object:
 
-            response = HttpResponse(content_type="image/%s" % frmt)
-            response.write( binary[0][0].tobytes() )
+    """ Async VectorTMSView """
 
-        return response
\ No newline at end of file
+    return await __async_tile_response__(VectorTMSView.__tile_response__, request, z, x, y, frmt)
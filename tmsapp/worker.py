@@ -0,0 +1,203 @@
+# Library
+#-----------------------------------------------------------------------------------------------------------------------
+
+from   django.conf     import settings
+from   django.db       import connections
+from   tmsapp.constant import *
+from   tmsapp.models   import TilingJob
+import multiprocessing as     mp
+import traceback
+import socket
+import signal
+import time
+import os
+
+
+
+# Settings
+#-----------------------------------------------------------------------------------------------------------------------
+
+# get number of jobs run at once
+def get_job_concurrency(concurrency : int = None) -> int:
+
+    """ Get number of jobs run at once by a worker (argument, then settings.TMS_TILING_JOB_CONCURRENCY) """
+
+    if concurrency is None:
+        concurrency = getattr(settings, 'TMS_TILING_JOB_CONCURRENCY', TILING_JOB_CONCURRENCY)
+
+    return max( 1, concurrency )
+
+# get seconds between two heartbeats
+def get_job_heartbeat() -> float:
+
+    """ Get seconds between two heartbeats of a running job (settings.TMS_TILING_JOB_HEARTBEAT) """
+
+    return getattr(settings, 'TMS_TILING_JOB_HEARTBEAT', TILING_JOB_HEARTBEAT)
+
+# get seconds between two polls
+def get_job_poll() -> float:
+
+    """ Get seconds between two polls of the job table (settings.TMS_TILING_JOB_POLL) """
+
+    return getattr(settings, 'TMS_TILING_JOB_POLL', TILING_JOB_POLL)
+
+
+
+# Job process
+#-----------------------------------------------------------------------------------------------------------------------
+
+# fork keep django setup
+_CONTEXT = mp.get_context( 'fork' )
+
+def __run_job__(job_id : int) -> None:
+
+    """ Tile the layer of a job, in a child process of the worker. Exit code is 0 when tiling is done """
+
+    # own process group, so tiling processes of the job are stopped with it
+    os.setpgrp()
+
+    # handlers of the worker are inherited by fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT,  signal.SIG_DFL)
+
+    try:
+
+        job   = TilingJob.objects.get( pk=job_id )
+        layer = job.get_layer()
+
+        # layer deleted since submit
+        if layer is not None:
+            layer.make_tiles( job.tilingjob_generation )
+
+    except BaseException:
+
+        TilingJob.objects.filter( pk=job_id ).update( tilingjob_error=traceback.format_exc() )
+        raise
+
+    finally:
+        connections.close_all()
+
+def __stop_job__(process : mp.Process) -> None:
+
+    """ Stop a job process & its tiling processes """
+
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+
+    except ProcessLookupError:
+        pass
+
+def __job_error__(job : TilingJob, process : mp.Process) -> str:
+
+    """ Get error of a finished job process, None if the job is done """
+
+    if process.exitcode == 0:
+        return None
+
+    job.refresh_from_db( fields=[ 'tilingjob_error' ] )
+
+    # killed (out of memory, stopped) processes have no traceback
+    if process.exitcode < 0:
+        return 'killed by signal %d' % -process.exitcode
+
+    return job.tilingjob_error or 'exit code %d' % process.exitcode
+
+
+
+# Worker
+#-----------------------------------------------------------------------------------------------------------------------
+
+class TilingWorker(object):
+
+    """
+    Run tiling jobs, each one in a child process (a crash or an out of memory only fails its job), at most concurrency
+    at once. Running jobs beat every heartbeat seconds, cancelled jobs are stopped & failed jobs are queued again.
+    On SIGTERM / SIGINT, running jobs are stopped & queued again for another worker.
+    """
+
+    def __init__(self, concurrency : int = None, name : str = None):
+
+        self.concurrency = get_job_concurrency( concurrency )
+        self.name        = name or '%s:%d' % (socket.gethostname(), os.getpid())
+        self.running     = dict()
+        self.stopping    = False
+        self.beaten      = 0.
+
+    def __stop__(self, *_args) -> None:
+        self.stopping = True
+
+    def __start__(self, job : TilingJob) -> None:
+
+        # children do not share the database connection of the worker
+        connections.close_all()
+
+        process = _CONTEXT.Process( target=__run_job__, args=(job.pk, ) )
+        process.start()
+
+        self.running[ job.pk ] = ( job, process )
+
+    def __check__(self) -> None:
+
+        """ End finished jobs, beat running ones & stop cancelled ones """
+
+        beat = time.time() - self.beaten >= get_job_heartbeat()
+
+        if beat:
+            self.beaten = time.time()
+
+        for job_id, (job, process) in list( self.running.items() ):
+
+            # finished, done or failed
+            if not process.is_alive():
+                process.join()
+                job.finish( __job_error__(job, process) )
+                del self.running[ job_id ]
+
+            # cancelled (or lost & claimed by another worker)
+            elif beat and job.beat():
+                __stop_job__( process )
+
+    def __release__(self) -> None:
+
+        """ Stop running jobs & queue them again """
+
+        for job, process in self.running.values():
+            __stop_job__( process )
+            process.join()
+            job.release()
+
+        self.running.clear()
+
+    def run(self, once : bool = False) -> None:
+
+        """ Claim & run jobs until stopped, or until no job is left when once """
+
+        signal.signal(signal.SIGTERM, self.__stop__)
+        signal.signal(signal.SIGINT,  self.__stop__)
+
+        try:
+
+            while not self.stopping:
+
+                # jobs of dead workers
+                TilingJob.requeue_lost()
+
+                # claim jobs up to concurrency
+                while len( self.running ) < self.concurrency:
+
+                    job = TilingJob.claim( self.name )
+
+                    if job is None:
+                        break
+
+                    self.__start__( job )
+
+                self.__check__()
+
+                if once and len( self.running ) == 0:
+                    break
+
+                time.sleep( min( get_job_poll(), get_job_heartbeat() ) )
+
+        finally:
+            self.__release__()